@@ -0,0 +1,217 @@
+"""
+Сводные таблицы для отчетов по заказам.
+
+Отчеты читают готовые агрегаты вместо полного просмотра orders:
+- report_status_counts - количество заказов по статусам;
+- report_revenue - сумма цен и число заказов по неделе/месяцу создания;
+- report_status_transitions - число переходов между статусами и суммарное
+  время, проведенное в исходном статусе (для среднего времени перехода);
+- report_deadline_buckets - незавершенные заказы по дню срока (просрочка).
+
+Каждый обработчик изменения заказа снимает order_snapshot до изменения и
+вызывает track_order_change до коммита: агрегаты меняются на разницу между
+состояниями в той же транзакции, что и сам заказ.
+
+Если агрегаты разошлись с данными (ручная правка БД, сбой), их можно
+пересчитать из orders и order_edit_history:
+    python analytics.py --rebuild
+Время переходов при пересчете восстанавливается по журналу изменений.
+"""
+import asyncio
+import json
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import (
+    Order, OrderDeadlineBucket, OrderEditHistory, OrderRevenue, OrderStatus, OrderStatusCount,
+    OrderStatusTransition,
+)
+
+REVENUE_PERIODS = ("week", "month")
+
+# Статус, в который переводит заказ действие из журнала (для пересчета переходов)
+ACTION_STATUSES = {
+    "created": OrderStatus.draft,
+    "submitted_for_confirmation": OrderStatus.pending_confirmation,
+    "confirmed": OrderStatus.confirmed,
+    "completed": OrderStatus.ready,
+    "delivered": OrderStatus.delivered,
+}
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # В SQLite даты хранятся без часового пояса (UTC)
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def period_start(period: str, day: date) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def is_open(status) -> bool:
+    return status != OrderStatus.delivered
+
+def order_snapshot(order: Order) -> dict:
+    """Значения заказа, от которых зависят агрегаты."""
+    created_at = naive_utc(order.created_at) or datetime.utcnow()
+    return {
+        "status": OrderStatus(order.status) if order.status else OrderStatus.draft,
+        "price": order.price or 0,
+        "created_at": created_at,
+        "deadline": naive_utc(order.deadline),
+        "status_changed_at": naive_utc(order.status_changed_at) or naive_utc(order.updated_at) or created_at,
+    }
+
+def snapshot_deltas(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Изменения агрегатов при переходе заказа из before в after (None - заказа нет)."""
+    deltas = {"status": {}, "revenue": {}, "deadline": {}}
+
+    def add(kind, key, *values):
+        current = deltas[kind].get(key, (0,) * len(values))
+        deltas[kind][key] = tuple(a + b for a, b in zip(current, values))
+
+    for snapshot, sign in ((before, -1), (after, 1)):
+        if snapshot is None:
+            continue
+        add("status", snapshot["status"].value, sign)
+        for period in REVENUE_PERIODS:
+            add("revenue", (period, period_start(period, snapshot["created_at"].date())), sign * snapshot["price"], sign)
+        if snapshot["deadline"] is not None and is_open(snapshot["status"]):
+            add("deadline", snapshot["deadline"].date(), sign)
+    # Нулевые изменения не пишем
+    return {kind: {key: values for key, values in items.items() if any(values)} for kind, items in deltas.items()}
+
+def bump(table, key: dict, values: dict):
+    statement = sqlite_insert(table).values(**key, **values)
+    return statement.on_conflict_do_update(
+        index_elements=list(key),
+        set_={column: getattr(table, column) + statement.excluded[column] for column in values},
+    )
+
+async def track_order_change(db: AsyncSession, before: Optional[dict], order: Optional[Order], now: Optional[datetime] = None):
+    """Обновляет агрегаты по изменению заказа (order=None - заказ удален). Без коммита."""
+    now = naive_utc(now) or datetime.utcnow()
+    if order is not None:
+        if before is None or OrderStatus(order.status) != before["status"]:
+            order.status_changed_at = now
+    after = order_snapshot(order) if order is not None else None
+
+    if before is not None and after is not None and after["status"] != before["status"]:
+        seconds = max((now - before["status_changed_at"]).total_seconds(), 0.0)
+        await db.execute(bump(
+            OrderStatusTransition,
+            {"from_status": before["status"].value, "to_status": after["status"].value},
+            {"count": 1, "total_seconds": seconds},
+        ))
+
+    deltas = snapshot_deltas(before, after)
+    for status, (count,) in deltas["status"].items():
+        await db.execute(bump(OrderStatusCount, {"status": status}, {"count": count}))
+    for (period, start), (revenue, orders) in deltas["revenue"].items():
+        await db.execute(bump(OrderRevenue, {"period": period, "period_start": start}, {"revenue": revenue, "orders": orders}))
+    for day, (count,) in deltas["deadline"].items():
+        await db.execute(bump(OrderDeadlineBucket, {"day": day}, {"open_count": count}))
+
+def replay_transitions(history_rows) -> dict:
+    """Переходы между статусами по журналу: {(из, в): [количество, секунды]}.
+
+    history_rows - (order_id, action, field_changes, timestamp) в порядке заказа и времени.
+    """
+    transitions = {}
+    current = {}
+    for order_id, action, field_changes, timestamp in history_rows:
+        if action in ("created", "deleted"):
+            # id заказа мог быть использован повторно: журнал начинается заново
+            current.pop(order_id, None)
+        if action == "deleted":
+            continue
+        status = ACTION_STATUSES.get(action)
+        if status is None and field_changes:
+            new_status = (json.loads(field_changes).get("status") or {}).get("new")
+            status = OrderStatus(new_status) if new_status else None
+        if status is None:
+            continue
+        previous = current.get(order_id)
+        if previous is not None and previous[0] != status:
+            entry = transitions.setdefault((previous[0].value, status.value), [0, 0.0])
+            entry[0] += 1
+            entry[1] += max((timestamp - previous[1]).total_seconds(), 0.0)
+        if previous is None or previous[0] != status:
+            current[order_id] = (status, timestamp)
+    return transitions
+
+def rebuild_summaries(conn) -> dict:
+    """Полный пересчет сводных таблиц (синхронное соединение; вызывается из миграции и команды)."""
+    for table in (OrderStatusCount, OrderRevenue, OrderStatusTransition, OrderDeadlineBucket):
+        conn.execute(delete(table))
+    conn.execute(
+        update(Order)
+        .where(Order.status_changed_at.is_(None))
+        # updated_at указан явно, чтобы не сработал onupdate
+        .values(status_changed_at=func.coalesce(Order.updated_at, Order.created_at), updated_at=Order.updated_at)
+    )
+
+    status_counts = conn.execute(select(Order.status, func.count()).group_by(Order.status)).all()
+    if status_counts:
+        conn.execute(insert(OrderStatusCount), [{"status": status.value, "count": count} for status, count in status_counts])
+
+    day = func.date(Order.created_at)
+    # Понедельник недели: шаг на 6 дней назад и вперед до ближайшего понедельника
+    week_start = func.date(Order.created_at, "-6 days", "weekday 1")
+    month_start = func.date(Order.created_at, "start of month")
+    for period, start in (("week", week_start), ("month", month_start)):
+        rows = conn.execute(
+            select(start, func.coalesce(func.sum(Order.price), 0), func.count())
+            .where(day.is_not(None))
+            .group_by(start)
+        ).all()
+        if rows:
+            conn.execute(insert(OrderRevenue), [
+                {"period": period, "period_start": date.fromisoformat(row[0]), "revenue": row[1], "orders": row[2]}
+                for row in rows
+            ])
+
+    buckets = conn.execute(
+        select(func.date(Order.deadline), func.count())
+        .where(Order.deadline.is_not(None), Order.status != OrderStatus.delivered)
+        .group_by(func.date(Order.deadline))
+    ).all()
+    if buckets:
+        conn.execute(insert(OrderDeadlineBucket), [{"day": date.fromisoformat(day), "open_count": count} for day, count in buckets])
+
+    history = conn.execute(
+        select(OrderEditHistory.order_id, OrderEditHistory.action, OrderEditHistory.field_changes, OrderEditHistory.timestamp)
+        .order_by(OrderEditHistory.order_id, OrderEditHistory.timestamp, OrderEditHistory.id)
+    )
+    transitions = replay_transitions(history)
+    if transitions:
+        conn.execute(insert(OrderStatusTransition), [
+            {"from_status": from_status, "to_status": to_status, "count": count, "total_seconds": seconds}
+            for (from_status, to_status), (count, seconds) in transitions.items()
+        ])
+    return {
+        "statuses": len(status_counts),
+        "deadline_days": len(buckets),
+        "transitions": len(transitions),
+    }
+
+async def main(argv):
+    from database import engine
+    if "--rebuild" not in argv:
+        print("Usage: python analytics.py --rebuild")
+        return
+    try:
+        async with engine.begin() as conn:
+            result = await conn.run_sync(rebuild_summaries)
+        print(f"Report summaries rebuilt: {result}")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,133 @@
+"""
+Журнал изменений заказов (order_edit_history).
+
+Режим задается настройкой HISTORY_MODE:
+- "transactional" (по умолчанию) - запись истории добавляется в ту же сессию,
+  что и изменение заказа, и сохраняется тем же коммитом: один fsync на
+  действие, и изменение не может сохраниться без записи в журнале.
+- "write_behind" - записи копятся в памяти и после коммита изменения
+  сохраняются фоновой задачей пачками (один INSERT ... VALUES на пачку).
+  Быстрее при большом числе параллельных изменений, но записи, еще не
+  сброшенные на диск, теряются при аварийной остановке процесса.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal, settings
+from models import OrderEditHistory
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "pending_history"
+
+def history_row(order_id: int, user_id: int, action: str, field_changes=None) -> dict:
+    return {
+        "order_id": order_id,
+        "user_id": user_id,
+        "action": action,
+        "field_changes": json.dumps(field_changes) if field_changes else None,
+        "timestamp": datetime.utcnow(),
+    }
+
+async def log_order_changes(db: AsyncSession, rows: list):
+    # Ничего не коммитит: записи сохраняются коммитом вызывающего кода
+    if not rows:
+        return
+    if settings.history_mode == "write_behind":
+        db.info.setdefault(PENDING_KEY, []).extend(rows)
+    else:
+        db.add_all([OrderEditHistory(**row) for row in rows])
+
+async def log_order_change(db: AsyncSession, order_id: int, user_id: int, action: str, field_changes=None):
+    await log_order_changes(db, [history_row(order_id, user_id, action, field_changes)])
+
+class HistoryWriter:
+    """Фоновая пакетная запись истории для режима write_behind."""
+
+    def __init__(self, session_factory, batch_size: int, flush_interval: float):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    def enqueue(self, rows: list):
+        self._pending.extend(rows)
+        try:
+            self.start()
+        except RuntimeError:
+            # Нет работающего event loop - записи сбросит явный flush()
+            return
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(insert(OrderEditHistory).values(batch))
+                    await session.commit()
+            except OperationalError as e:
+                # База занята другим писателем - повторим на следующем такте
+                logger.warning("History flush postponed", extra={"rows": len(batch), "error": str(e)})
+                self._pending[:0] = batch
+                return
+            except Exception:
+                logger.exception("History flush failed, rows dropped", extra={"rows": len(batch)})
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+history_writer = HistoryWriter(
+    AsyncSessionLocal,
+    batch_size=settings.history_batch_size,
+    flush_interval=settings.history_flush_interval,
+)
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_committed_history(session: Session):
+    rows = session.info.pop(PENDING_KEY, None)
+    if rows:
+        history_writer.enqueue(rows)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back_history(session: Session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
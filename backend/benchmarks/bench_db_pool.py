@@ -0,0 +1,63 @@
+"""
+Бенчмарк: запросов в секунду с NullPool и с пулом соединений.
+
+Запуск из директории backend:
+    python -m benchmarks.bench_db_pool --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from database import build_engine, get_db, settings
+from main import app
+
+async def run_mode(pool_mode: str, total_requests: int, concurrency: int) -> float:
+    engine = build_engine(settings.database_url, pool_mode=pool_mode)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_db():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/api/auth/login", data={"username": "admin1", "password": "nimda"})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            remaining = total_requests
+
+            async def worker():
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    r = await client.get("/api/orders/", params={"limit": 50}, headers=headers)
+                    r.raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        await engine.dispose()
+
+    return total_requests / elapsed
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    for pool_mode in ("null", "queue"):
+        rps = await run_mode(pool_mode, args.requests, args.concurrency)
+        print(f"{pool_mode:>6}: {rps:8.1f} req/s ({args.requests} requests, concurrency {args.concurrency})")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Бенчмарк: пропускная способность изменений заказов при записи истории
+в той же транзакции и при отложенной пакетной записи (write-behind).
+
+Каждый параллельный клиент меняет цену своего заказа (PUT /api/orders/{id}),
+на каждое изменение приходится одна запись в order_edit_history.
+Время write-behind включает финальный сброс очереди. Ответы с ошибкой
+(например, "database is locked" при исчерпании busy_timeout) считаются отдельно.
+
+Запуск из директории backend:
+    python -m benchmarks.bench_history_writes --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from audit import history_writer
+from database import engine, settings
+from main import app
+
+async def run_mode(mode: str, client: httpx.AsyncClient, headers: dict, order_ids: list, total_requests: int) -> tuple:
+    settings.history_mode = mode
+    remaining = total_requests
+    failed = 0
+
+    async def worker(order_id: int):
+        nonlocal remaining, failed
+        price = 0
+        while remaining > 0:
+            remaining -= 1
+            price += 1
+            r = await client.put(f"/api/orders/{order_id}", data={"price": str(price)}, headers=headers)
+            if r.status_code != 200:
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(order_id) for order_id in order_ids))
+    requests_done = time.perf_counter() - start
+    await history_writer.stop()
+    flushed = time.perf_counter() - start
+    return total_requests / requests_done, total_requests / flushed, failed
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/api/auth/login", data={"username": "admin1", "password": "nimda"})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            order_ids = []
+            for i in range(args.concurrency):
+                r = await client.post(
+                    "/api/orders/",
+                    data={"customer_name": f"Bench {i}", "customer_phone": "+70000000000", "customer_address": "Bench"},
+                    headers=headers,
+                )
+                r.raise_for_status()
+                order_ids.append(r.json()["id"])
+
+            for mode in ("transactional", "write_behind"):
+                rps, rps_flushed, failed = await run_mode(mode, client, headers, order_ids, args.requests)
+                print(
+                    f"{mode:>13}: {rps:8.1f} req/s, {rps_flushed:8.1f} req/s incl. history flush, "
+                    f"{failed} failed ({args.requests} requests, concurrency {args.concurrency})"
+                )
+
+            for order_id in order_ids:
+                await client.delete(f"/api/orders/{order_id}", headers=headers)
+    finally:
+        await history_writer.stop()
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
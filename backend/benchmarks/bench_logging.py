@@ -0,0 +1,84 @@
+"""
+Бенчмарк: пропускная способность API с журналом запросов и без него.
+
+Приложение вызывается в процессе через httpx.ASGITransport (GET /health,
+заданная конкурентность). Режимы:
+- off - журнал запросов отключен;
+- sync - записи пишутся в поток вывода прямо в обработчике (как прежние print);
+- queue - записи идут через очередь и пишутся фоновым потоком (logging_config).
+
+Вывод идет в медленный приемник (задержка на каждую запись, как у stdout,
+перенаправленного в pipe контейнера), чтобы была видна блокировка цикла событий.
+
+Запуск из директории backend:
+    python -m benchmarks.bench_logging --requests 5000 --concurrency 50 --write-delay-us 200
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+
+from main import app
+from logging_config import JsonFormatter, setup_logging, shutdown_logging
+
+class SlowSink:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str):
+        time.sleep(self.delay)
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+def configure(mode: str, sink: SlowSink):
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    # Клиент httpx тоже пишет запись на запрос - в замер не входит
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    request_logger = logging.getLogger("requests")
+    request_logger.setLevel(logging.INFO if mode != "off" else logging.CRITICAL + 1)
+    if mode == "sync":
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(JsonFormatter())
+        root.addHandler(handler)
+    elif mode == "queue":
+        setup_logging(stream=sink)
+
+async def run(requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                response = await client.get("/health")
+                assert response.status_code == 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--write-delay-us", type=float, default=200)
+    args = parser.parse_args()
+
+    for mode in ("off", "sync", "queue"):
+        sink = SlowSink(args.write_delay_us / 1e6)
+        configure(mode, sink)
+        await run(min(args.requests, 200), args.concurrency)  # прогрев
+        seconds = await run(args.requests, args.concurrency)
+        shutdown_logging()  # дописывает очередь
+        print(f"{mode:>5}: {args.requests / seconds:8.0f} req/s ({sink.lines} log lines)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Бенчмарк: задержка других запросов во время серии входов (bcrypt).
+
+Приложение вызывается в процессе через httpx.ASGITransport. Одновременно
+идут --logins входов (по --concurrency) и GET /health каждые 10 мс;
+печатается задержка /health с учетом
+ожидания, пока цикл событий занят. Режимы:
+- inline - bcrypt прямо в обработчике, в потоке цикла событий;
+- pool - bcrypt в пуле потоков passwords.py (PASSWORD_HASH_WORKERS).
+
+Запуск из директории backend:
+    python -m benchmarks.bench_login --logins 40 --concurrency 10
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+import httpx
+
+import passwords
+from database import engine
+from main import app
+from routers import auth
+
+PROBE_INTERVAL = 0.01  # секунды между запросами /health
+
+async def verify_inline(password, stored):
+    if stored is None:
+        return passwords.verify_dummy(password)
+    return passwords.verify_password(password, stored)
+
+async def run(logins: int, concurrency: int) -> tuple:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(logins))
+        health = []
+        done = False
+
+        async def login_worker():
+            for _ in remaining:
+                response = await client.post("/api/auth/login", data={"username": "work", "password": "work"})
+                assert response.status_code == 200
+
+        async def health_worker():
+            # Задержка считается от момента, когда запрос должен был уйти: остановка цикла событий тоже входит
+            while not done:
+                started = time.perf_counter()
+                await asyncio.sleep(PROBE_INTERVAL)
+                await client.get("/health")
+                health.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+        probe = asyncio.create_task(health_worker())
+        started = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        seconds = time.perf_counter() - started
+        done = True
+        await probe
+        return seconds, sorted(health)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    pooled = auth.verify_password_async
+
+    try:
+        for mode in ("inline", "pool"):
+            auth.verify_password_async = verify_inline if mode == "inline" else pooled
+            await run(2, 1)  # прогрев, хеш пароля становится актуальным
+            seconds, health = await run(args.logins, args.concurrency)
+            p95 = health[max(int(len(health) * 0.95) - 1, 0)]
+            print(
+                f"{mode:>6}: {args.logins / seconds:6.1f} logins/s, /health {len(health)} requests, "
+                f"median {statistics.median(health) * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms"
+            )
+    finally:
+        auth.verify_password_async = pooled
+        # Соединения aiosqlite держат потоки, без закрытия процесс не завершится
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""
+Бенчмарк: стоимость учета метрик на один запрос и на один запрос к БД.
+
+- middleware - минимальное ASGI-приложение вызывается напрямую и через
+  MetricsMiddleware, разница на запрос - накладные расходы учета;
+- query events - before/after_cursor_execute и наблюдение гистограммы
+  на каждый запрос к БД (без самой БД).
+
+Запуск из директории backend:
+    python -m benchmarks.bench_metrics --requests 200000
+"""
+import argparse
+import asyncio
+import time
+
+from metrics import MetricsMiddleware, after_cursor_execute, before_cursor_execute
+
+class Route:
+    path = "/api/orders/{order_id}"
+
+async def plain_app(scope, receive, send):
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+async def noop_send(message):
+    pass
+
+async def noop_receive():
+    return {"type": "http.request"}
+
+async def drive(app, count: int) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        await app({"type": "http", "method": "GET"}, noop_receive, noop_send)
+    return time.perf_counter() - started
+
+class Context:
+    pass
+
+def query_events(count: int) -> float:
+    statement = "SELECT orders.id FROM orders WHERE orders.id = ?"
+    started = time.perf_counter()
+    for _ in range(count):
+        context = Context()
+        before_cursor_execute(None, None, statement, (), context, False)
+        after_cursor_execute(None, None, statement, (), context, False)
+    return time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    plain = min([await drive(plain_app, args.requests) for _ in range(3)])
+    measured = min([await drive(MetricsMiddleware(plain_app), args.requests) for _ in range(3)])
+    per_request = (measured - plain) / args.requests * 1e6
+    print(f"middleware: {plain / args.requests * 1e6:6.2f} us plain, {measured / args.requests * 1e6:6.2f} us with metrics, +{per_request:.2f} us/request")
+    events = min(query_events(args.requests) for _ in range(3))
+    print(f"query events: {events / args.requests * 1e6:.2f} us/query")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Бенчмарк: полный список заказов (limit=0) при загрузке ORM-объектов Order
+и при выборке только столбцов проекции роли простыми строками.
+
+Данные создаются во временной БД: у каждого заказа длинные адрес, примечания
+и требования (как у реальных заказов с подробным описанием). Для каждого
+варианта измеряются время (лучшее из повторов) и пик памяти Python
+(tracemalloc) на выборку и сериализацию.
+
+Запуск из директории backend:
+    python -m benchmarks.bench_order_list --orders 50000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from database import build_engine
+from migrations import migrate
+from models import Order, OrderStatus
+from serializers import dumps, list_projection, order_projection
+
+async def seed(engine, count: int):
+    start = datetime(2024, 1, 1, 9, 30)
+    statuses = list(OrderStatus)
+    rows = [
+        {
+            "customer_name": f"Заказчик {i}",
+            "customer_phone": "+79990000000",
+            "customer_address": f"г. Москва, ул. Примерная, д. {i}, " + "подъезд 2, этаж 5, домофон 15К. " * 5,
+            "phone_agreement_notes": "Согласовано по телефону: размеры, цвет, сроки доставки. " * 30,
+            "customer_requirements": "Шкаф-купе, 2 двери, зеркало, подсветка, ЛДСП белый. " * 30,
+            "deadline": start + timedelta(days=i % 90) if i % 4 else None,
+            "price": 10000 + i,
+            "status": statuses[i % len(statuses)],
+            "created_at": start + timedelta(minutes=i),
+            "updated_at": start + timedelta(minutes=i),
+        }
+        for i in range(count)
+    ]
+    async with engine.begin() as conn:
+        await conn.execute(insert(Order), rows)
+
+async def orm_objects(session_factory, role: str) -> bytes:
+    project = order_projection(role)
+    async with session_factory() as session:
+        orders = (await session.execute(select(Order).order_by(Order.created_at.desc(), Order.id.desc()))).scalars().all()
+        return dumps([project(order) for order in orders])
+
+async def projected_rows(session_factory, role: str) -> bytes:
+    project = list_projection(role)
+    columns = [getattr(Order, field) for field in project.fields]
+    async with session_factory() as session:
+        rows = (await session.execute(select(*columns).order_by(Order.created_at.desc(), Order.id.desc()))).all()
+        return dumps([project(row) for row in rows])
+
+async def measure(fn, session_factory, role: str, repeat: int) -> tuple:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await fn(session_factory, role)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    await fn(session_factory, role)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak, len(body)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}", pool_mode="null")
+        try:
+            await migrate(engine)
+            await seed(engine, args.orders)
+            session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+            for role in ("admin", "work"):
+                for name, fn in (("orm objects", orm_objects), ("projected rows", projected_rows)):
+                    seconds, peak, size = await measure(fn, session_factory, role, args.repeat)
+                    print(
+                        f"{role:>6} {name:>14}: {seconds * 1000:8.1f} ms, "
+                        f"peak {peak / 2**20:7.1f} MiB, body {size / 2**20:6.1f} MiB ({args.orders} orders)"
+                    )
+        finally:
+            await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
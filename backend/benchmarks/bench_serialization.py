@@ -0,0 +1,108 @@
+"""
+Бенчмарк: сериализация списка заказов в тело JSON-ответа.
+
+Сравниваются:
+- legacy - прежний путь: словарь собирается вручную с .isoformat() по полям,
+  затем FastAPI прогоняет результат через jsonable_encoder и json.dumps
+  (как JSONResponse по умолчанию);
+- projection - проекция роли из serializers и orjson.
+
+Заказы создаются в памяти (без БД), поэтому измеряется только сериализация.
+
+Запуск из директории backend:
+    python -m benchmarks.bench_serialization --sizes 10000 100000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from images import photo_variants
+from models import Order, OrderStatus
+from serializers import dumps, order_projection
+
+def legacy_serialize_order(order: Order, role: str) -> dict:
+    # Копия serialize_order до перехода на проекции
+    order_dict = {
+        "id": order.id,
+        "order_number": order.order_number,
+        "customer_name": order.customer_name,
+        "customer_requirements": order.customer_requirements,
+        "deadline": order.deadline.isoformat() if order.deadline else None,
+        "furniture_photo": order.furniture_photo,
+        "material_photo": order.material_photo,
+        "furniture_photo_variants": photo_variants(order.furniture_photo),
+        "material_photo_variants": photo_variants(order.material_photo),
+        "status": order.status.value,
+        "created_at": order.created_at.isoformat(),
+        "updated_at": order.updated_at.isoformat(),
+    }
+    if role in ("admin", "logist"):
+        order_dict.update({
+            "customer_phone": order.customer_phone,
+            "customer_address": order.customer_address,
+            "phone_agreement_notes": order.phone_agreement_notes,
+            "price": order.price,
+        })
+    return order_dict
+
+def legacy_body(orders: list, role: str) -> bytes:
+    content = jsonable_encoder([legacy_serialize_order(order, role) for order in orders])
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+def projection_body(orders: list, role: str) -> bytes:
+    project = order_projection(role)
+    return dumps([project(order) for order in orders])
+
+def make_orders(count: int) -> list:
+    start = datetime(2024, 1, 1, 9, 30)
+    statuses = list(OrderStatus)
+    return [
+        Order(
+            id=i,
+            order_number=i % 9999 + 1,
+            customer_name=f"Заказчик {i}",
+            customer_phone="+79990000000",
+            customer_address="г. Москва, ул. Примерная, д. 1, кв. 10",
+            phone_agreement_notes="Согласовано по телефону" if i % 3 else None,
+            customer_requirements="Шкаф-купе, 2 двери, зеркало",
+            deadline=start + timedelta(days=i % 90) if i % 4 else None,
+            price=10000 + i,
+            material_photo=f"material_{i}.jpg" if i % 2 else None,
+            furniture_photo=f"furniture_{i}.jpg",
+            status=statuses[i % len(statuses)],
+            created_at=start + timedelta(minutes=i),
+            updated_at=start + timedelta(minutes=i, seconds=30),
+        )
+        for i in range(1, count + 1)
+    ]
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        orders = make_orders(size)
+        for role in ("admin", "work"):
+            assert json.loads(legacy_body(orders[:100], role)) == json.loads(projection_body(orders[:100], role))
+            legacy = best_of(lambda: legacy_body(orders, role), args.repeat)
+            projection = best_of(lambda: projection_body(orders, role), args.repeat)
+            print(
+                f"{size:>7} orders, {role:>6}: legacy {legacy * 1000:8.1f} ms, "
+                f"projection {projection * 1000:8.1f} ms, x{legacy / projection:4.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Генератор синтетических данных для нагрузочных тестов: заказы и журнал изменений.
+
+Данные похожи на рабочие: русские имена и адреса, повторные клиенты (один
+телефон в записи "8 (9xx) ..." или "+7 9xx ..."), длинные примечания и
+требования, статусы с реальным распределением, сроки в прошлом и будущем.
+Для каждого заказа пишется история, согласованная со статусом: создание,
+переходы по статусам и правки. Генерация детерминирована (--seed).
+
+Вставка идет пачками через Core insert. После нее пересчитываются счетчик
+номеров заказов и сводные таблицы отчетов, поэтому БД готова для API.
+
+Создать отдельную БД для ручных прогонов (из директории backend):
+    python -m benchmarks.datagen --orders 100000 --db /tmp/crm_100k.db
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+FIRST_NAMES = ["Иван", "Анна", "Сергей", "Мария", "Дмитрий", "Елена", "Алексей", "Ольга", "Никита", "Татьяна", "Павел", "Наталья"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков", "Федоров", "Морозов", "Волков"]
+STREETS = ["Ленина", "Гагарина", "Мира", "Садовая", "Лесная", "Школьная", "Новая", "Советская", "Молодежная", "Центральная"]
+CITIES = ["Москва", "Химки", "Мытищи", "Балашиха", "Подольск", "Королев"]
+FURNITURE = ["Шкаф-купе", "Кухонный гарнитур", "Прихожая", "Стеллаж", "Комод", "Гардеробная", "Тумба под ТВ", "Кровать-подиум"]
+MATERIALS = ["ЛДСП белый", "МДФ эмаль", "дуб натуральный", "ЛДСП венге", "шпон ореха", "акрил глянец"]
+EXTRAS = ["зеркало", "подсветка", "доводчики", "скрытые ручки", "выдвижные ящики", "антресоль", "стекло сатин"]
+NOTES = [
+    "Согласовали размеры по телефону, замер {day}.",
+    "Клиент просит доставку после 18:00, подъем на {floor} этаж без лифта.",
+    "Цвет подтвержден по образцу, предоплата 50%.",
+    "Перезвонить за день до доставки, домофон {code}.",
+]
+
+# Доли статусов среди заказов и путь статусов до каждого из них (действия журнала)
+STATUS_WEIGHTS = {
+    "draft": 8, "pending_confirmation": 7, "confirmed": 10,
+    "in_progress": 20, "ready": 10, "delivered": 45,
+}
+STATUS_PATH = ["draft", "pending_confirmation", "confirmed", "in_progress", "ready", "delivered"]
+PATH_ACTIONS = {
+    "pending_confirmation": "submitted_for_confirmation",
+    "confirmed": "confirmed",
+    "in_progress": "details_added",
+    "ready": "completed",
+    "delivered": "delivered",
+}
+# Кто переводит заказ в статус (остальные переходы делает admin)
+STEP_ROLES = {"in_progress": "logist", "ready": "work"}
+INSERT_CHUNK = 5000
+REPEAT_CUSTOMER_SHARE = 0.3
+
+def customer_phone(rng: random.Random, digits: str) -> str:
+    # Один и тот же номер в разных записях, как его вводят операторы
+    if rng.random() < 0.5:
+        return f"8 ({digits[:3]}) {digits[3:6]}-{digits[6:8]}-{digits[8:]}"
+    return f"+7 {digits[:3]} {digits[3:6]} {digits[6:]}"
+
+def requirements_text(rng: random.Random) -> str:
+    item = rng.choice(FURNITURE)
+    extras = ", ".join(rng.sample(EXTRAS, rng.randint(1, 4)))
+    size = f"{rng.randint(80, 320)}x{rng.randint(40, 70)}x{rng.randint(180, 270)} см"
+    return f"{item}, {size}, {rng.choice(MATERIALS)}, {extras}. " * rng.randint(1, 6)
+
+def generate_dataset(count: int, user_ids: dict, seed: int = 1, now: datetime = None):
+    """Заказы и журнал: (orders, history) - списки словарей для insert, id заказов с 1."""
+    from models import OrderStatus
+    from phones import normalize_phone
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    customers = []
+    orders, history = [], []
+    order_number = 0
+
+    for order_id in range(1, count + 1):
+        if customers and rng.random() < REPEAT_CUSTOMER_SHARE:
+            name, digits, address = rng.choice(customers)
+        else:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            digits = f"9{rng.randint(0, 10 ** 9 - 1):09d}"
+            address = (
+                f"г. {rng.choice(CITIES)}, ул. {rng.choice(STREETS)}, д. {rng.randint(1, 150)}, "
+                f"кв. {rng.randint(1, 400)}"
+            )
+            customers.append((name, digits, address))
+        phone = customer_phone(rng, digits)
+        status = rng.choices(statuses, weights)[0]
+        created_at = now - timedelta(days=rng.uniform(0, 365))
+        deadline = created_at + timedelta(days=rng.randint(7, 60)) if status != "draft" or rng.random() < 0.5 else None
+        number = None
+        if STATUS_PATH.index(status) >= STATUS_PATH.index("confirmed") and order_number < 9999:
+            order_number += 1
+            number = order_number
+
+        # Журнал: создание, переходы до текущего статуса и случайные правки между ними
+        timestamp = created_at
+        history.append({"order_id": order_id, "user_id": user_ids["admin"], "action": "created", "field_changes": None, "timestamp": timestamp})
+        for step in STATUS_PATH[1:STATUS_PATH.index(status) + 1]:
+            if rng.random() < 0.3:
+                timestamp += timedelta(hours=rng.uniform(1, 48))
+                history.append({
+                    "order_id": order_id, "user_id": user_ids["admin"], "action": "updated",
+                    "field_changes": json.dumps({"price": {"old": None, "new": rng.randint(10, 300) * 1000}}),
+                    "timestamp": timestamp,
+                })
+            timestamp += timedelta(hours=rng.uniform(2, 96))
+            actor = user_ids[STEP_ROLES.get(step, "admin")]
+            history.append({"order_id": order_id, "user_id": actor, "action": PATH_ACTIONS[step], "field_changes": None, "timestamp": timestamp})
+
+        orders.append({
+            "id": order_id,
+            "order_number": number,
+            "customer_name": name,
+            "customer_phone": phone,
+            "phone_key": normalize_phone(phone),
+            "customer_address": address,
+            "phone_agreement_notes": rng.choice(NOTES).format(day=rng.randint(1, 28), floor=rng.randint(2, 16), code=rng.randint(10, 999)),
+            "customer_requirements": requirements_text(rng) if status != "draft" else None,
+            "deadline": deadline,
+            "price": rng.randint(10, 300) * 1000 if status != "draft" else None,
+            "status": OrderStatus(status),
+            "created_by": user_ids["admin"],
+            "created_at": created_at,
+            "updated_at": timestamp,
+            "status_changed_at": timestamp,
+        })
+    return orders, history
+
+async def seed_database(engine, count: int, seed: int = 1) -> dict:
+    """Заполняет пустую БД (после миграций и init_users) заказами и журналом."""
+    from analytics import rebuild_summaries
+    from models import Order, OrderEditHistory, OrderNumberCounter, User
+    from order_numbers import seed_counter
+
+    async with engine.connect() as conn:
+        user_ids = {role.value: user_id for user_id, role in (await conn.execute(select(User.id, User.role))).all()}
+    started = time.perf_counter()
+    orders, history = generate_dataset(count, user_ids, seed)
+    generated = time.perf_counter()
+    async with engine.begin() as conn:
+        for table, rows in ((Order, orders), (OrderEditHistory, history)):
+            for start in range(0, len(rows), INSERT_CHUNK):
+                await conn.execute(insert(table), rows[start:start + INSERT_CHUNK])
+        # Счетчик номеров создан миграцией на пустой БД - продолжаем после выданных
+        await conn.execute(delete(OrderNumberCounter))
+        await conn.run_sync(seed_counter)
+        await conn.run_sync(rebuild_summaries)
+    return {
+        "orders": len(orders),
+        "history": len(history),
+        "generate_seconds": round(generated - started, 2),
+        "insert_seconds": round(time.perf_counter() - generated, 2),
+    }
+
+async def create_database(path: str, count: int, seed: int = 1) -> dict:
+    """Новая БД по пути path: миграции, пользователи по умолчанию и данные.
+
+    DATABASE_URL должен указывать на path до импорта модулей приложения
+    (init_users берет путь из настроек).
+    """
+    from database import build_engine
+    from init_db import init_users
+    from migrations import migrate
+
+    engine = build_engine(f"sqlite+aiosqlite:///{path}", pool_mode="null")
+    try:
+        await migrate(engine)
+        await init_users()
+        return await seed_database(engine, count, seed)
+    finally:
+        await engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--db", required=True, help="путь к новой БД (файл не должен существовать)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.abspath(args.db)}"
+    print(asyncio.run(create_database(os.path.abspath(args.db), args.orders, args.seed)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Нагрузочный тест API на большом синтетическом наборе данных.
+
+Приложение запускается в процессе и вызывается через httpx.ASGITransport
+(без сети, поэтому измеряется сам сервер). Виртуальные пользователи
+(--concurrency) получают роль по доле из --roles и выполняют сценарии
+вперемешку по весам: список заказов (разные сортировки и фильтры), карточка,
+история, дельта-синхронизация, поиск, поиск клиента по телефону, выгрузка,
+отчеты, создание, правка и отправка на подтверждение. Сценарий выполняется
+только ролями, которым он доступен.
+
+По каждому сценарию и в целом: число запросов, ошибки (статус >= 400),
+p50/p95/p99/max в миллисекундах и пропускная способность. Результат можно
+сохранить в JSON (--output) и сравнить с прошлым прогоном (--compare).
+
+БД создается во временной директории генератором benchmarks/datagen.py,
+либо берется готовая (--db; изменения сценариев в нее записываются).
+
+Запуск из директории backend:
+    python -m benchmarks.load_test --orders 100000 --requests 20000 --concurrency 50 --output /tmp/run.json
+    python -m benchmarks.load_test --db /tmp/crm_100k.db --roles admin=1 --compare /tmp/run.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PERCENTILES = (50, 95, 99)
+USERS = {"admin": ("admin1", "nimda"), "logist": ("logist", "logist"), "work": ("work", "work")}
+SEARCH_WORDS = ["шкаф", "кухон", "Иван", "Москва", "зеркало", "Ленина", "дуб", "Петров"]
+ALL_ROLES = ("admin", "logist", "work")
+ADMIN = ("admin",)
+
+class Context:
+    """Общие для пользователей данные сценариев."""
+
+    def __init__(self, rng: random.Random, max_order_id: int, draft_ids: list, changes_cursor: str):
+        self.rng = rng
+        self.changes_cursor = changes_cursor
+        self.max_order_id = max_order_id
+        self.draft_ids = draft_ids
+        self.created = 0
+
+    def order_id(self) -> int:
+        return self.rng.randint(1, self.max_order_id)
+
+def list_recent(client, headers, ctx):
+    return client.get("/api/orders/", params={"limit": 50}, headers=headers)
+
+def list_by_deadline(client, headers, ctx):
+    return client.get("/api/orders/", params={"limit": 50, "sort": "deadline", "order": "asc"}, headers=headers)
+
+def list_by_status(client, headers, ctx):
+    status = ctx.rng.choice(["confirmed", "in_progress", "ready"])
+    return client.get("/api/orders/", params={"limit": 100, "status_filter": status}, headers=headers)
+
+def get_order(client, headers, ctx):
+    return client.get(f"/api/orders/{ctx.order_id()}", headers=headers)
+
+def order_history(client, headers, ctx):
+    return client.get(f"/api/orders/{ctx.order_id()}/history", headers=headers)
+
+def changes(client, headers, ctx):
+    # Клиент, синхронизировавшийся сутки назад
+    return client.get("/api/orders/changes", params={"since": ctx.changes_cursor, "limit": 200}, headers=headers)
+
+def search(client, headers, ctx):
+    return client.get("/api/orders/search", params={"q": ctx.rng.choice(SEARCH_WORDS), "limit": 20}, headers=headers)
+
+def customers(client, headers, ctx):
+    return client.get("/api/orders/customers", params={"phone": f"89{ctx.rng.randint(0, 999):03d}"}, headers=headers)
+
+def export_week(client, headers, ctx):
+    since = (datetime.utcnow() - timedelta(days=7)).isoformat()
+    return client.get("/api/orders/export", params={"format": "ndjson", "created_from": since}, headers=headers)
+
+def report(client, headers, ctx):
+    return client.get(ctx.rng.choice(["/api/reports/orders-by-status", "/api/reports/overdue"]), headers=headers)
+
+def create_order(client, headers, ctx):
+    ctx.created += 1
+    return client.post("/api/orders/", data={
+        "customer_name": f"Нагрузка {ctx.created}",
+        "customer_phone": f"8 (9{ctx.rng.randint(0, 99):02d}) {ctx.rng.randint(0, 9999999):07d}",
+        "customer_address": "г. Москва, ул. Тестовая, д. 1",
+    }, headers=headers)
+
+def update_order(client, headers, ctx):
+    return client.put(f"/api/orders/{ctx.order_id()}", data={"price": str(ctx.rng.randint(10, 300) * 1000)}, headers=headers)
+
+def submit_order(client, headers, ctx):
+    # Черновик отправляется один раз; когда они кончились - правка цены
+    if not ctx.draft_ids:
+        return update_order(client, headers, ctx)
+    return client.post(f"/api/orders/{ctx.draft_ids.pop()}/submit", headers=headers)
+
+# (имя, вес, роли, функция запроса)
+SCENARIOS = [
+    ("list_recent", 20, ALL_ROLES, list_recent),
+    ("list_by_deadline", 8, ALL_ROLES, list_by_deadline),
+    ("list_by_status", 8, ALL_ROLES, list_by_status),
+    ("get_order", 20, ADMIN, get_order),
+    ("order_history", 6, ADMIN, order_history),
+    ("changes", 6, ALL_ROLES, changes),
+    ("search", 8, ALL_ROLES, search),
+    ("customers", 4, ("admin", "logist"), customers),
+    ("export_week", 1, ALL_ROLES, export_week),
+    ("report", 3, ADMIN, report),
+    ("create_order", 4, ADMIN, create_order),
+    ("update_order", 6, ADMIN, update_order),
+    ("submit_order", 2, ADMIN, submit_order),
+]
+
+def parse_weights(value: str) -> dict:
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - set(USERS)
+    if unknown:
+        raise SystemExit(f"Unknown roles: {sorted(unknown)}")
+    return weights
+
+def percentile(sorted_values: list, p: float) -> float:
+    # Ближайший ранг: значение, не меньше которого p% наблюдений
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+def summarize(latencies: list, errors: int, seconds: float, statuses: dict) -> dict:
+    values = sorted(latencies)
+    summary = {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / seconds, 1) if seconds else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+    }
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(percentile(values, p) * 1000, 2)
+    return summary
+
+async def run_load(client, tokens: dict, ctx: Context, roles: dict, total: int, concurrency: int) -> tuple:
+    latencies = {name: [] for name, *_ in SCENARIOS}
+    errors = {name: 0 for name, *_ in SCENARIOS}
+    statuses = {name: {} for name, *_ in SCENARIOS}
+    remaining = total
+
+    async def user(role: str):
+        nonlocal remaining
+        headers = {"Authorization": f"Bearer {tokens[role]}"}
+        allowed = [scenario for scenario in SCENARIOS if role in scenario[2]]
+        weights = [scenario[1] for scenario in allowed]
+        while remaining > 0:
+            remaining -= 1
+            name, _, _, request = ctx.rng.choices(allowed, weights)[0]
+            started = time.perf_counter()
+            response = await request(client, headers, ctx)
+            latencies[name].append(time.perf_counter() - started)
+            statuses[name][response.status_code] = statuses[name].get(response.status_code, 0) + 1
+            if response.status_code >= 400:
+                errors[name] += 1
+
+    role_names = list(roles)
+    user_roles = ctx.rng.choices(role_names, [roles[name] for name in role_names], k=concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(user(role) for role in user_roles))
+    return time.perf_counter() - started, latencies, errors, statuses
+
+def print_report(results: dict, previous: dict = None):
+    rows = [("overall", results["overall"])] + list(results["scenarios"].items())
+    print(f"{'scenario':<18}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, row in rows:
+        line = (
+            f"{name:<18}{row['requests']:>9}{row['errors']:>8}{row['throughput_rps']:>9.1f}"
+            f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}"
+        )
+        if previous:
+            before = previous["overall"] if name == "overall" else previous["scenarios"].get(name)
+            if before and before["p95_ms"]:
+                line += f"   p95 {(row['p95_ms'] / before['p95_ms'] - 1) * 100:+.0f}%"
+                if before["throughput_rps"]:
+                    line += f", rps {(row['throughput_rps'] / before['throughput_rps'] - 1) * 100:+.0f}%"
+        print(line)
+
+async def run(args, db_path: str, dataset: dict) -> dict:
+    import httpx
+    from database import engine
+    from main import app
+    from routers.orders import encode_cursor
+
+    rng = random.Random(args.seed)
+    with sqlite3.connect(db_path) as conn:
+        max_order_id = conn.execute("SELECT MAX(id) FROM orders").fetchone()[0] or 1
+        draft_ids = [row[0] for row in conn.execute("SELECT id FROM orders WHERE status = 'draft'")]
+    rng.shuffle(draft_ids)
+    ctx = Context(rng, max_order_id, draft_ids, encode_cursor(datetime.utcnow() - timedelta(days=1), 0))
+    roles = parse_weights(args.roles)
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+            tokens = {}
+            for role in roles:
+                username, password = USERS[role]
+                response = await client.post("/api/auth/login", data={"username": username, "password": password})
+                response.raise_for_status()
+                tokens[role] = response.json()["access_token"]
+            if args.warmup:
+                await run_load(client, tokens, ctx, roles, args.warmup, args.concurrency)
+            seconds, latencies, errors, statuses = await run_load(
+                client, tokens, ctx, roles, args.requests, args.concurrency
+            )
+    finally:
+        await engine.dispose()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    all_statuses = {}
+    for counts in statuses.values():
+        for code, count in counts.items():
+            all_statuses[code] = all_statuses.get(code, 0) + count
+    return {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "orders": max_order_id,
+            "dataset": dataset,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "roles": roles,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "seconds": round(seconds, 2),
+        },
+        "overall": summarize(all_latencies, sum(errors.values()), seconds, all_statuses),
+        "scenarios": {
+            name: summarize(latencies[name], errors[name], seconds, statuses[name])
+            for name, *_ in SCENARIOS if latencies[name]
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=10000, help="размер сгенерированного набора (без --db)")
+    parser.add_argument("--db", help="готовая БД (например, из benchmarks.datagen)")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--roles", default="admin=0.5,logist=0.3,work=0.2", help="доли ролей пользователей")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить результат в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--app-log", action="store_true", help="не отключать журнал приложения (уровень из LOG_LEVEL)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.abspath(args.db) if args.db else os.path.join(tmp, "load.db")
+        # Настройки читаются при импорте модулей приложения - путь к БД задается до него
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+        if not args.app_log:
+            # Журнал на stdout перемешивается с отчетом; WARNING (медленные запросы и ошибки) остается
+            os.environ["LOG_LEVEL"] = "WARNING"
+        import logging
+        from benchmarks.datagen import create_database
+
+        dataset = None
+        if not args.db:
+            dataset = asyncio.run(create_database(db_path, args.orders, args.seed))
+            print(f"dataset: {dataset}", file=sys.stderr)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+        results = asyncio.run(run(args, db_path, dataset))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(results, previous)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
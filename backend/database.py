@@ -1,22 +1,112 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     database_url: str = "sqlite+aiosqlite:///./furniture_crm.db"
     secret_key: str = "your-secret-key-here"
 
+    # Пул соединений: "queue" - переиспользуемые соединения, "null" - новое соединение на каждый запрос
+    db_pool_mode: str = "queue"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800  # секунды
+
+    # PRAGMA, применяемые к каждому новому соединению SQLite
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout: int = 5000  # миллисекунды
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # байты
+    sqlite_cache_size: int = -64000  # отрицательное значение - размер в КиБ
+
+    # Кэш состояния пользователей для проверки JWT без запроса к БД
+    auth_cache_ttl: int = 30  # секунды
+    auth_cache_size: int = 1024
+
+    # Пароли: стоимость bcrypt (при изменении пароль перехешируется при входе) и потоки для
+    # проверки хешей; неудачные попытки входа на имя пользователя ограничены за окно
+    password_bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
+    login_max_attempts: int = 5
+    login_attempt_window: float = 300  # секунды
+
+    # Процессы для генерации миниатюр фото
+    image_workers: int = 2
+
+    # Живая лента изменений заказов (SSE)
+    event_queue_size: int = 100
+    event_heartbeat_interval: float = 15  # секунды
+
+    # Дельта-синхронизация: изменения моложе sqlite_busy_timeout плюс этот запас отдаются
+    # в следующем запросе, чтобы не пропустить транзакции, которые получили updated_at раньше,
+    # а закоммитились позже (после ожидания блокировки записи)
+    sync_settle_seconds: float = 1.0
+
+    # Журнал изменений заказов: "transactional" - в той же транзакции, что и изменение,
+    # "write_behind" - пачками фоновой задачей после коммита (см. audit.py)
+    history_mode: str = "transactional"
+    history_batch_size: int = 200
+    history_flush_interval: float = 0.5  # секунды
+
+    # Номера заказов резервируются блоками такого размера (1 - по одному в транзакции подтверждения)
+    order_number_block_size: int = 1
+
+    # Файлы без ссылок удаляются не раньше чем через grace; сборка запускается с интервалом
+    storage_gc_grace_seconds: float = 3600
+    storage_gc_interval: float = 3600
+
+    # Оповещение "скоро срок" за столько секунд до срока заказа (см. deadlines.py)
+    deadline_due_soon_seconds: float = 24 * 3600
+
+    # Журналирование (logging_config.py): общий уровень, уровни по логгерам
+    # ("requests=WARNING,routers.auth=DEBUG"), доля INFO-записей о запросах
+    log_level: str = "INFO"
+    log_levels: str = ""
+    log_request_sample_rate: float = 1.0
+    log_slow_request_seconds: float = 1.0
+
+    # Если задан, GET /metrics требует заголовок "Authorization: Bearer <metrics_token>"
+    metrics_token: str = ""
+
     model_config = {
         "env_file": ".env"
     }
 
 settings = Settings()
 
-engine = create_async_engine(
-    settings.database_url,
-    poolclass=NullPool,
-)
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+    cursor.close()
+
+def build_engine(database_url: str, pool_mode: str = None):
+    pool_mode = pool_mode or settings.db_pool_mode
+    if pool_mode == "null":
+        new_engine = create_async_engine(database_url, poolclass=NullPool)
+    elif pool_mode == "queue":
+        new_engine = create_async_engine(
+            database_url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_pre_ping=settings.db_pool_pre_ping,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    else:
+        raise ValueError(f"Unknown db_pool_mode: {pool_mode!r} (expected 'queue' or 'null')")
+
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return new_engine
+
+engine = build_engine(settings.database_url)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -35,5 +125,6 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+    # Схема создается и обновляется версионированными миграциями (migrations.py)
+    from migrations import migrate
+    await migrate()
@@ -0,0 +1,155 @@
+"""
+Оповещения о сроках заказов: "скоро срок" и "просрочен".
+
+Планировщик держит в памяти min-кучу моментов срабатывания (срок минус
+окно "скоро срок" и сам срок) по незавершенным заказам. При запуске куча
+заполняется одним запросом по заказам со сроком, дальше ее
+поддерживают обработчики заказов (track/forget после коммита) - таблица
+заказов повторно не просматривается.
+
+Записи в куче не удаляются при изменении срока: актуальный срок и статус
+заказа хранятся отдельно, и устаревшая запись просто пропускается, когда
+доходит до вершины. Если устаревших записей становится слишком много,
+куча пересобирается из актуальных.
+
+Как и лента событий, планировщик работает в пределах одного процесса.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import select
+
+from analytics import naive_utc
+from database import settings
+from models import Order, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+DUE_SOON = "due_soon"
+OVERDUE = "overdue"
+RECENT_ALERTS = 200
+# Дольше не спим даже без ближайших сроков (смена системного времени)
+MAX_SLEEP_SECONDS = 3600
+
+class DeadlineScheduler:
+    def __init__(self, due_soon_seconds: float):
+        self.due_soon = timedelta(seconds=due_soon_seconds)
+        self._heap = []
+        # order_id -> (срок, статус); просроченный заказ остается здесь до доставки
+        # или смены срока, чтобы правка других полей не повторяла оповещение
+        self._orders = {}
+        self._sequence = itertools.count()
+        self._changed = asyncio.Event()
+        self.recent = deque(maxlen=RECENT_ALERTS)
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def _push(self, order_id: int, deadline: datetime):
+        top = self._heap[0][0] if self._heap else None
+        for alert, fire_at in ((DUE_SOON, deadline - self.due_soon), (OVERDUE, deadline)):
+            heapq.heappush(self._heap, (fire_at, next(self._sequence), order_id, alert, deadline))
+        if top is None or self._heap[0][0] < top:
+            # Новый ближайший срок: разбудить цикл раньше
+            self._changed.set()
+        if len(self._heap) > 4 * len(self._orders) + 1000:
+            self._compact()
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._is_current(entry)]
+        heapq.heapify(self._heap)
+
+    def _is_current(self, entry) -> bool:
+        _, _, order_id, _, deadline = entry
+        current = self._orders.get(order_id)
+        return current is not None and current[0] == deadline
+
+    def track(self, order_id: int, deadline: Optional[datetime], status: OrderStatus):
+        """Срок или статус заказа изменился (вызывается после коммита)."""
+        deadline = naive_utc(deadline)
+        if deadline is None or status == OrderStatus.delivered:
+            self.forget(order_id)
+            return
+        current = self._orders.get(order_id)
+        self._orders[order_id] = (deadline, status)
+        if current is None or current[0] != deadline:
+            self._push(order_id, deadline)
+
+    def forget(self, order_id: int):
+        self._orders.pop(order_id, None)
+
+    async def load(self, session_factory, now: Optional[datetime] = None) -> int:
+        """Начальное заполнение: незавершенные заказы со сроком.
+
+        Заказы, просроченные до запуска, получают одно оповещение "просрочен"
+        при первой проверке, без "скоро срок".
+        """
+        now = now or datetime.utcnow()
+        async with session_factory() as session:
+            rows = (await session.execute(
+                select(Order.id, Order.deadline, Order.status)
+                .where(Order.deadline.is_not(None), Order.status != OrderStatus.delivered)
+            )).all()
+        for order_id, deadline, status in rows:
+            # Заказ, уже измененный обработчиком во время загрузки, не перезаписываем
+            if order_id not in self._orders:
+                self._orders[order_id] = (deadline, status)
+                alerts = ((OVERDUE, deadline),) if deadline < now else (
+                    (DUE_SOON, deadline - self.due_soon), (OVERDUE, deadline)
+                )
+                self._heap.extend(
+                    (fire_at, next(self._sequence), order_id, alert, deadline)
+                    for alert, fire_at in alerts
+                )
+        heapq.heapify(self._heap)
+        return len(rows)
+
+    def pop_due(self, now: datetime) -> list:
+        """Сработавшие оповещения: [(alert, order_id, срок, статус)]."""
+        fired = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if not self._is_current(entry):
+                continue
+            _, _, order_id, alert, deadline = entry
+            fired.append((alert, order_id, deadline, self._orders[order_id][1]))
+        return fired
+
+    def seconds_until_next(self, now: datetime) -> float:
+        # Устаревшие записи на вершине не должны будить цикл
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return MAX_SLEEP_SECONDS
+        return min(max((self._heap[0][0] - now).total_seconds(), 0.0), MAX_SLEEP_SECONDS)
+
+    async def run(self, session_factory, publish: Callable):
+        """Фоновая задача из lifespan: publish(alert, order_id, deadline, status) на каждое оповещение."""
+        try:
+            await self.load(session_factory)
+        except Exception:
+            # Без начальной загрузки оповещения придут только по изменениям заказов
+            logger.exception("Initial deadline load failed")
+        while True:
+            now = datetime.utcnow()
+            for alert, order_id, deadline, status in self.pop_due(now):
+                self.recent.append({
+                    "alert": alert, "order_id": order_id, "deadline": deadline,
+                    "status": status, "fired_at": now,
+                })
+                try:
+                    publish(alert, order_id, deadline, status)
+                except Exception:
+                    logger.exception("Deadline alert publish failed", extra={"order_id": order_id})
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.seconds_until_next(datetime.utcnow()))
+            except asyncio.TimeoutError:
+                pass
+
+deadline_scheduler = DeadlineScheduler(due_soon_seconds=settings.deadline_due_soon_seconds)
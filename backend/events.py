@@ -0,0 +1,80 @@
+"""
+Внутрипроцессная шина событий об изменениях заказов для живой ленты (SSE).
+
+Каждый подписчик получает ограниченную очередь. Если клиент не успевает
+читать и очередь переполняется, накопленные события отбрасываются и вместо
+них отправляется одно событие "resync" - клиент перечитывает список целиком.
+Так медленный клиент не может ни задержать публикацию, ни занять
+неограниченную память.
+
+Шина работает в пределах одного процесса: при нескольких воркерах uvicorn
+каждый клиент получает события только от своего воркера.
+"""
+import asyncio
+import itertools
+from typing import Optional
+
+from database import settings
+from serializers import dumps
+
+RESYNC_EVENT = {"type": "resync"}
+
+class Subscription:
+    def __init__(self, role: str, queue_size: int):
+        self.role = role
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def push(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленный клиент: сбрасываем накопленное и просим перечитать список
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(RESYNC_EVENT)
+
+    async def next_event(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class OrderEventBroker:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._sequence = itertools.count(1)
+
+    def subscribe(self, role: str) -> Subscription:
+        subscription = Subscription(role, self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, events_by_role: dict):
+        # Событие уже отфильтровано по видимости: роль без ключа ничего не получает
+        if not events_by_role or not self._subscribers:
+            return
+        event_id = next(self._sequence)
+        for subscription in list(self._subscribers):
+            event = events_by_role.get(subscription.role)
+            if event is not None:
+                subscription.push({**event, "id": event_id})
+
+def format_sse(event: dict) -> str:
+    lines = []
+    if "id" in event:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {dumps(event).decode()}")
+    return "\n".join(lines) + "\n\n"
+
+order_events = OrderEventBroker(queue_size=settings.event_queue_size)
@@ -0,0 +1,68 @@
+"""
+Потоковая выгрузка строк в CSV или NDJSON.
+
+Строки приходят асинхронным итератором (курсор БД с yield_per) и отдаются
+клиенту пачками по EXPORT_CHUNK_ROWS, поэтому память не зависит от размера
+выгрузки.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator
+
+from starlette.responses import StreamingResponse
+
+from serializers import dumps
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+EXPORT_CHUNK_ROWS = 500
+
+def csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+async def csv_chunks(rows: AsyncIterator[dict], fields: list) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    pending = 0
+    async for row in rows:
+        writer.writerow([csv_value(row.get(field)) for field in fields])
+        pending += 1
+        if pending >= EXPORT_CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+async def ndjson_chunks(rows: AsyncIterator[dict], fields: list) -> AsyncIterator[str]:
+    lines = []
+    async for row in rows:
+        lines.append(dumps({field: row.get(field) for field in fields}).decode())
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def export_response(rows: AsyncIterator[dict], fields: list, export_format: str, filename: str) -> StreamingResponse:
+    chunks = csv_chunks if export_format == "csv" else ndjson_chunks
+    return StreamingResponse(
+        chunks(rows, fields),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
@@ -0,0 +1,29 @@
+import hashlib
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Меняется при изменении формата ответов API, чтобы сбросить сохраненные ETag
+API_ETAG_VERSION = "1"
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # Слабое сравнение (RFC 9110, 13.1.2)
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+def make_etag(*parts) -> str:
+    # Слабый валидатор: JSON может отличаться побайтно, но совпадать по смыслу
+    raw = "|".join(str(part) for part in (API_ETAG_VERSION, *parts))
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Возвращает 304, если клиент уже имеет это представление; иначе ставит ETag в ответ."""
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
+    return None
@@ -0,0 +1,121 @@
+"""
+Производные изображения (миниатюры и WebP-превью) для фото заказов.
+
+Обработка выполняется в пуле процессов, чтобы декодирование больших фото не
+блокировало event loop. EXIF в производные файлы не копируется (ориентация
+применяется к пикселям заранее).
+
+Пересоздать производные для всех уже загруженных фото из директории backend:
+    python images.py
+"""
+import asyncio
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from database import settings
+import uploads
+
+# Имя варианта -> максимальный размер (ширина, высота)
+IMAGE_VARIANTS = {
+    "thumb": (320, 320),
+    "preview": (1280, 1280),
+}
+WEBP_QUALITY = 80
+
+# Предел размера изображения в пикселях (около 12000x8000). Больше - отклоняем,
+# не декодируя: иначе небольшой файл может распаковаться в гигабайты памяти
+MAX_IMAGE_PIXELS = 100_000_000
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def variant_filename(filename: str, variant: str) -> str:
+    return f"{filename}.{variant}.webp"
+
+def is_variant(filename: str) -> bool:
+    return any(filename.endswith(f".{variant}.webp") for variant in IMAGE_VARIANTS)
+
+def photo_variants(filename: Optional[str]) -> Optional[dict]:
+    if not filename:
+        return None
+    return {variant: variant_filename(filename, variant) for variant in IMAGE_VARIANTS}
+
+def render_variants(source_path: str, upload_dir: str, filename: str) -> dict:
+    # Выполняется в дочернем процессе; превышение MAX_IMAGE_PIXELS - ошибка, а не предупреждение
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+        return _render_variants(source_path, upload_dir, filename)
+
+def decode_image(source_path: str) -> Image.Image:
+    """Декодированное изображение с примененной ориентацией; ValueError - файл не читается как изображение."""
+    try:
+        with Image.open(source_path) as image:
+            image = ImageOps.exif_transpose(image)
+            image.load()
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            return image
+    except (UnidentifiedImageError, Image.DecompressionBombError, Image.DecompressionBombWarning, SyntaxError) as e:
+        raise ValueError(f"Cannot decode image: {e}")
+    except OSError as e:
+        # Ошибки декодера PIL (обрезанный файл, поврежденные данные) - OSError без errno;
+        # ошибки чтения с диска (errno задан) - не вина клиента
+        if e.errno is not None:
+            raise
+        raise ValueError(f"Cannot decode image: {e}")
+
+def _render_variants(source_path: str, upload_dir: str, filename: str) -> dict:
+    image = decode_image(source_path)
+    result = {}
+    # Ошибки записи (нет места, нет прав) не перехватываются - это 500, а не "плохой файл"
+    for variant, size in IMAGE_VARIANTS.items():
+        copy = image.copy()
+        copy.thumbnail(size, Image.LANCZOS)
+        name = variant_filename(filename, variant)
+        temp_path = os.path.join(upload_dir, f".{name}.tmp")
+        copy.save(temp_path, format="WEBP", quality=WEBP_QUALITY, method=4)
+        os.replace(temp_path, os.path.join(upload_dir, name))
+        result[variant] = name
+    return result
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.image_workers)
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+async def generate_variants(filename: str) -> dict:
+    """Создает варианты фото; ValueError - файл не декодируется, OSError - ошибка записи."""
+    source_path = os.path.join(uploads.UPLOAD_DIR, filename)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), render_variants, source_path, uploads.UPLOAD_DIR, filename)
+
+async def rebuild_all():
+    names = sorted(
+        entry.name for entry in os.scandir(uploads.UPLOAD_DIR)
+        if entry.is_file()
+        and not entry.name.startswith(".")
+        and Path(entry.name).suffix.lower() in uploads.ALLOWED_EXTENSIONS
+        and not is_variant(entry.name)
+    )
+    for name in names:
+        try:
+            await generate_variants(name)
+            print(f"[images] {name}: ok")
+        except ValueError as e:
+            print(f"[images] {name}: skipped ({e})")
+    shutdown_executor()
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_all())
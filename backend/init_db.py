@@ -1,42 +1,44 @@
 import asyncio
+import logging
 import os
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import select
-from database import Base, settings
+from database import settings, build_engine
+from migrations import run_migrations
 from models import User, UserRole
+from passwords import hash_password_async, verify_password_async
+
+logger = logging.getLogger(__name__)
 
 async def init_users():
     # Используем переменную окружения для URL базы данных
     from database import settings
     
-    print(f"[init_db] Starting database initialization...")
-    print(f"[init_db] Database URL: {settings.database_url}")
+    logger.info("Starting database initialization")
     
     # Создаем директорию для БД, если её нет (только если путь абсолютный)
     db_path = settings.database_url.replace('sqlite+aiosqlite:///', '')
-    print(f"[init_db] Database path: {db_path}")
+    logger.info("Database path", extra={"path": db_path})
     
     if db_path.startswith('/'):
         # Абсолютный путь
         db_dir = os.path.dirname(db_path)
-        print(f"[init_db] Database directory: {db_dir}")
         if db_dir and not os.path.exists(db_dir):
             try:
                 os.makedirs(db_dir, exist_ok=True)
-                print(f"[init_db] Created directory: {db_dir}")
+                logger.info("Created database directory", extra={"path": db_dir})
             except OSError as e:
                 # Если не можем создать (например, диск еще не смонтирован), пропускаем
                 # Директория будет создана автоматически при монтировании диска
-                print(f"[init_db] Warning: Could not create directory {db_dir}: {e}")
+                logger.warning("Could not create database directory", extra={"path": db_dir, "error": str(e)})
     
     try:
-        engine = create_async_engine(settings.database_url)
-        print(f"[init_db] Engine created")
+        engine = build_engine(settings.database_url, pool_mode="null")
         
         async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        print(f"[init_db] Tables created")
+            applied = await conn.run_sync(run_migrations)
+        logger.info("Migrations applied", extra={"versions": applied})
 
         AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -59,30 +61,31 @@ async def init_users():
                 existing_user = result.scalar_one_or_none()
 
                 if not existing_user:
-                    # Create new user - пароль хранится в открытом виде для простоты
                     user = User(
                         username=user_data["username"],
-                        hashed_password=user_data["password"],  # Просто храним пароль без шифрования
+                        hashed_password=await hash_password_async(user_data["password"]),
                         role=user_data["role"]
                     )
                     session.add(user)
                     created_count += 1
-                    print(f"[init_db] Created user: {user_data['username']} (role: {user_data['role'].value})")
+                    logger.info("Created user", extra={"username": user_data["username"], "role": user_data["role"].value})
                 else:
-                    # Update existing user password - обновляем пароль в открытом виде
-                    existing_user.hashed_password = user_data["password"]  # Просто храним пароль без шифрования
+                    # Пароль сбрасывается на стандартный; совпадающий актуальный хеш не пересчитывается
+                    password_valid, new_hash = await verify_password_async(user_data["password"], existing_user.hashed_password)
+                    if not password_valid:
+                        new_hash = await hash_password_async(user_data["password"])
+                    if new_hash is not None:
+                        existing_user.hashed_password = new_hash
                     existing_user.is_active = True  # Ensure user is active
                     if existing_user.role != user_data["role"]:
                         existing_user.role = user_data["role"]
                     updated_count += 1
-                    print(f"[init_db] Updated user: {user_data['username']} (role: {user_data['role'].value}, password reset)")
+                    logger.info("Updated user, password reset", extra={"username": user_data["username"], "role": user_data["role"].value})
 
             await session.commit()
-            print(f"[init_db] Database initialized: {created_count} new users created, {updated_count} users updated, {len(users_data)} total users")
-    except Exception as e:
-        print(f"[init_db] ERROR during initialization: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+            logger.info("Database initialized", extra={"created": created_count, "updated": updated_count, "total": len(users_data)})
+    except Exception:
+        logger.exception("Database initialization failed")
         raise
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+"""
+Журналирование: структурированные JSON-записи через очередь и фоновый поток.
+
+Обработчики запросов не пишут в stdout сами: QueueHandler кладет запись в
+очередь (форматирование сообщения и только), а вывод и сериализацию в JSON
+делает поток QueueListener. Медленный stdout (контейнер, pipe) больше не
+останавливает цикл событий.
+
+Запись - одна строка JSON: время (UTC), уровень, логгер, сообщение и поля
+из extra={...}. Уровни задаются общим LOG_LEVEL и по логгерам в LOG_LEVELS
+("requests=WARNING,routers.auth=DEBUG"). Журнал запросов (логгер "requests")
+выборочный: INFO-записи пишутся с долей LOG_REQUEST_SAMPLE_RATE, медленные
+запросы и ошибки - всегда.
+"""
+import atexit
+import copy
+import logging
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import orjson
+
+from database import settings
+
+request_logger = logging.getLogger("requests")
+
+# Атрибуты LogRecord; все остальные пришли из extra и попадают в JSON как поля
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+class PreparedQueueHandler(QueueHandler):
+    """Кладет в очередь запись с готовым сообщением и текстом исключения.
+
+    Стандартный QueueHandler форматирует запись целиком в вызывающем потоке;
+    здесь там остается только подстановка аргументов (они могут измениться
+    позже), а JSON собирает поток вывода.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class SampleFilter(logging.Filter):
+    """Пропускает долю rate записей ниже WARNING; WARNING и выше - всегда."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+def parse_levels(value: str) -> dict:
+    levels = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging(stream=None) -> QueueListener:
+    """Настраивает корневой логгер на очередь и запускает поток вывода (повторный вызов - без изменений)."""
+    global _listener
+    if _listener is not None:
+        return _listener
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(PreparedQueueHandler(log_queue))
+    root.setLevel(settings.log_level.upper())
+    for name, level in parse_levels(settings.log_levels).items():
+        logging.getLogger(name).setLevel(level)
+    for old_filter in list(request_logger.filters):
+        request_logger.removeFilter(old_filter)
+    request_logger.addFilter(SampleFilter(settings.log_request_sample_rate))
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Записи, оставшиеся в очереди при выходе, дописываются
+    atexit.register(shutdown_logging)
+    return _listener
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class RequestLogMiddleware:
+    """ASGI-middleware: одна запись на запрос в логгер "requests".
+
+    Ошибки сервера - ERROR, запросы дольше LOG_SLOW_REQUEST_SECONDS - WARNING
+    (обе не попадают под выборку), остальные - INFO.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Журнал запросов отключен полностью - без замеров
+        if scope["type"] != "http" or not request_logger.isEnabledFor(logging.ERROR):
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            if status >= 500:
+                level = logging.ERROR
+            elif duration >= settings.log_slow_request_seconds:
+                level = logging.WARNING
+            else:
+                level = logging.INFO
+            if request_logger.isEnabledFor(level):
+                request_logger.log(level, "request", extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 2),
+                })
@@ -1,49 +1,67 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from database import create_tables
-from routers import auth, orders
+from routers import auth, orders, reports
 import uvicorn
 import os
-import urllib.parse
 import logging
+from logging_config import RequestLogMiddleware, setup_logging
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-class CustomStaticFiles(StaticFiles):
-    async def get_response(self, path: str, scope):
-        # Декодируем URL-кодированные пути
-        decoded_path = urllib.parse.unquote(path)
-        return await super().get_response(decoded_path, scope)
+# Журналирование: JSON-записи через очередь, вывод в фоновом потоке
+setup_logging()
+logger = logging.getLogger("main")
 
+import asyncio
 from contextlib import asynccontextmanager
 from init_db import init_users
+from uploads import UPLOAD_DIR
+from images import shutdown_executor
+from passwords import shutdown_executor as shutdown_password_executor
+from audit import history_writer
+from order_numbers import order_number_allocator
+from storage import run_periodic_gc
+from deadlines import deadline_scheduler
+from database import AsyncSessionLocal, engine, settings
+from metrics import CONTENT_TYPE, MetricsMiddleware, instrument_engine, registry
+import secrets
+from static_files import CustomStaticFiles
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("[main] Application startup...")
+    logger.info("Application startup")
     try:
         await create_tables()
-        print("[main] Tables created/verified")
+        logger.info("Tables created/verified")
         # Initialize database with default users
         await init_users()
-        print("[main] Database initialization completed")
-    except Exception as e:
-        print(f"[main] ERROR during startup: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        if order_number_allocator.block_size > 1:
+            # Номера из блоков, не возвращенных из-за аварийной остановки
+            await order_number_allocator.reclaim_lost()
+        logger.info("Database initialization completed")
+    except Exception:
+        logger.exception("Startup failed")
         # Не падаем, чтобы приложение могло запуститься даже если БД не готова
+    # Удаление загруженных файлов, на которые больше нет ссылок
+    gc_task = asyncio.create_task(run_periodic_gc(AsyncSessionLocal, settings.storage_gc_interval))
+    # Оповещения о сроках заказов в живую ленту
+    deadline_task = asyncio.create_task(deadline_scheduler.run(AsyncSessionLocal, orders.publish_deadline_alert))
     yield
     # Shutdown (if needed)
-    print("[main] Application shutdown")
+    gc_task.cancel()
+    deadline_task.cancel()
+    await history_writer.stop()
+    await order_number_allocator.release_unused()
+    shutdown_executor()
+    shutdown_password_executor()
+    logger.info("Application shutdown")
 
 app = FastAPI(title="CRM Furniture", version="1.0.0", lifespan=lifespan)
 
+# Время и число запросов к БД для /metrics
+instrument_engine(engine)
+
 # CORS middleware для фронтенда
 # Получаем разрешенные origins из переменной окружения или используем значения по умолчанию
 cors_origins = os.getenv(
@@ -61,18 +79,10 @@ cors_origins.extend([
 # Удаляем дубликаты
 cors_origins = list(set([origin.strip() for origin in cors_origins if origin.strip()]))
 
-print(f"[main] CORS origins configured: {cors_origins}")
+logger.info("CORS origins configured", extra={"origins": cors_origins})
 
-# Добавляем логирование всех запросов для отладки
-@app.middleware("http")
-async def log_requests(request, call_next):
-    import time
-    start_time = time.time()
-    print(f"[main] Incoming request: {request.method} {request.url.path}")
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    print(f"[main] Request processed: {request.method} {request.url.path} - {response.status_code} - {process_time:.2f}s")
-    return response
+# Журнал запросов: одна запись на запрос, выборочно (см. logging_config.py)
+app.add_middleware(RequestLogMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -80,19 +90,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag"],
 )
 
-# Serve uploaded files with custom handler for URL decoding
-# Используем persistent disk для uploads, если он доступен
-upload_dir = os.getenv("UPLOAD_DIR", "uploads")
-if os.path.exists("/app/data"):
-    upload_dir = "/app/data/uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-app.mount("/uploads", CustomStaticFiles(directory=upload_dir), name="uploads")
+# Добавлено последним - внешний слой: учитывает и время остальных middleware
+app.add_middleware(MetricsMiddleware)
+
+# Serve uploaded files with custom handler for URL decoding and HTTP caching
+app.mount("/uploads", CustomStaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(orders.router, prefix="/api/orders", tags=["orders"])
+app.include_router(reports.router, prefix="/api/reports", tags=["reports"])
 
 @app.get("/")
 async def root():
@@ -102,6 +112,16 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    # Метрики в формате Prometheus; при заданном METRICS_TOKEN - только с ним
+    if settings.metrics_token:
+        expected = f"Bearer {settings.metrics_token}"
+        if not secrets.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # Логгеры uvicorn пишут через общую очередь; журнал доступа заменяет RequestLogMiddleware
+    uvicorn.run(app, host="0.0.0.0", port=port, log_config=None, access_log=False)
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+Метрики приложения в текстовом формате Prometheus (GET /metrics).
+
+- http_requests_in_flight - запросы в обработке по методу;
+- http_request_duration_seconds - гистограмма времени запросов по методу,
+  шаблону маршрута (/api/orders/{order_id}, а не конкретный путь) и статусу;
+- db_query_duration_seconds, db_query_errors_total - запросы к БД по типу
+  (select/insert/update/delete/other), из событий движка SQLAlchemy;
+- db_pool_* - состояние пула соединений на момент чтения метрик;
+- upload_size_bytes - размеры принятых загрузок.
+
+Без внешних зависимостей: метрика - словарь "значения меток -> числа",
+наблюдение - поиск корзины bisect и пара сложений (единицы микросекунд).
+Обновления идут из потока цикла событий (события движка async SQLAlchemy
+тоже вызываются в нем), поэтому блокировки не нужны. Как и лента событий,
+метрики считаются в пределах одного процесса.
+"""
+import bisect
+import time
+
+from sqlalchemy import event
+
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+UPLOAD_BUCKETS = tuple(2 ** power for power in range(14, 25))  # 16 КиБ .. 16 МиБ
+QUERY_KINDS = {"SELECT": "select", "INSERT": "insert", "UPDATE": "update", "DELETE": "delete"}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.values = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, format_labels(self.labels, labels), value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, labels: tuple, value: float):
+        self.values[labels] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple, buckets: tuple):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.buckets = tuple(buckets)
+        # Метки -> [количество по корзинам (последняя - +Inf), сумма, количество]
+        self.values = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", format_labels(self.labels, labels, f'le="{format_value(bound)}"'), cumulative
+            yield f"{self.name}_sum", format_labels(self.labels, labels), total
+            yield f"{self.name}_count", format_labels(self.labels, labels), count
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # Значения, которые читаются только в момент запроса метрик (пул соединений)
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed.", ("method",)
+))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status.",
+    ("method", "route", "status"), REQUEST_BUCKETS,
+))
+query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Database statement execution time.", ("kind",), QUERY_BUCKETS
+))
+query_errors = registry.register(Counter(
+    "db_query_errors_total", "Database statements that raised an error.", ("kind",)
+))
+pool_connections = registry.register(Gauge(
+    "db_pool_connections", "Connections in the pool by state.", ("state",)
+))
+upload_size = registry.register(Histogram(
+    "upload_size_bytes", "Size of accepted file uploads.", (), UPLOAD_BUCKETS
+))
+
+def route_label(scope: dict) -> str:
+    """Шаблон маршрута запроса: конкретные пути не раздувают число серий."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope.get("root_path"):
+        # Смонтированное приложение (/uploads): Mount записывает свой путь в root_path
+        return scope["root_path"] + "/{path}"
+    return "unmatched"
+
+class MetricsMiddleware:
+    """ASGI-middleware: время и статус каждого HTTP-запроса, запросы в обработке."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = (scope["method"],)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        requests_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec(method)
+            request_duration.observe((method[0], route_label(scope), str(status)), time.perf_counter() - start)
+
+def query_kind(statement: str) -> tuple:
+    return (QUERY_KINDS.get(statement.lstrip()[:6].upper(), "other"),)
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is not None:
+        query_duration.observe(query_kind(statement), time.perf_counter() - start)
+
+def handle_error(exception_context):
+    query_errors.inc(query_kind(exception_context.statement or ""))
+
+def instrument_engine(async_engine):
+    """Подключает учет запросов и состояния пула к движку (один раз при запуске)."""
+    sync_engine = async_engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(sync_engine, "handle_error", handle_error)
+
+    def collect_pool():
+        pool = sync_engine.pool
+        # У NullPool нет постоянных соединений, считать нечего
+        if hasattr(pool, "checkedout"):
+            pool_connections.set(("checked_out",), pool.checkedout())
+            pool_connections.set(("idle",), pool.checkedin())
+            pool_connections.set(("overflow",), max(pool.overflow(), 0))
+            pool_connections.set(("size",), pool.size())
+
+    registry.collectors.append(collect_pool)
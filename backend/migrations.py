@@ -0,0 +1,169 @@
+"""
+Версионированные миграции схемы БД.
+
+Модели в models.py описывают актуальную схему: на пустой БД миграция 1 создает
+все таблицы и индексы сразу. Остальные миграции доводят до той же схемы уже
+существующие БД, поэтому каждая из них идемпотентна (проверяет, что изменение
+еще не применено). Примененные версии хранятся в таблице schema_migrations.
+
+Запуск вручную из директории backend:
+    python migrations.py            # применить новые миграции
+    python migrations.py --status   # показать примененные версии
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, inspect, insert, select, text, update
+
+from database import Base, engine
+import models
+
+migrations_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migrations_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+def migration(version: int, name: str):
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return fn
+    return register
+
+# Helper functions
+def add_column_if_missing(conn, table_name: str, column_name: str, column_ddl: str):
+    columns = {column["name"] for column in inspect(conn).get_columns(table_name)}
+    if column_name not in columns:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}"))
+
+def create_index_if_missing(conn, index):
+    index.create(conn, checkfirst=True)
+
+def create_table_if_missing(conn, table):
+    table.create(conn, checkfirst=True)
+
+def order_index(name: str):
+    # Индекс из актуальной модели; миграция создает только свой индекс, а не все
+    # (более поздние могут ссылаться на столбцы, которых еще нет)
+    return next(index for index in models.Order.__table__.indexes if index.name == name)
+
+@migration(1, "initial_schema")
+def initial_schema(conn):
+    Base.metadata.create_all(conn)
+
+@migration(2, "users_token_version")
+def users_token_version(conn):
+    add_column_if_missing(conn, "users", "token_version", "INTEGER NOT NULL DEFAULT 0")
+
+@migration(3, "order_query_indexes")
+def order_query_indexes(conn):
+    # MAX(order_number) уже обслуживается уникальным индексом на orders.order_number
+    for name in ("ix_orders_status_created_at", "ix_orders_status_deadline", "ix_orders_created_at"):
+        create_index_if_missing(conn, order_index(name))
+    for index in models.OrderEditHistory.__table__.indexes:
+        create_index_if_missing(conn, index)
+
+@migration(4, "stored_files")
+def stored_files(conn):
+    create_table_if_missing(conn, models.StoredFile.__table__)
+
+@migration(5, "order_sync")
+def order_sync(conn):
+    create_table_if_missing(conn, models.OrderTombstone.__table__)
+    create_index_if_missing(conn, order_index("ix_orders_updated_at"))
+
+@migration(6, "order_number_allocator")
+def order_number_allocator(conn):
+    from order_numbers import seed_counter
+    create_table_if_missing(conn, models.OrderNumberCounter.__table__)
+    create_table_if_missing(conn, models.FreeOrderNumber.__table__)
+    seed_counter(conn)
+
+@migration(7, "stored_files_released_at")
+def stored_files_released_at(conn):
+    add_column_if_missing(conn, "stored_files", "released_at", "DATETIME")
+
+@migration(8, "order_deadline_index")
+def order_deadline_index(conn):
+    create_index_if_missing(conn, order_index("ix_orders_deadline"))
+
+@migration(9, "report_summaries")
+def report_summaries(conn):
+    from analytics import rebuild_summaries
+    add_column_if_missing(conn, "orders", "status_changed_at", "DATETIME")
+    for table in (
+        models.OrderStatusCount.__table__,
+        models.OrderRevenue.__table__,
+        models.OrderStatusTransition.__table__,
+        models.OrderDeadlineBucket.__table__,
+    ):
+        create_table_if_missing(conn, table)
+    rebuild_summaries(conn)
+
+@migration(10, "order_search_index")
+def order_search_index(conn):
+    from search import create_search_index
+    create_search_index(conn)
+
+@migration(11, "order_phone_key")
+def order_phone_key(conn):
+    from phones import normalize_phone
+    add_column_if_missing(conn, "orders", "phone_key", "VARCHAR")
+    orders = models.Order.__table__
+    rows = conn.execute(select(orders.c.id, orders.c.customer_phone).where(orders.c.phone_key.is_(None))).all()
+    if rows:
+        conn.execute(
+            update(orders)
+            .where(orders.c.id == bindparam("order_id"))
+            # updated_at указан явно, чтобы не сработал onupdate
+            .values(phone_key=bindparam("key"), updated_at=orders.c.updated_at),
+            [{"order_id": order_id, "key": normalize_phone(phone)} for order_id, phone in rows],
+        )
+    create_index_if_missing(conn, order_index("ix_orders_phone_key"))
+
+def applied_versions(conn) -> set:
+    migrations_metadata.create_all(conn)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+def run_migrations(conn) -> list:
+    done = applied_versions(conn)
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        fn(conn)
+        conn.execute(insert(schema_migrations).values(
+            version=version,
+            name=name,
+            applied_at=datetime.now(timezone.utc),
+        ))
+        applied.append(version)
+    return applied
+
+async def migrate(target_engine=None) -> list:
+    async with (target_engine or engine).begin() as conn:
+        return await conn.run_sync(run_migrations)
+
+async def main(argv):
+    try:
+        if "--status" in argv:
+            async with engine.connect() as conn:
+                done = await conn.run_sync(applied_versions)
+            for version, name, _ in MIGRATIONS:
+                print(f"{version:04d} {name}: {'applied' if version in done else 'pending'}")
+        else:
+            applied = await migrate()
+            print(f"Applied migrations: {applied or 'none'}")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
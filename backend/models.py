@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Float, Boolean, ForeignKey, Enum, Index
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime, timezone
 import enum
 from database import Base
+from phones import normalize_phone
 
 class UserRole(str, enum.Enum):
     admin = "admin"
@@ -25,6 +26,7 @@ class User(Base):
     hashed_password = Column(String)
     role = Column(Enum(UserRole), nullable=False)
     is_active = Column(Boolean, default=True)
+    token_version = Column(Integer, nullable=False, default=0)  # Увеличивается для отзыва выданных токенов
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
 class Order(Base):
@@ -34,18 +36,20 @@ class Order(Base):
     order_number = Column(Integer, unique=True, nullable=True)  # 1-9999, присваивается при подтверждении
     customer_name = Column(String, nullable=False)
     customer_phone = Column(String, nullable=False)
+    phone_key = Column(String, nullable=True)  # Нормализованный телефон (phones.py) для поиска клиента
     customer_address = Column(Text, nullable=False)
     phone_agreement_notes = Column(Text, nullable=True)
     customer_requirements = Column(Text, nullable=True)
     deadline = Column(DateTime, nullable=True)
     price = Column(Integer, nullable=True)
-    material_photo = Column(String, nullable=True)  # Путь к файлу
-    furniture_photo = Column(String, nullable=True)  # Путь к файлу
+    material_photo = Column(String, nullable=True)  # Имя файла в stored_files
+    furniture_photo = Column(String, nullable=True)  # Имя файла в stored_files
     status = Column(Enum(OrderStatus), default=OrderStatus.draft)
     created_by = Column(Integer, ForeignKey("users.id"))
     updated_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    status_changed_at = Column(DateTime, nullable=True)  # Когда заказ перешел в текущий статус (для отчетов)
 
     # Relationships
     creator = relationship("User", foreign_keys=[created_by])
@@ -54,6 +58,24 @@ class Order(Base):
     # History of edits
     edit_history = relationship("OrderEditHistory", back_populates="order")
 
+    # Индексы под запросы списка заказов (фильтр по статусу + сортировка/курсор).
+    # rowid (id) неявно входит последним столбцом в каждый индекс SQLite, поэтому
+    # (status, created_at) обслуживает и ORDER BY created_at, id
+    __table_args__ = (
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        Index("ix_orders_status_deadline", "status", "deadline"),
+        Index("ix_orders_created_at", "created_at"),
+        Index("ix_orders_deadline", "deadline"),
+        Index("ix_orders_updated_at", "updated_at"),
+        Index("ix_orders_phone_key", "phone_key"),
+    )
+
+    @validates("customer_phone")
+    def _update_phone_key(self, key, value):
+        # Ключ пересчитывается при любом присваивании телефона через ORM
+        self.phone_key = normalize_phone(value)
+        return value
+
 class OrderEditHistory(Base):
     __tablename__ = "order_edit_history"
 
@@ -66,4 +88,74 @@ class OrderEditHistory(Base):
 
     # Relationships
     order = relationship("Order", back_populates="edit_history")
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+    __table_args__ = (
+        Index("ix_order_edit_history_order_id_timestamp", "order_id", "timestamp"),
+    )
+
+class OrderTombstone(Base):
+    """След удаленного заказа для дельта-синхронизации клиентов."""
+    __tablename__ = "order_tombstones"
+
+    order_id = Column(Integer, primary_key=True)
+    deleted_at = Column(DateTime, nullable=False, index=True)
+    deleted_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+class OrderNumberCounter(Base):
+    """Счетчик номеров заказов: next_value - следующий еще не выдававшийся номер."""
+    __tablename__ = "order_number_counter"
+
+    name = Column(String, primary_key=True)
+    next_value = Column(Integer, nullable=False)
+    wrapped_at = Column(DateTime, nullable=True)  # Когда новые номера закончились и выдаются только освобожденные
+
+class FreeOrderNumber(Base):
+    """Освобожденный номер заказа (ниже next_value), который можно выдать повторно."""
+    __tablename__ = "free_order_numbers"
+
+    number = Column(Integer, primary_key=True)
+
+class StoredFile(Base):
+    """Загруженный файл, адресуемый по содержимому ({sha256}{ext}), со счетчиком ссылок из заказов."""
+    __tablename__ = "stored_files"
+
+    filename = Column(String, primary_key=True)
+    sha256 = Column(String, nullable=False, index=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    released_at = Column(DateTime, nullable=True)  # Когда ref_count стал 0; файл удаляет сборщик мусора
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+# Сводные таблицы отчетов: обновляются в транзакции каждого изменения заказа
+# (analytics.track_order_change), пересчитываются командой python analytics.py --rebuild
+class OrderStatusCount(Base):
+    __tablename__ = "report_status_counts"
+
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class OrderRevenue(Base):
+    """Сумма цен заказов по неделе/месяцу создания заказа."""
+    __tablename__ = "report_revenue"
+
+    period = Column(String, primary_key=True)  # "week" или "month"
+    period_start = Column(Date, primary_key=True)
+    revenue = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+
+class OrderStatusTransition(Base):
+    """Количество переходов между статусами и суммарное время в исходном статусе."""
+    __tablename__ = "report_status_transitions"
+
+    from_status = Column(String, primary_key=True)
+    to_status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total_seconds = Column(Float, nullable=False, default=0)
+
+class OrderDeadlineBucket(Base):
+    """Количество незавершенных (не доставленных) заказов по дню срока."""
+    __tablename__ = "report_deadline_buckets"
+
+    day = Column(Date, primary_key=True)
+    open_count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,223 @@
+"""
+Выдача номеров заказов (1-9999) без гонок и без MAX(order_number).
+
+Состояние хранится в БД:
+- order_number_counter.next_value - следующий еще не выдававшийся номер.
+  Увеличивается одним UPDATE ... RETURNING, поэтому два параллельных
+  подтверждения не получат один номер;
+- free_order_numbers - номера удаленных заказов и номера, замененные
+  администратором вручную.
+
+Сначала выдаются новые номера по порядку. Когда они заканчиваются (9999),
+в счетчике отмечается wrapped_at и выдача переходит к освобожденным номерам,
+начиная с меньшего. Если свободных номеров нет - OrderNumbersExhausted.
+
+При ORDER_NUMBER_BLOCK_SIZE > 1 процесс резервирует номера блоками в отдельной
+короткой транзакции и раздает их из памяти (меньше конкуренции за запись).
+Резервирование идет через отдельное соединение вне пула запросов и
+выполняется одним запросом за раз. Невыданные номера блока возвращаются в
+free_order_numbers при остановке; после аварийной остановки они возвращаются
+при следующем запуске (reclaim_lost_numbers). Возврат при запуске рассчитан
+на один процесс приложения: при нескольких воркерах он может вернуть номера
+из блока, который держит другой воркер (номер, уже занятый заказом, при
+выдаче все равно пропускается).
+"""
+import asyncio
+import bisect
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from sqlalchemy.orm import sessionmaker
+
+from database import build_engine, settings
+from models import FreeOrderNumber, Order, OrderNumberCounter
+
+logger = logging.getLogger(__name__)
+
+ORDER_NUMBER_MIN = 1
+ORDER_NUMBER_MAX = 9999
+COUNTER_NAME = "orders"
+
+class OrderNumbersExhausted(Exception):
+    pass
+
+def seed_counter(conn):
+    # Вызывается из миграции (синхронное соединение): продолжаем нумерацию после
+    # существующих заказов, пропуски в ней становятся свободными номерами
+    if conn.execute(select(OrderNumberCounter.name).where(OrderNumberCounter.name == COUNTER_NAME)).first():
+        return
+    used = set(conn.execute(select(Order.order_number).where(Order.order_number.is_not(None))).scalars())
+    next_value = min(max(used, default=0) + 1, ORDER_NUMBER_MAX + 1)
+    conn.execute(insert(OrderNumberCounter).values(name=COUNTER_NAME, next_value=next_value))
+    gaps = [number for number in range(ORDER_NUMBER_MIN, next_value) if number not in used]
+    if gaps:
+        conn.execute(insert(FreeOrderNumber), [{"number": number} for number in gaps])
+
+async def reclaim_lost_numbers(db: AsyncSession) -> list:
+    """Возвращает в free_order_numbers выданные счетчиком номера, которых нет
+    ни у одного заказа и ни в списке свободных (блок потерян при аварии). Без коммита."""
+    next_value = await db.scalar(select(OrderNumberCounter.next_value).where(OrderNumberCounter.name == COUNTER_NAME))
+    if next_value is None:
+        return []
+    known = set((await db.execute(select(Order.order_number).where(Order.order_number.is_not(None)))).scalars())
+    known.update((await db.execute(select(FreeOrderNumber.number))).scalars())
+    lost = [number for number in range(ORDER_NUMBER_MIN, min(next_value, ORDER_NUMBER_MAX + 1)) if number not in known]
+    if lost:
+        await db.execute(sqlite_insert(FreeOrderNumber).on_conflict_do_nothing(), [{"number": number} for number in lost])
+        logger.warning("Reclaimed order numbers lost by a previous run", extra={"count": len(lost)})
+    return lost
+
+async def unused_numbers(db: AsyncSession, numbers: list) -> list:
+    # Номер мог быть назначен заказу вручную - такие пропускаем
+    if not numbers:
+        return []
+    taken = set((await db.execute(select(Order.order_number).where(Order.order_number.in_(numbers)))).scalars())
+    return [number for number in numbers if number not in taken]
+
+async def take_from_counter(db: AsyncSession, count: int) -> list:
+    # После исчерпания next_value может оказаться больше ORDER_NUMBER_MAX + 1 - это не мешает
+    next_value = (await db.execute(
+        update(OrderNumberCounter)
+        .where(OrderNumberCounter.name == COUNTER_NAME, OrderNumberCounter.next_value <= ORDER_NUMBER_MAX)
+        .values(next_value=OrderNumberCounter.next_value + count)
+        .returning(OrderNumberCounter.next_value)
+    )).scalar_one_or_none()
+    if next_value is None:
+        return []
+    if next_value > ORDER_NUMBER_MAX:
+        await db.execute(
+            update(OrderNumberCounter)
+            .where(OrderNumberCounter.name == COUNTER_NAME)
+            .values(wrapped_at=datetime.now(timezone.utc))
+        )
+        logger.warning("All order numbers are used, switching to freed numbers", extra={"max": ORDER_NUMBER_MAX})
+    return list(range(next_value - count, min(next_value, ORDER_NUMBER_MAX + 1)))
+
+async def take_from_free_list(db: AsyncSession, count: int) -> list:
+    return sorted((await db.execute(
+        delete(FreeOrderNumber)
+        .where(FreeOrderNumber.number.in_(
+            select(FreeOrderNumber.number).order_by(FreeOrderNumber.number).limit(count).scalar_subquery()
+        ))
+        .returning(FreeOrderNumber.number)
+    )).scalars())
+
+async def take_numbers(db: AsyncSession, count: int, partial: bool = False) -> list:
+    """Забирает count номеров в транзакции db (без коммита).
+
+    Если номеров не хватает: при partial=True возвращает сколько есть,
+    иначе (или если нет ни одного) - OrderNumbersExhausted.
+    """
+    numbers = []
+    for source in (take_from_counter, take_from_free_list):
+        while len(numbers) < count:
+            candidates = await source(db, count - len(numbers))
+            if not candidates:
+                break
+            numbers += await unused_numbers(db, candidates)
+    if not numbers or (len(numbers) < count and not partial):
+        logger.error("No free order numbers left", extra={"min": ORDER_NUMBER_MIN, "max": ORDER_NUMBER_MAX})
+        raise OrderNumbersExhausted(f"No free order numbers left ({ORDER_NUMBER_MIN}-{ORDER_NUMBER_MAX})")
+    return numbers
+
+async def free_number(db: AsyncSession, number):
+    # Номера не ниже next_value счетчик еще выдаст сам
+    if number is None:
+        return
+    next_value = await db.scalar(select(OrderNumberCounter.next_value).where(OrderNumberCounter.name == COUNTER_NAME))
+    if next_value is not None and number < next_value:
+        await db.execute(sqlite_insert(FreeOrderNumber).values(number=number).on_conflict_do_nothing())
+
+async def claim_number(db: AsyncSession, number: int):
+    # Номер, назначенный вручную, больше не свободен
+    await db.execute(delete(FreeOrderNumber).where(FreeOrderNumber.number == number))
+
+class OrderNumberAllocator:
+    def __init__(self, block_size: int, session_factory=None):
+        self.block_size = block_size
+        self._session_factory = session_factory
+        self._reserved = []
+        self._refill_lock = None
+
+    @property
+    def reserved_count(self) -> int:
+        return len(self._reserved)
+
+    @property
+    def session_factory(self):
+        # Отдельное соединение без пула: запрос, вызвавший резервирование, уже держит
+        # соединение из пула запросов, и второе из того же пула может не освободиться
+        if self._session_factory is None:
+            reserve_engine = build_engine(settings.database_url, pool_mode="null")
+            self._session_factory = sessionmaker(bind=reserve_engine, class_=AsyncSession, expire_on_commit=False)
+        return self._session_factory
+
+    def refill_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._refill_lock is None or self._refill_lock[0] is not loop:
+            self._refill_lock = (loop, asyncio.Lock())
+        return self._refill_lock[1]
+
+    async def reserve_block(self):
+        async with self.session_factory() as session:
+            block = await take_numbers(session, self.block_size, partial=True)
+            await session.commit()
+        for number in block:
+            bisect.insort(self._reserved, number)
+
+    async def reclaim_lost(self):
+        async with self.session_factory() as session:
+            await reclaim_lost_numbers(session)
+            await session.commit()
+
+    async def allocate(self, db: AsyncSession) -> int:
+        if self.block_size <= 1:
+            # Номер берется в транзакции запроса и возвращается при ее откате
+            return (await take_numbers(db, 1))[0]
+        while True:
+            if not self._reserved:
+                # Блок пополняет один запрос, остальные ждут его результата
+                async with self.refill_lock():
+                    if not self._reserved:
+                        await self.reserve_block()
+            number = self._reserved.pop(0)
+            if await unused_numbers(db, [number]):
+                return number
+
+    def discard(self, number: int):
+        # Вызывается, если транзакция с выданным номером не закоммитилась
+        if self.block_size > 1:
+            bisect.insort(self._reserved, number)
+
+    async def release_unused(self):
+        if not self._reserved:
+            return
+        numbers, self._reserved = self._reserved, []
+        async with self.session_factory() as session:
+            for number in numbers:
+                await free_number(session, number)
+            await session.commit()
+
+    async def status(self, db: AsyncSession) -> dict:
+        counter = await db.get(OrderNumberCounter, COUNTER_NAME)
+        free_count = await db.scalar(select(func.count()).select_from(FreeOrderNumber))
+        never_issued = max(ORDER_NUMBER_MAX + 1 - counter.next_value, 0)
+        remaining = never_issued + free_count + len(self._reserved)
+        return {
+            "min_number": ORDER_NUMBER_MIN,
+            "max_number": ORDER_NUMBER_MAX,
+            "next_value": counter.next_value if never_issued else None,
+            "never_issued": never_issued,
+            "free_count": free_count,
+            "reserved_in_process": len(self._reserved),
+            "remaining": remaining,
+            "wrapped": counter.wrapped_at is not None,
+            "wrapped_at": counter.wrapped_at.isoformat() if counter.wrapped_at else None,
+            "exhausted": remaining == 0,
+        }
+
+order_number_allocator = OrderNumberAllocator(settings.order_number_block_size)
@@ -0,0 +1,90 @@
+"""
+Хеширование паролей пользователей (bcrypt).
+
+bcrypt намеренно медленный (сотни миллисекунд при стоимости 12), поэтому
+проверка и хеширование выполняются в отдельном пуле потоков ограниченного
+размера (PASSWORD_HASH_WORKERS): цикл событий не блокируется, а поток
+попыток входа занимает не больше этого числа ядер - остальные запросы
+продолжают обслуживаться. bcrypt отпускает GIL на время вычисления.
+
+Хеш хранит свою стоимость; при изменении PASSWORD_BCRYPT_ROUNDS пароль
+перехешируется при следующем успешном входе. Пароли, сохраненные ранее в
+открытом виде, принимаются один раз и сразу заменяются хешем.
+"""
+import asyncio
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+
+from database import settings
+
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+# bcrypt учитывает только первые 72 байта пароля; новые версии библиотеки требуют обрезать явно
+BCRYPT_MAX_BYTES = 72
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+def password_bytes(password: str) -> bytes:
+    return password.encode("utf-8")[:BCRYPT_MAX_BYTES]
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(BCRYPT_PREFIXES)
+
+def hash_rounds(stored: str) -> int:
+    # "$2b$12$<соль и хеш>"
+    return int(stored.split("$")[2])
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    salt = bcrypt.gensalt(rounds or settings.password_bcrypt_rounds)
+    return bcrypt.hashpw(password_bytes(password), salt).decode("ascii")
+
+def needs_rehash(stored: str) -> bool:
+    return not is_hashed(stored) or hash_rounds(stored) != settings.password_bcrypt_rounds
+
+def verify_password(password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """(пароль верен, новый хеш для сохранения или None)."""
+    if not stored:
+        return False, None
+    if is_hashed(stored):
+        valid = bcrypt.checkpw(password_bytes(password), stored.encode("ascii"))
+    else:
+        # Пароль в открытом виде из старых версий init_db
+        valid = hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    if valid and needs_rehash(stored):
+        return True, hash_password(password)
+    return valid, None
+
+# Хеш для проверки входа несуществующего пользователя: ответ занимает столько же
+# времени, сколько для существующего, и по нему нельзя перебирать имена
+_dummy_hash: Optional[str] = None
+
+def verify_dummy(password: str) -> Tuple[bool, None]:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password("dummy-password")
+    bcrypt.checkpw(password_bytes(password), _dummy_hash.encode("ascii"))
+    return False, None
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password")
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+async def verify_password_async(password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """verify_password в пуле потоков; stored=None - проверка для несуществующего пользователя."""
+    loop = asyncio.get_running_loop()
+    if stored is None:
+        return await loop.run_in_executor(get_executor(), verify_dummy, password)
+    return await loop.run_in_executor(get_executor(), verify_password, password, stored)
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), hash_password, password)
@@ -0,0 +1,56 @@
+"""
+Нормализация телефонов заказчиков.
+
+customer_phone хранится как введен ("8 (999) 123-45-67"), а рядом -
+phone_key: тот же номер в виде +<код страны><номер> (E.164 без пробелов
+и скобок). По индексу phone_key ищутся прошлые заказы клиента, в том
+числе по началу номера, пока оператор его набирает.
+
+Номера без "+" считаются российскими: 8XXXXXXXXXX и XXXXXXXXXX (10 цифр)
+приводятся к +7XXXXXXXXXX.
+"""
+import re
+from typing import Optional, Tuple
+
+DEFAULT_COUNTRY_CODE = "7"
+MAX_PHONE_DIGITS = 15  # E.164
+MIN_PREFIX_DIGITS = 3
+
+def phone_digits(value: Optional[str]) -> str:
+    return re.sub(r"\D", "", value or "")
+
+def normalize_phone(value: Optional[str]) -> Optional[str]:
+    """Полный номер -> phone_key (None - в номере нет цифр)."""
+    digits = phone_digits(value)
+    if not digits:
+        return None
+    if not value.lstrip().startswith("+"):
+        if len(digits) == 11 and digits[0] == "8":
+            digits = DEFAULT_COUNTRY_CODE + digits[1:]
+        elif len(digits) == 10:
+            digits = DEFAULT_COUNTRY_CODE + digits
+    return "+" + digits[:MAX_PHONE_DIGITS]
+
+def phone_key_prefix(value: Optional[str]) -> Optional[str]:
+    """Начало номера, набранное оператором -> начало phone_key.
+
+    Длина номера еще неизвестна, поэтому без "+" начало с 8 считается
+    российским выходом на код страны, а с 9 - мобильным номером без кода.
+    """
+    digits = phone_digits(value)
+    if not digits:
+        return None
+    if not value.lstrip().startswith("+"):
+        if digits[0] == "8":
+            digits = DEFAULT_COUNTRY_CODE + digits[1:]
+        elif digits[0] == "9":
+            digits = DEFAULT_COUNTRY_CODE + digits
+    return "+" + digits[:MAX_PHONE_DIGITS]
+
+def phone_key_range(prefix: str) -> Tuple[str, str]:
+    """Границы [from, to) ключей, начинающихся с prefix: поиск диапазоном по индексу.
+
+    LIKE 'prefix%' в SQLite не использует обычный индекс (регистронезависимое
+    сравнение), а ":" идет в ASCII сразу за "9".
+    """
+    return prefix, prefix + ":"
@@ -5,17 +5,28 @@ from sqlalchemy import select
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+from collections import OrderedDict, deque
+import logging
+import math
+import time
 
 from database import get_db, settings
 from models import User, UserRole
+from passwords import verify_password_async
 
 router = APIRouter()
 security = HTTPBearer()
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = settings.secret_key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Одноразового назначения токен для подписки на ленту событий: передается в URL
+# (EventSource не умеет заголовки), поэтому живет недолго и не годится для API
+STREAM_TOKEN_EXPIRE_SECONDS = 60
+EVENTS_SCOPE = "order_events"
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -26,28 +37,197 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class UserStateCache:
+    """TTL/LRU-кэш состояния пользователя (is_active, role, token_version) по id."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, user_id: int):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, state = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return state
+
+    def set(self, user_id: int, state: dict):
+        self._entries[user_id] = (time.monotonic() + self.ttl, state)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+user_state_cache = UserStateCache(ttl=settings.auth_cache_ttl, max_size=settings.auth_cache_size)
+
+class LoginAttemptLimiter:
+    """Попытки входа по имени пользователя за скользящее окно (LRU по именам).
+
+    Попытка учитывается до проверки пароля, поэтому одновременная серия
+    запросов тоже упирается в лимит; успешный вход сбрасывает счетчик.
+    """
+
+    def __init__(self, max_attempts: int, window: float, max_size: int = 10000):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def _attempts(self, username: str) -> Optional[deque]:
+        attempts = self._entries.get(username)
+        if attempts is None:
+            return None
+        expired_before = time.monotonic() - self.window
+        while attempts and attempts[0] <= expired_before:
+            attempts.popleft()
+        return attempts
+
+    def retry_after(self, username: str) -> Optional[float]:
+        """Секунды до следующей разрешенной попытки или None, если попытка разрешена."""
+        attempts = self._attempts(username)
+        if attempts is None or len(attempts) < self.max_attempts:
+            return None
+        return attempts[0] + self.window - time.monotonic()
+
+    def record(self, username: str):
+        attempts = self._attempts(username)
+        if attempts is None:
+            attempts = self._entries[username] = deque()
+        attempts.append(time.monotonic())
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def reset(self, username: str):
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._entries.clear()
+
+login_limiter = LoginAttemptLimiter(max_attempts=settings.login_max_attempts, window=settings.login_attempt_window)
+
+def user_state(user: User) -> dict:
+    return {
+        "username": user.username,
+        "role": user.role.value,
+        "is_active": bool(user.is_active),
+        "token_version": user.token_version or 0,
+    }
+
+def create_user_token(user: User) -> str:
+    return create_access_token(
+        data={
+            "sub": user.username,
+            "uid": user.id,
+            "role": user.role.value,
+            "ver": user.token_version or 0,
+        },
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+
+def create_stream_token(user: User, scope: str = EVENTS_SCOPE) -> str:
+    return create_access_token(
+        data={
+            "sub": user.username,
+            "uid": user.id,
+            "role": user.role.value,
+            "ver": user.token_version or 0,
+            "scope": scope,
+        },
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS),
+    )
+
+def state_matches_token(state: Optional[dict], payload: dict) -> bool:
+    return (
+        state is not None
+        and state["is_active"]
+        and state["token_version"] == payload.get("ver")
+        and state["role"] == payload.get("role")
+        and state["username"] == payload.get("sub")
+    )
+
+async def load_user_state(db: AsyncSession, user_id: int) -> Optional[dict]:
+    state = user_state_cache.get(user_id)
+    if state is None:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        if user is None:
+            return None
+        state = user_state(user)
+        user_state_cache.set(user_id, state)
+    return state
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
 ) -> User:
+    return await authenticate_token(credentials.credentials, db)
+
+async def authenticate_token(token: str, db: AsyncSession, scope: Optional[str] = None) -> User:
+    user, _ = await authenticate_token_payload(token, db, scope)
+    return user
+
+async def authenticate_token_payload(token: str, db: AsyncSession, scope: Optional[str] = None):
+    # Возвращает (пользователь, claims); токен с другим назначением (scope) не принимается
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    if payload.get("scope") != scope:
+        raise credentials_exception
 
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalar_one_or_none()
-    if user is None:
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Токен старого формата без id/role/ver в claims: выдан до появления token_version,
+        # поэтому любой отзыв токенов пользователя (версия > 0) делает его недействительным
+        result = await db.execute(select(User).where(User.username == username))
+        user = result.scalar_one_or_none()
+        if user is None or not user.is_active or (user.token_version or 0) != 0:
+            raise credentials_exception
+        return user, payload
+
+    # Быстрый путь: авторизация по claims и кэшу состояния, без запроса пользователя на каждый запрос
+    state = await load_user_state(db, user_id)
+    if not state_matches_token(state, payload):
         raise credentials_exception
-    return user
+
+    # Отсоединенный объект User, собранный из claims; в сессию не добавляется
+    user = User(
+        id=user_id,
+        username=username,
+        role=UserRole(state["role"]),
+        is_active=True,
+        token_version=state["token_version"],
+    )
+    return user, payload
+
+async def revoke_user_tokens(db: AsyncSession, user: User):
+    user.token_version = (user.token_version or 0) + 1
+    await db.commit()
+    user_state_cache.invalidate(user.id)
+
+async def set_user_active(db: AsyncSession, user: User, is_active: bool):
+    user.is_active = is_active
+    await db.commit()
+    user_state_cache.invalidate(user.id)
 
 async def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
     if current_user.role not in [UserRole.admin]:
@@ -75,19 +255,10 @@ async def get_current_work_user(current_user: User = Depends(get_current_user))
 
 @router.post("/login")
 async def login(username: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_db)):
-    import logging
-    logger = logging.getLogger(__name__)
-    
     # Validate input
     username_clean = username.strip() if username else ""
     password_clean = password.strip() if password else ""
     
-    # Используем print для гарантии, что логи будут видны
-    print(f"[auth] ===== LOGIN ATTEMPT =====")
-    print(f"[auth] Username: '{username_clean}'")
-    print(f"[auth] Password length: {len(password_clean)}")
-    logger.info(f"[auth] Login attempt for username: {username_clean}")
-    
     if not username_clean:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -99,49 +270,57 @@ async def login(username: str = Form(...), password: str = Form(...), db: AsyncS
             detail="Password is required"
         )
     
+    retry_after = login_limiter.retry_after(username_clean)
+    if retry_after is not None:
+        logger.warning("Login rate limited", extra={"username": username_clean})
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+    login_limiter.record(username_clean)
+
     result = await db.execute(select(User).where(User.username == username_clean))
     user = result.scalar_one_or_none()
     
     if not user:
-        print(f"[auth] ERROR: User not found: '{username_clean}'")
-        logger.warning(f"[auth] User not found: {username_clean}")
+        # Проверка с фиктивным хешем: ответ по времени не выдает, существует ли пользователь
+        await verify_password_async(password_clean, None)
+        logger.warning("Login failed: unknown user", extra={"username": username_clean})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    print(f"[auth] User found: {user.username}, stored password: '{user.hashed_password}', is_active: {user.is_active}")
-    logger.info(f"[auth] User found: {user.username}, is_active: {user.is_active}, role: {user.role}")
-    
     if not user.is_active:
-        print(f"[auth] ERROR: User account disabled: {username_clean}")
-        logger.warning(f"[auth] User account disabled: {username_clean}")
+        logger.warning("Login failed: account disabled", extra={"username": username_clean})
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is disabled"
         )
     
-    # Простая проверка пароля без шифрования - просто сравнение строк
-    password_valid = (password_clean == user.hashed_password)
-    print(f"[auth] Password check: input='{password_clean}' vs stored='{user.hashed_password}' => {password_valid}")
-    logger.info(f"[auth] Password verification result: {password_valid}")
+    # bcrypt в пуле потоков (passwords.py); new_hash - если хеш устарел или пароль хранился открыто
+    password_valid, new_hash = await verify_password_async(password_clean, user.hashed_password)
     
     if not password_valid:
-        print(f"[auth] ERROR: Invalid password for user: {username_clean}")
-        logger.warning(f"[auth] Invalid password for user: {username_clean}")
+        logger.warning("Login failed: invalid password", extra={"username": username_clean})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    print(f"[auth] ===== LOGIN SUCCESS =====")
+    login_limiter.reset(username_clean)
+    if new_hash is not None:
+        user.hashed_password = new_hash
+        await db.commit()
+        logger.info("Password hash upgraded", extra={"username": user.username})
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    logger.info("Login succeeded", extra={"username": user.username, "role": user.role.value})
+    
+    access_token = create_user_token(user)
+    user_state_cache.set(user.id, user_state(user))
     return {
         "access_token": access_token,
         "token_type": "bearer",
@@ -158,4 +337,41 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
         "id": current_user.id,
         "username": current_user.username,
         "role": current_user.role.value
-    }
\ No newline at end of file
+    }
+
+async def get_user_or_404(db: AsyncSession, user_id: int) -> User:
+    result = await db.execute(select(User).where(User.id == user_id))
+    user = result.scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+@router.post("/users/{user_id}/revoke-tokens")
+async def revoke_tokens(
+    user_id: int,
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    user = await get_user_or_404(db, user_id)
+    await revoke_user_tokens(db, user)
+    return {"message": "User tokens revoked"}
+
+@router.post("/users/{user_id}/deactivate")
+async def deactivate_user(
+    user_id: int,
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    user = await get_user_or_404(db, user_id)
+    await set_user_active(db, user, False)
+    return {"message": "User deactivated"}
+
+@router.post("/users/{user_id}/activate")
+async def activate_user(
+    user_id: int,
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    user = await get_user_or_404(db, user_id)
+    await set_user_active(db, user, True)
+    return {"message": "User activated"}
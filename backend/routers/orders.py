@@ -1,42 +1,201 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, func, delete
+from sqlalchemy import select, func, delete, and_, tuple_, union_all
+from sqlalchemy.dialects.sqlite import insert
 from typing import List, Optional
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+import base64
+import hashlib
 import json
-import os
-import urllib.parse
-import aiofiles
-from pathlib import Path
 
-from database import get_db
-from models import Order, OrderStatus, OrderEditHistory, User
-from routers.auth import get_current_admin_user, get_current_logist_user, get_current_work_user, get_current_user
+from database import AsyncSessionLocal, get_db, settings
+from models import Order, OrderStatus, OrderEditHistory, OrderTombstone, User, UserRole
+from routers.auth import (
+    get_current_admin_user, get_current_logist_user, get_current_work_user, get_current_user,
+    authenticate_token_payload, create_stream_token, load_user_state, state_matches_token,
+    EVENTS_SCOPE, STREAM_TOKEN_EXPIRE_SECONDS,
+)
+from uploads import stream_upload, remove_upload
+from storage import acquire_file, ensure_stored, release_file
+from images import generate_variants
+from serializers import ORDER_FIELDS, SENSITIVE_ORDER_FIELDS, dumps, json_body_response, json_response, list_projection, order_projection, project_order
+from exports import EXPORT_CHUNK_ROWS, EXPORT_FORMATS, export_response
+from http_cache import make_etag, not_modified
+from events import order_events, format_sse
+from audit import history_row, log_order_change, log_order_changes
+from analytics import order_snapshot, track_order_change
+from phones import MIN_PREFIX_DIGITS, phone_digits, phone_key_prefix, phone_key_range
+from deadlines import deadline_scheduler
+from search import SEARCH_FIELDS, match_expression, search_match, search_rank, search_table
+from order_numbers import (
+    ORDER_NUMBER_MAX, ORDER_NUMBER_MIN, OrderNumbersExhausted, claim_number, free_number, order_number_allocator,
+)
 
 router = APIRouter()
 
-# Используем persistent disk для uploads, если он доступен
-UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
-# Если есть путь к диску, используем его, иначе локальный путь
-if os.path.exists("/app/data"):
-    UPLOAD_DIR = "/app/data/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 # Helper functions
-async def log_order_change(db: AsyncSession, order_id: int, user_id: int, action: str, field_changes = None):
-    history_entry = OrderEditHistory(
-        order_id=order_id,
-        user_id=user_id,
-        action=action,
-        field_changes=json.dumps(field_changes) if field_changes else None
-    )
-    db.add(history_entry)
-    await db.commit()
-
-async def get_next_order_number(db: AsyncSession) -> int:
-    result = await db.execute(select(func.max(Order.order_number)))
-    max_number = result.scalar() or 0
-    return min(max_number + 1, 9999)
+# Статусы, которые видит каждая роль в списке заказов (admin видит все)
+ROLE_VISIBLE_STATUSES = {
+    "logist": [OrderStatus.confirmed, OrderStatus.ready],
+    "work": [OrderStatus.in_progress, OrderStatus.ready],
+}
+
+# Переходы статусов для пакетной обработки (те же правила, что у /submit, /confirm,
+# /ready и /complete): исходный и новый статус, запись в истории, роли, ошибка
+ORDER_TRANSITIONS = {
+    "submit": {
+        "from": OrderStatus.draft, "to": OrderStatus.pending_confirmation,
+        "history": "submitted_for_confirmation", "roles": ["admin"], "error": "Order already submitted",
+    },
+    "confirm": {
+        "from": OrderStatus.pending_confirmation, "to": OrderStatus.confirmed,
+        "history": "confirmed", "roles": ["admin"], "error": "Order not pending confirmation",
+    },
+    "complete": {
+        "from": OrderStatus.in_progress, "to": OrderStatus.ready,
+        "history": "completed", "roles": ["admin", "work"], "error": "Order not in progress",
+    },
+    "deliver": {
+        "from": OrderStatus.ready, "to": OrderStatus.delivered,
+        "history": "delivered", "roles": ["admin", "logist"], "error": "Order not ready",
+    },
+}
+
+MAX_BULK_ORDERS = 500
+
+HISTORY_EXPORT_FIELDS = ["id", "order_id", "user_id", "user", "action", "field_changes", "timestamp"]
+
+ORDER_SORT_COLUMNS = {
+    "created_at": Order.created_at,
+    "deadline": Order.deadline,
+}
+
+# deadline может быть пустым; created_at заполняется всегда
+NULLABLE_SORT_COLUMNS = {"deadline"}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_SEARCH_RESULTS = 100
+MAX_CUSTOMER_MATCHES = 50
+CUSTOMER_RECENT_ORDERS = 5
+
+def role_can_see(role: str, order_status: OrderStatus) -> bool:
+    statuses = ROLE_VISIBLE_STATUSES.get(role)
+    return statuses is None or order_status in statuses
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # В SQLite даты хранятся без часового пояса (UTC)
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def encode_cursor(sort_value: Optional[datetime], order_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat() if sort_value else None, order_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, order_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(sort_value) if sort_value else None), int(order_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_condition(column, id_column, descending: bool, sort_value: Optional[datetime], last_id: int, nullable: bool = False):
+    # Строки после курсора в порядке keyset_order_by
+    id_after = id_column < last_id if descending else id_column > last_id
+    if nullable and sort_value is None:
+        # Курсор уже в хвосте из строк без значения
+        return and_(column.is_(None), id_after)
+    # Сравнение кортежей позволяет SQLite искать по индексу (column, id) диапазоном
+    key, cursor_key = tuple_(column, id_column), tuple_(sort_value, last_id)
+    return key < cursor_key if descending else key > cursor_key
+
+def keyset_order_by(column, id_column, descending: bool) -> list:
+    return [c.desc() if descending else c.asc() for c in (column, id_column)]
+
+def keyset_segments(column, id_column, descending: bool, nullable: bool, cursor=None) -> list:
+    """Части списка в порядке выдачи: (условия, столбцы сортировки).
+
+    Строки с пустым значением (NULL всегда в конце) читаются отдельным запросом
+    по id, а не сортировкой по "column IS NULL": иначе ни один индекс не дает
+    нужного порядка и SQLite сортирует всю выборку.
+    """
+    values_where = [column.is_not(None)] if nullable else []
+    if cursor is not None:
+        sort_value, last_id = cursor
+        after = keyset_condition(column, id_column, descending, sort_value, last_id, nullable)
+        if sort_value is None:
+            return [([after], [id_column])]
+        values_where.append(after)
+    segments = [(values_where, [column, id_column])]
+    if nullable:
+        segments.append(([column.is_(None)], [id_column]))
+    return segments
+
+def keyset_page_query(selected: list, conditions: list, statuses: Optional[list], where: list, columns: list, descending: bool, limit: Optional[int]):
+    """Запрос страницы: selected - выбираемые столбцы (должны включать columns), columns - столбцы сортировки."""
+    def ordered(cols):
+        return [c.desc() if descending else c.asc() for c in cols]
+
+    if statuses is None or len(statuses) <= 1 or not limit:
+        if statuses is not None:
+            where = [Order.status.in_(statuses), *where]
+        query = select(*selected).where(*conditions, *where).order_by(*ordered(columns))
+        return query.limit(limit) if limit else query
+    # Для нескольких статусов индекс (status, column) упорядочен только внутри
+    # статуса: берем по limit строк из каждого и сливаем уже ограниченный набор
+    branches = [
+        select(*selected).where(*conditions, Order.status == order_status, *where).order_by(*ordered(columns)).limit(limit).subquery()
+        for order_status in statuses
+    ]
+    merged = union_all(*(select(branch) for branch in branches)).subquery()
+    merged_columns = [merged.c[c.key] for c in columns]
+    return select(merged).order_by(*ordered(merged_columns)).limit(limit)
+
+def visible_statuses(role: str, status_filter: Optional[List[str]]) -> Optional[list]:
+    """Статусы, доступные роли, с учетом фильтра (None - без ограничения)."""
+    role_statuses = ROLE_VISIBLE_STATUSES.get(role)
+    statuses = list(role_statuses) if role_statuses is not None else None
+    if status_filter:
+        try:
+            requested = [OrderStatus(s) for value in status_filter for s in value.split(",") if s]
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid status. Valid statuses: {[s.value for s in OrderStatus]}")
+        statuses = [s for s in (statuses if statuses is not None else OrderStatus) if s in requested]
+    return statuses
+
+def date_range_conditions(column, date_from: Optional[datetime], date_to: Optional[datetime]) -> list:
+    conditions = []
+    if date_from:
+        conditions.append(column >= to_naive_utc(date_from))
+    if date_to:
+        conditions.append(column < to_naive_utc(date_to))
+    return conditions
+
+def publish_order_event(action: str, order_id: int, old_status: Optional[OrderStatus], order: Optional[Order] = None):
+    # Для каждой роли: заказ (в ее проекции), если он виден после изменения,
+    # или событие удаления из списка, если был виден до изменения
+    events_by_role = {}
+    for role in (r.value for r in UserRole):
+        if order is not None and role_can_see(role, order.status):
+            events_by_role[role] = {"type": "order", "action": action, "order": project_order(order, role)}
+        elif old_status is not None and role_can_see(role, old_status):
+            events_by_role[role] = {"type": "removed", "action": action, "order_id": order_id}
+    order_events.publish(events_by_role)
+    # Планировщик сроков узнает об изменении здесь же: все обработчики публикуют событие после коммита
+    if order is not None:
+        deadline_scheduler.track(order_id, order.deadline, order.status)
+    else:
+        deadline_scheduler.forget(order_id)
+
+def publish_deadline_alert(alert: str, order_id: int, deadline: datetime, order_status: OrderStatus):
+    # Оповещение о сроке получают роли, которым виден заказ
+    event = {"type": "deadline", "alert": alert, "order_id": order_id, "deadline": deadline, "status": order_status}
+    order_events.publish({
+        role: event for role in (r.value for r in UserRole) if role_can_see(role, order_status)
+    })
 
 # Admin endpoints
 @router.post("/")
@@ -69,72 +228,499 @@ async def create_order(
         status=OrderStatus.draft
     )
     db.add(order)
+    await db.flush()
+    await log_order_change(db, order.id, current_user.id, "created")
+    await track_order_change(db, None, order)
     await db.commit()
     await db.refresh(order)
 
-    await log_order_change(db, order.id, current_user.id, "created")
+    publish_order_event("created", order.id, None, order)
 
     return {"id": order.id, "message": "Order created successfully"}
 
 @router.get("/")
 async def get_orders(
-    status_filter: Optional[str] = None,
+    request: Request,
+    response: Response,
+    status_filter: Optional[List[str]] = Query(None),
+    sort: str = "created_at",
+    sort_order: str = Query("desc", alias="order"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    deadline_from: Optional[datetime] = None,
+    deadline_to: Optional[datetime] = None,
+    # limit=0 - явный запрос всего списка без постраничной выдачи
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    # Поля ответа; по умолчанию - все видимые роли, кроме длинных текстов (LIST_DEFERRED_FIELDS)
+    fields: Optional[List[str]] = Query(None),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    query = select(Order)
+    if sort not in ORDER_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort. Valid values: {list(ORDER_SORT_COLUMNS)}")
+    if sort_order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid order. Valid values: ['asc', 'desc']")
+
+    requested_fields = None
+    if fields:
+        requested_fields = tuple(dict.fromkeys(f for value in fields for f in value.split(",") if f))
+        unknown = [f for f in requested_fields if f not in ORDER_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Invalid fields: {unknown}. Valid fields: {list(ORDER_FIELDS)}")
+    # Поля, скрытые от роли, в ответ не попадают и не читаются из БД
+    project = list_projection(current_user.role.value, requested_fields)
 
     # Filter based on user role
-    if current_user.role.value == "logist":
-        query = query.where(Order.status.in_([OrderStatus.confirmed, OrderStatus.ready]))
-    elif current_user.role.value == "work":
-        query = query.where(Order.status.in_([OrderStatus.in_progress, OrderStatus.ready]))
+    statuses = visible_statuses(current_user.role.value, status_filter)
+    conditions = [
+        *date_range_conditions(Order.created_at, created_from, created_to),
+        *date_range_conditions(Order.deadline, deadline_from, deadline_to),
+    ]
+    status_conditions = [Order.status.in_(statuses)] if statuses is not None else []
+
+    total = None
+    if include_total:
+        # Полный подсчет по фильтру - только по явному запросу
+        total = (await db.execute(select(func.count(Order.id)).where(*conditions, *status_conditions))).scalar_one()
+        response.headers["X-Total-Count"] = str(total)
+
+    sort_column = ORDER_SORT_COLUMNS[sort]
+    nullable = sort in NULLABLE_SORT_COLUMNS
+    descending = sort_order == "desc"
+    page_cursor = None
+    if cursor:
+        page_cursor = decode_cursor(cursor)
+        if page_cursor[0] is None and not nullable:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Только нужные столбцы простыми строками, без ORM-объектов и identity map
+    selected = [getattr(Order, field) for field in project.fields]
+    if sort not in project.fields:
+        selected.append(sort_column)
+
+    # Запрашиваем на одну строку больше, чтобы понять, есть ли следующая страница
+    fetch = limit + 1 if limit else None
+    orders = []
+    for where, columns in keyset_segments(sort_column, Order.id, descending, nullable, page_cursor):
+        if fetch and len(orders) >= fetch:
+            break
+        query = keyset_page_query(selected, conditions, statuses, where, columns, descending, fetch - len(orders) if fetch else None)
+        orders += (await db.execute(query)).all()
+
+    next_cursor = None
+    if limit and len(orders) > limit:
+        orders = orders[:limit]
+        last = orders[-1]
+        next_cursor = encode_cursor(getattr(last, sort), last.id)
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    # Валидатор по самой странице: проход по всем строкам фильтра ради ETag
+    # свел бы на нет выигрыш keyset-пагинации на дальних страницах
+    body = dumps([project(order) for order in orders])
+    etag = make_etag("orders", current_user.role.value, request.url.query, hashlib.sha1(body).hexdigest(), next_cursor, total)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+    return json_body_response(body, response)
+
+def sync_settle_seconds() -> float:
+    """Сколько придерживать свежие изменения в дельта-синхронизации.
+
+    Между назначением updated_at и коммитом транзакция может ждать блокировку
+    записи SQLite до busy_timeout, поэтому окно не короче него; sync_settle_seconds -
+    запас сверху на работу обработчика до коммита.
+    """
+    return settings.sqlite_busy_timeout / 1000 + settings.sync_settle_seconds
+
+@router.get("/changes")
+async def get_order_changes(
+    since: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Дельта-синхронизация: заказы, созданные или измененные после курсора, и удаленные заказы.
+
+    Без since отдается все с начала. Клиент сохраняет next_cursor и запрашивает
+    следующую порцию, пока has_more. В deleted попадают id удаленных заказов и
+    заказов, которые после изменения перестали быть видны роли.
+    """
+    watermark, last_id = decode_cursor(since) if since else (datetime.min, 0)
+    if watermark is None:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Свежие изменения придерживаем: updated_at назначается до коммита, и более
+    # ранняя метка может появиться в базе позже уже отданной
+    horizon = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=sync_settle_seconds())
+
+    orders = (await db.execute(
+        select(Order)
+        .where(
+            keyset_condition(Order.updated_at, Order.id, False, watermark, last_id),
+            Order.updated_at <= horizon,
+        )
+        .order_by(Order.updated_at, Order.id)
+        .limit(limit + 1)
+    )).scalars().all()
+    tombstones = (await db.execute(
+        select(OrderTombstone)
+        .where(
+            keyset_condition(OrderTombstone.deleted_at, OrderTombstone.order_id, False, watermark, last_id),
+            OrderTombstone.deleted_at <= horizon,
+        )
+        .order_by(OrderTombstone.deleted_at, OrderTombstone.order_id)
+        .limit(limit + 1)
+    )).scalars().all()
+
+    # Сливаем оба потока в порядке (время, id) и берем первые limit изменений
+    changes = sorted(
+        [(order.updated_at, order.id, order) for order in orders]
+        + [(tombstone.deleted_at, tombstone.order_id, None) for tombstone in tombstones],
+        key=lambda change: change[:2],
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # id может быть переиспользован после удаления - остается последнее состояние
+    latest = {order_id: order for _, order_id, order in changes}
+    role = current_user.role.value
+    result_orders, deleted = [], []
+    for order_id, order in latest.items():
+        if order is not None and role_can_see(role, order.status):
+            result_orders.append(project_order(order, role))
+        else:
+            deleted.append(order_id)
+
+    next_cursor = encode_cursor(*changes[-1][:2]) if changes else since
+    return {
+        "orders": result_orders,
+        "deleted": deleted,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    }
 
-    if status_filter:
-        query = query.where(Order.status == status_filter)
-
-    result = await db.execute(query)
-    orders = result.scalars().all()
-
-    # Filter sensitive information for work role
-    orders_data = []
-    for order in orders:
-        order_dict = {
-            "id": order.id,
-            "order_number": order.order_number,
-            "customer_name": order.customer_name,
-            "customer_requirements": order.customer_requirements,
-            "deadline": order.deadline.isoformat() if order.deadline else None,
-            "furniture_photo": order.furniture_photo,
-            "material_photo": order.material_photo,
-            "status": order.status.value,
-            "created_at": order.created_at.isoformat(),
-            "updated_at": order.updated_at.isoformat(),
-        }
+def check_export_format(export_format: str):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Valid formats: {list(EXPORT_FORMATS)}")
+
+@router.get("/export")
+async def export_orders(
+    export_format: str = Query("csv", alias="format"),
+    status_filter: Optional[List[str]] = Query(None),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    deadline_from: Optional[datetime] = None,
+    deadline_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+):
+    check_export_format(export_format)
+    role = current_user.role.value
+    statuses = visible_statuses(role, status_filter)
+    query = (
+        select(Order)
+        .where(
+            *([Order.status.in_(statuses)] if statuses is not None else []),
+            *date_range_conditions(Order.created_at, created_from, created_to),
+            *date_range_conditions(Order.deadline, deadline_from, deadline_to),
+        )
+        .order_by(Order.id)
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    # Столбцы проекции роли (без вариантов фото: это производные имена файлов)
+    fields = list(order_projection(role).fields)
+
+    async def rows():
+        # Сессия запроса закрывается до начала отдачи тела, поэтому курсор открывается здесь
+        async with AsyncSessionLocal() as session:
+            async for order in await session.stream_scalars(query):
+                yield project_order(order, role)
+
+    return export_response(rows(), fields, export_format, "orders")
+
+@router.get("/export/history")
+async def export_order_history(
+    export_format: str = Query("csv", alias="format"),
+    status_filter: Optional[List[str]] = Query(None),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """История изменений заказов, видимых роли. Фильтр по статусу - по текущему статусу заказа."""
+    check_export_format(export_format)
+    role = current_user.role.value
+    statuses = visible_statuses(role, status_filter)
+    query = (
+        select(OrderEditHistory, User.username)
+        .outerjoin(User, OrderEditHistory.user_id == User.id)
+        .where(*date_range_conditions(OrderEditHistory.timestamp, date_from, date_to))
+        .order_by(OrderEditHistory.id)
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    if statuses is not None:
+        query = query.join(Order, Order.id == OrderEditHistory.order_id).where(Order.status.in_(statuses))
+    hidden_fields = set(SENSITIVE_ORDER_FIELDS) if role not in ("admin", "logist") else set()
+
+    async def rows():
+        async with AsyncSessionLocal() as session:
+            async for entry, username in await session.stream(query):
+                field_changes = json.loads(entry.field_changes) if entry.field_changes else None
+                if field_changes and hidden_fields:
+                    field_changes = {k: v for k, v in field_changes.items() if k not in hidden_fields} or None
+                yield {
+                    "id": entry.id,
+                    "order_id": entry.order_id,
+                    "user_id": entry.user_id,
+                    "user": username,
+                    "action": entry.action,
+                    "field_changes": field_changes,
+                    "timestamp": entry.timestamp,
+                }
+
+    return export_response(rows(), HISTORY_EXPORT_FIELDS, export_format, "order_history")
+
+@router.get("/search")
+async def search_orders(
+    q: str = Query(..., min_length=1),
+    status_filter: Optional[List[str]] = Query(None),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Поиск по имени заказчика, адресу, примечаниям и требованиям, лучшие совпадения первыми.
+
+    Каждое слово запроса ищется как префикс. Роль ищет только по полям, которые
+    ей видны, и только среди заказов в видимых ей статусах.
+    """
+    role = current_user.role.value
+    project = order_projection(role)
+    fields = [field for field in SEARCH_FIELDS if field in project.fields]
+    match = match_expression(q, fields)
+    if not match:
+        raise HTTPException(status_code=400, detail="Search query must contain at least one word")
+    statuses = visible_statuses(role, status_filter)
+
+    query = (
+        select(*[getattr(Order, field) for field in project.fields])
+        .join_from(Order, search_table, search_table.c.rowid == Order.id)
+        .where(search_match(match))
+        .order_by(search_rank(fields), Order.id.desc())
+        .limit(limit)
+    )
+    if statuses is not None:
+        query = query.where(Order.status.in_(statuses))
+    rows = (await db.execute(query)).all()
+    return json_response([project(row) for row in rows])
+
+@router.get("/customers")
+async def find_customers_by_phone(
+    phone: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=MAX_CUSTOMER_MATCHES),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Клиенты, чей телефон начинается с phone, с последними заказами (подсказка при создании заказа).
+
+    Клиент - один нормализованный номер (phone_key): имя и адрес берутся из его
+    последнего заказа. Номера и ключи ищутся диапазоном по индексу ix_orders_phone_key.
+    """
+    if current_user.role.value not in ["admin", "logist"]:
+        raise HTTPException(status_code=403, detail="Only admin and logist can look up customers")
+    prefix = phone_key_prefix(phone)
+    if prefix is None or len(phone_digits(phone)) < MIN_PREFIX_DIGITS:
+        raise HTTPException(status_code=400, detail=f"Phone must contain at least {MIN_PREFIX_DIGITS} digits")
+    key_from, key_to = phone_key_range(prefix)
+    # Клиенты и их заказы - только в статусах, которые роль видит в списке заказов
+    statuses = visible_statuses(current_user.role.value, None)
+    status_conditions = [Order.status.in_(statuses)] if statuses is not None else []
+
+    keys = (await db.execute(
+        select(Order.phone_key)
+        .where(Order.phone_key >= key_from, Order.phone_key < key_to, *status_conditions)
+        .group_by(Order.phone_key)
+        .order_by(Order.phone_key)
+        .limit(limit)
+    )).scalars().all()
+    if not keys:
+        return []
+
+    recent = (
+        select(
+            Order.id, Order.order_number, Order.phone_key, Order.customer_name, Order.customer_phone,
+            Order.customer_address, Order.status, Order.price, Order.deadline, Order.created_at,
+            func.row_number().over(
+                partition_by=Order.phone_key, order_by=(Order.created_at.desc(), Order.id.desc())
+            ).label("position"),
+            func.count().over(partition_by=Order.phone_key).label("order_count"),
+        )
+        .where(Order.phone_key.in_(keys), *status_conditions)
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(recent)
+        .where(recent.c.position <= CUSTOMER_RECENT_ORDERS)
+        .order_by(recent.c.phone_key, recent.c.position)
+    )).all()
+    customers = {}
+    for row in rows:
+        customer = customers.get(row.phone_key)
+        if customer is None:
+            # Первая строка клиента - его последний заказ
+            customer = customers[row.phone_key] = {
+                "phone_key": row.phone_key,
+                "customer_phone": row.customer_phone,
+                "customer_name": row.customer_name,
+                "customer_address": row.customer_address,
+                "order_count": row.order_count,
+                "last_order_at": row.created_at,
+                "orders": [],
+            }
+        customer["orders"].append({
+            "id": row.id,
+            "order_number": row.order_number,
+            "status": row.status,
+            "price": row.price,
+            "deadline": row.deadline,
+            "created_at": row.created_at,
+        })
+    return json_response(list(customers.values()))
+
+@router.get("/deadline-alerts")
+async def get_deadline_alerts(current_user: User = Depends(get_current_user)):
+    """Последние оповещения "скоро срок" и "просрочен" (для клиентов, пропустивших их в ленте)."""
+    role = current_user.role.value
+    alerts = [alert for alert in deadline_scheduler.recent if role_can_see(role, alert["status"])]
+    return json_response(alerts[::-1])
+
+@router.get("/numbers")
+async def get_order_number_status(
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Сколько номеров осталось и перешла ли выдача к освобожденным номерам
+    return await order_number_allocator.status(db)
+
+@router.post("/events/token")
+async def create_order_events_token(current_user: User = Depends(get_current_user)):
+    # Короткоживущий токен только для подписки на ленту: основной JWT в URL не передается
+    return {"token": create_stream_token(current_user, EVENTS_SCOPE), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@router.get("/events")
+async def order_events_stream(
+    request: Request,
+    token: str = Query(...),
+    db: AsyncSession = Depends(get_db)
+):
+    # EventSource не умеет передавать заголовки, поэтому токен приходит в query
+    current_user, payload = await authenticate_token_payload(token, db, scope=EVENTS_SCOPE)
+    subscription = order_events.subscribe(current_user.role.value)
+
+    async def user_still_allowed() -> bool:
+        # Пользователя могли деактивировать или отозвать его токены уже после подключения
+        async with AsyncSessionLocal() as session:
+            state = await load_user_state(session, payload["uid"])
+        return state_matches_token(state, payload)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.next_event(settings.event_heartbeat_interval)
+                if await request.is_disconnected() or not await user_still_allowed():
+                    break
+                if event is not None:
+                    yield format_sse(event)
+                else:
+                    yield ": ping\n\n"
+        finally:
+            order_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/bulk")
+async def bulk_transition_orders(
+    action: str = Form(...),
+    order_ids: List[int] = Form(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Один переход статуса для списка заказов: одна транзакция, одна пачка записей истории.
+
+    Заказ, для которого переход недопустим, пропускается; результат - по каждому заказу.
+    """
+    transition = ORDER_TRANSITIONS.get(action)
+    if transition is None:
+        raise HTTPException(status_code=400, detail=f"Invalid action. Valid actions: {list(ORDER_TRANSITIONS)}")
+    if current_user.role.value not in transition["roles"]:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    order_ids = list(dict.fromkeys(order_ids))
+    if len(order_ids) > MAX_BULK_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Too many orders, at most {MAX_BULK_ORDERS} per request")
+
+    result = await db.execute(select(Order).where(Order.id.in_(order_ids)))
+    orders = {order.id: order for order in result.scalars()}
+
+    results = []
+    changed = []
+    history = []
+    allocated = []
+    now = datetime.now(timezone.utc)
+    for order_id in order_ids:
+        order = orders.get(order_id)
+        if order is None:
+            results.append({"id": order_id, "success": False, "detail": "Order not found"})
+            continue
+        if order.status != transition["from"]:
+            results.append({"id": order_id, "success": False, "detail": transition["error"]})
+            continue
+        field_changes = None
+        if action == "confirm":
+            try:
+                order.order_number = await order_number_allocator.allocate(db)
+            except OrderNumbersExhausted as e:
+                results.append({"id": order_id, "success": False, "detail": str(e)})
+                continue
+            allocated.append(order.order_number)
+            field_changes = {"order_number": order.order_number}
+        before = order_snapshot(order)
+        order.status = transition["to"]
+        order.updated_by = current_user.id
+        order.updated_at = now
+        await track_order_change(db, before, order, now)
+        history.append(history_row(order_id, current_user.id, transition["history"], field_changes))
+        changed.append(order)
+        result_entry = {"id": order_id, "success": True, "status": order.status.value}
+        if field_changes:
+            result_entry.update(field_changes)
+        results.append(result_entry)
+
+    await log_order_changes(db, history)
+    try:
+        await db.commit()
+    except Exception:
+        for number in allocated:
+            order_number_allocator.discard(number)
+        raise
+
+    for order in changed:
+        publish_order_event(transition["history"], order.id, transition["from"], order)
 
-        if current_user.role.value == "admin":
-            order_dict.update({
-                "customer_phone": order.customer_phone,
-                "customer_address": order.customer_address,
-                "phone_agreement_notes": order.phone_agreement_notes,
-                "price": order.price,
-            })
-        elif current_user.role.value == "logist":
-            order_dict.update({
-                "customer_phone": order.customer_phone,
-                "customer_address": order.customer_address,
-                "phone_agreement_notes": order.phone_agreement_notes,
-                "price": order.price,
-            })
-        # work role gets only basic info
-
-        orders_data.append(order_dict)
-
-    return orders_data
+    return {
+        "action": action,
+        "succeeded": len(changed),
+        "failed": len(results) - len(changed),
+        "results": results,
+    }
 
 @router.get("/{order_id}")
 async def get_order(
     order_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -149,36 +735,11 @@ async def get_order(
     if current_user.role.value == "work" and order.status not in [OrderStatus.in_progress, OrderStatus.ready]:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    order_dict = {
-        "id": order.id,
-        "order_number": order.order_number,
-        "customer_name": order.customer_name,
-        "customer_requirements": order.customer_requirements,
-        "deadline": order.deadline.isoformat() if order.deadline else None,
-        "furniture_photo": order.furniture_photo,
-        "material_photo": order.material_photo,
-        "status": order.status.value,
-        "created_at": order.created_at.isoformat(),
-        "updated_at": order.updated_at.isoformat(),
-    }
+    cached = not_modified(request, response, make_etag("order", current_user.role.value, order.id, order.updated_at))
+    if cached:
+        return cached
 
-    if current_user.role.value == "admin":
-        order_dict.update({
-            "customer_phone": order.customer_phone,
-            "customer_address": order.customer_address,
-            "phone_agreement_notes": order.phone_agreement_notes,
-            "price": order.price,
-        })
-    elif current_user.role.value == "logist":
-        order_dict.update({
-            "customer_phone": order.customer_phone,
-            "customer_address": order.customer_address,
-            "phone_agreement_notes": order.phone_agreement_notes,
-            "price": order.price,
-        })
-    # work role gets only basic info
-
-    return order_dict
+    return json_response(project_order(order, current_user.role.value), response)
 
 @router.put("/{order_id}")
 async def update_order(
@@ -202,6 +763,7 @@ async def update_order(
 
     # Admins can edit orders at any stage and all fields including order_number and status
 
+    before = order_snapshot(order)
     old_values = {
         "order_number": order.order_number,
         "customer_name": order.customer_name,
@@ -216,12 +778,16 @@ async def update_order(
 
     # Validate order_number if provided
     if order_number is not None:
-        if order_number < 1 or order_number > 9999:
-            raise HTTPException(status_code=400, detail="Order number must be between 1 and 9999")
+        if order_number < ORDER_NUMBER_MIN or order_number > ORDER_NUMBER_MAX:
+            raise HTTPException(status_code=400, detail=f"Order number must be between {ORDER_NUMBER_MIN} and {ORDER_NUMBER_MAX}")
         # Check if order_number is already taken by another order
         existing = await db.execute(select(Order).where(Order.order_number == order_number).where(Order.id != order_id))
         if existing.scalar_one_or_none():
             raise HTTPException(status_code=400, detail=f"Order number {order_number} is already taken")
+        if order_number != order.order_number:
+            # Прежний номер снова можно выдать, новый - больше не свободен
+            await claim_number(db, order_number)
+            await free_number(db, order.order_number)
         order.order_number = order_number
 
     if customer_name is not None:
@@ -264,7 +830,8 @@ async def update_order(
     order.updated_by = current_user.id
     order.updated_at = datetime.now(timezone.utc)
 
-    await db.commit()
+    # Сохраняем без коммита, чтобы сравнить значения в том виде, в каком они хранятся в БД
+    await db.flush()
     await db.refresh(order)
 
     new_values = {
@@ -286,6 +853,11 @@ async def update_order(
 
     if field_changes:
         await log_order_change(db, order_id, current_user.id, "updated", field_changes)
+    await track_order_change(db, before, order)
+    await db.commit()
+
+    old_status = OrderStatus(old_values["status"]) if old_values["status"] else None
+    publish_order_event("updated", order_id, old_status, order)
 
     return {"message": "Order updated successfully"}
 
@@ -300,13 +872,31 @@ async def delete_order(
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    # Log deletion before deleting
+    # Запись в журнале сохраняется тем же коммитом, что и удаление
     await log_order_change(db, order_id, current_user.id, "deleted")
+    await track_order_change(db, order_snapshot(order), None)
+    await free_number(db, order.order_number)
+
+    # Снимаем ссылки заказа на фото
+    await release_file(db, order.material_photo)
+    await release_file(db, order.furniture_photo)
 
     # Delete the order using delete statement
     await db.execute(delete(Order).where(Order.id == order_id))
+    # След для дельта-синхронизации; id может быть удален повторно после переиспользования
+    deleted_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    await db.execute(
+        insert(OrderTombstone)
+        .values(order_id=order_id, deleted_at=deleted_at, deleted_by=current_user.id)
+        .on_conflict_do_update(
+            index_elements=[OrderTombstone.order_id],
+            set_={"deleted_at": deleted_at, "deleted_by": current_user.id},
+        )
+    )
     await db.commit()
 
+    publish_order_event("deleted", order_id, order.status)
+
     return {"message": "Order deleted successfully"}
 
 @router.post("/{order_id}/submit")
@@ -323,12 +913,16 @@ async def submit_order_for_confirmation(
     if order.status != OrderStatus.draft:
         raise HTTPException(status_code=400, detail="Order already submitted")
 
+    old_status = order.status
+    before = order_snapshot(order)
     order.status = OrderStatus.pending_confirmation
     order.updated_by = current_user.id
     order.updated_at = datetime.now(timezone.utc)
+    await log_order_change(db, order_id, current_user.id, "submitted_for_confirmation")
+    await track_order_change(db, before, order)
     await db.commit()
 
-    await log_order_change(db, order_id, current_user.id, "submitted_for_confirmation")
+    publish_order_event("submitted_for_confirmation", order_id, old_status, order)
 
     return {"message": "Order submitted for confirmation"}
 
@@ -346,14 +940,25 @@ async def confirm_order(
     if order.status != OrderStatus.pending_confirmation:
         raise HTTPException(status_code=400, detail="Order not pending confirmation")
 
-    next_number = await get_next_order_number(db)
+    try:
+        next_number = await order_number_allocator.allocate(db)
+    except OrderNumbersExhausted as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    old_status = order.status
+    before = order_snapshot(order)
     order.status = OrderStatus.confirmed
     order.order_number = next_number
     order.updated_by = current_user.id
     order.updated_at = datetime.now(timezone.utc)
-    await db.commit()
-
     await log_order_change(db, order_id, current_user.id, "confirmed", {"order_number": next_number})
+    await track_order_change(db, before, order)
+    try:
+        await db.commit()
+    except Exception:
+        order_number_allocator.discard(next_number)
+        raise
+
+    publish_order_event("confirmed", order_id, old_status, order)
 
     return {"message": f"Order confirmed with number {next_number}"}
 
@@ -398,42 +1003,23 @@ async def add_order_details(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid deadline format: {str(e)}")
 
-    # Validate file types and sizes
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-
-    async def save_file(file: UploadFile, prefix: str) -> Optional[str]:
+    async def save_file(file: UploadFile) -> Optional[str]:
         if not file or not file.filename:
             return None
-        
-        # Check file extension
-        file_ext = Path(file.filename).suffix.lower()
-        if file_ext not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File extension {file_ext} not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Read file content
-        content = await file.read()
-        
-        # Check file size
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE / 1024 / 1024}MB"
-            )
-        
-        # Generate safe filename
-        safe_filename = file.filename.replace(' ', '_')
-        safe_filename = ''.join(c if c.isalnum() or c in '._-' else '_' for c in safe_filename)
-        filename = f"{order_id}_{prefix}_{safe_filename}"
-        filepath = os.path.join(UPLOAD_DIR, filename)
-        
-        # Save file asynchronously
-        async with aiofiles.open(filepath, "wb") as f:
-            await f.write(content)
-        
+        # Файл читается и проверяется потоково, без загрузки целиком в память;
+        # имя - хеш содержимого, одинаковые фото хранятся один раз
+        filename, size, is_new = await stream_upload(file)
+        if is_new:
+            # Миниатюра и WebP-превью для списков (в пуле процессов)
+            try:
+                await generate_variants(filename)
+            except ValueError:
+                remove_upload(filename)
+                raise HTTPException(status_code=400, detail="Invalid image file")
+        await acquire_file(db, filename, size)
+        if not ensure_stored(filename):
+            # Сборщик мусора удалил файл между проверкой на диске и добавлением ссылки
+            raise HTTPException(status_code=409, detail="Uploaded file was removed concurrently, please retry")
         return filename
 
     old_values = {
@@ -447,14 +1033,18 @@ async def add_order_details(
     # Handle file uploads
     try:
         if material_photo:
-            order.material_photo = await save_file(material_photo, "material")
+            order.material_photo = await save_file(material_photo)
+            await release_file(db, old_values["material_photo"])
         if furniture_photo:
-            order.furniture_photo = await save_file(furniture_photo, "furniture")
+            order.furniture_photo = await save_file(furniture_photo)
+            await release_file(db, old_values["furniture_photo"])
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
 
+    old_status = order.status
+    before = order_snapshot(order)
     order.customer_requirements = customer_requirements
     order.deadline = deadline_dt
     order.price = price
@@ -464,8 +1054,6 @@ async def add_order_details(
     order.updated_by = current_user.id
     order.updated_at = datetime.now(timezone.utc)
 
-    await db.commit()
-
     new_values = {
         "customer_requirements": customer_requirements,
         "deadline": deadline,
@@ -479,8 +1067,15 @@ async def add_order_details(
         if old_values[key] != new_values[key]:
             field_changes[key] = {"old": old_values[key], "new": new_values[key]}
 
+    if order.status != old_status:
+        # Смена статуса попадает в журнал, чтобы по нему можно было пересчитать переходы
+        field_changes["status"] = {"old": old_status.value, "new": order.status.value}
     if field_changes:
         await log_order_change(db, order_id, current_user.id, "details_added", field_changes)
+    await track_order_change(db, before, order)
+    await db.commit()
+
+    publish_order_event("details_added", order_id, old_status, order)
 
     return {"message": "Order details added successfully"}
 
@@ -498,12 +1093,16 @@ async def mark_order_ready(
     if order.status != OrderStatus.ready:
         raise HTTPException(status_code=400, detail="Order not ready")
 
+    old_status = order.status
+    before = order_snapshot(order)
     order.status = OrderStatus.delivered
     order.updated_by = current_user.id
     order.updated_at = datetime.now(timezone.utc)
+    await log_order_change(db, order_id, current_user.id, "delivered")
+    await track_order_change(db, before, order)
     await db.commit()
 
-    await log_order_change(db, order_id, current_user.id, "delivered")
+    publish_order_event("delivered", order_id, old_status, order)
 
     return {"message": "Order marked as delivered"}
 
@@ -522,12 +1121,16 @@ async def complete_order(
     if order.status != OrderStatus.in_progress:
         raise HTTPException(status_code=400, detail="Order not in progress")
 
+    old_status = order.status
+    before = order_snapshot(order)
     order.status = OrderStatus.ready
     order.updated_by = current_user.id
     order.updated_at = datetime.now(timezone.utc)
+    await log_order_change(db, order_id, current_user.id, "completed")
+    await track_order_change(db, before, order)
     await db.commit()
 
-    await log_order_change(db, order_id, current_user.id, "completed")
+    publish_order_event("completed", order_id, old_status, order)
 
     return {"message": "Order marked as ready"}
 
@@ -535,6 +1138,8 @@ async def complete_order(
 @router.get("/{order_id}/history")
 async def get_order_history(
     order_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -544,6 +1149,15 @@ async def get_order_history(
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
+    # История только дополняется, поэтому количества записей и последнего id достаточно
+    entries, last_id = (await db.execute(
+        select(func.count(OrderEditHistory.id), func.max(OrderEditHistory.id))
+        .where(OrderEditHistory.order_id == order_id)
+    )).one()
+    cached = not_modified(request, response, make_etag("history", order_id, entries, last_id))
+    if cached:
+        return cached
+
     result = await db.execute(
         select(OrderEditHistory, User.username)
         .join(User, OrderEditHistory.user_id == User.id)
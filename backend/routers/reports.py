@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from typing import Optional
+from datetime import date, datetime, timedelta
+
+from database import get_db
+from models import (
+    Order, OrderDeadlineBucket, OrderRevenue, OrderStatus, OrderStatusCount, OrderStatusTransition, User,
+)
+from routers.auth import get_current_admin_user
+from analytics import REVENUE_PERIODS
+
+router = APIRouter()
+
+# Отчеты читают сводные таблицы (analytics.py), а не всю таблицу заказов
+
+@router.get("/orders-by-status")
+async def orders_by_status(
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    counts = dict((await db.execute(select(OrderStatusCount.status, OrderStatusCount.count))).all())
+    return {status.value: counts.get(status.value, 0) for status in OrderStatus}
+
+@router.get("/revenue")
+async def revenue(
+    period: str = "month",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Выручка (сумма цен) и число заказов по неделям или месяцам создания заказа."""
+    if period not in REVENUE_PERIODS:
+        raise HTTPException(status_code=400, detail=f"Invalid period. Valid values: {list(REVENUE_PERIODS)}")
+    query = select(OrderRevenue).where(OrderRevenue.period == period, OrderRevenue.orders != 0)
+    if date_from:
+        query = query.where(OrderRevenue.period_start >= date_from)
+    if date_to:
+        query = query.where(OrderRevenue.period_start < date_to)
+    rows = (await db.execute(query.order_by(OrderRevenue.period_start))).scalars()
+    return [
+        {"period_start": row.period_start.isoformat(), "revenue": row.revenue, "orders": row.orders}
+        for row in rows
+    ]
+
+@router.get("/status-durations")
+async def status_durations(
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Среднее время от входа в статус до перехода в следующий."""
+    rows = (await db.execute(
+        select(OrderStatusTransition)
+        .where(OrderStatusTransition.count > 0)
+        .order_by(OrderStatusTransition.from_status, OrderStatusTransition.to_status)
+    )).scalars()
+    return [
+        {
+            "from_status": row.from_status,
+            "to_status": row.to_status,
+            "transitions": row.count,
+            "average_seconds": row.total_seconds / row.count,
+        }
+        for row in rows
+    ]
+
+@router.get("/overdue")
+async def overdue(
+    current_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Не доставленные заказы с истекшим сроком.
+
+    Прошедшие дни берутся из сводной таблицы по дням срока; только заказы
+    со сроком сегодня считаются по индексу deadline.
+    """
+    now = datetime.utcnow()
+    today = now.date()
+    before_today = await db.scalar(
+        select(func.coalesce(func.sum(OrderDeadlineBucket.open_count), 0)).where(OrderDeadlineBucket.day < today)
+    )
+    due_today = (await db.execute(
+        select(
+            func.count().filter(Order.deadline < now),
+            func.count(),
+        )
+        .where(
+            Order.deadline >= datetime.combine(today, datetime.min.time()),
+            Order.deadline < datetime.combine(today + timedelta(days=1), datetime.min.time()),
+            Order.status != OrderStatus.delivered,
+        )
+    )).one()
+    return {
+        "as_of": now.isoformat(),
+        "overdue": before_today + due_today[0],
+        "due_today": due_today[1] - due_today[0],
+    }
@@ -0,0 +1,93 @@
+"""
+Полнотекстовый поиск заказов (SQLite FTS5).
+
+orders_fts - FTS5-таблица с внешним содержимым (content='orders'): хранит
+только индекс по имени заказчика, адресу, примечаниям и требованиям, сами
+тексты читаются из orders. Индекс поддерживается триггерами на orders,
+поэтому его обновляют любые изменения заказа, в том числе DELETE без ORM.
+
+Пересобрать индекс (например, после ручной правки БД):
+    python search.py --rebuild
+"""
+import asyncio
+import re
+import sys
+
+from sqlalchemy import column, func, literal_column, table, text
+
+SEARCH_TABLE = "orders_fts"
+SEARCH_FIELDS = ("customer_name", "customer_address", "phone_agreement_notes", "customer_requirements")
+# Вес столбца при ранжировании (bm25): совпадение в имени важнее, чем в примечаниях
+SEARCH_WEIGHTS = {
+    "customer_name": 10.0,
+    "customer_address": 5.0,
+    "phone_agreement_notes": 1.0,
+    "customer_requirements": 2.0,
+}
+MAX_QUERY_TERMS = 10
+
+# Легкое описание FTS-таблицы для запросов (в metadata моделей ее нет)
+search_table = table(SEARCH_TABLE, column("rowid"))
+
+_columns = ", ".join(SEARCH_FIELDS)
+_new_values = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+_old_values = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+
+SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        {_columns}, content='orders', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    f"""CREATE TRIGGER IF NOT EXISTS orders_fts_insert AFTER INSERT ON orders BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS orders_fts_delete AFTER DELETE ON orders BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS orders_fts_update AFTER UPDATE OF {_columns} ON orders BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO {SEARCH_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+]
+
+def create_search_index(conn):
+    # Синхронное соединение (миграция)
+    for ddl in SEARCH_DDL:
+        conn.execute(text(ddl))
+    rebuild_search_index(conn)
+
+def rebuild_search_index(conn):
+    conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+def match_expression(query: str, fields) -> str:
+    """Запрос пользователя -> выражение MATCH: все слова как префиксы, только по полям fields.
+
+    Синтаксис FTS5 (кавычки, операторы, NEAR) из ввода не используется: слова
+    берутся как есть и экранируются. Пустая строка - в запросе нет слов.
+    """
+    terms = re.findall(r"\w+", query)[:MAX_QUERY_TERMS]
+    if not terms:
+        return ""
+    match = " ".join(f'"{term}"*' for term in terms)
+    return f"{{{' '.join(fields)}}} : ({match})"
+
+def search_match(expression: str):
+    return literal_column(SEARCH_TABLE).op("MATCH")(expression)
+
+def search_rank(fields):
+    # bm25 принимает веса по порядку столбцов таблицы; недоступным роли полям вес 0
+    weights = [SEARCH_WEIGHTS[field] if field in fields else 0.0 for field in SEARCH_FIELDS]
+    return func.bm25(literal_column(SEARCH_TABLE), *weights)
+
+async def main(argv):
+    from database import engine
+    if "--rebuild" not in argv:
+        print("Usage: python search.py --rebuild")
+        return
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(rebuild_search_index)
+        print("Search index rebuilt")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,85 @@
+"""
+Сериализация заказов: проекции по ролям и JSON-ответы через orjson.
+
+Набор полей для каждой роли собирается один раз при импорте (attrgetter
+по списку полей), а не ветвлением на каждую строку. Значения остаются
+как есть (datetime, OrderStatus) и кодируются orjson напрямую, без
+.isoformat() по полям и без jsonable_encoder FastAPI.
+
+Проекция принимает и ORM-объект Order, и строку результата select(...)
+с теми же именами столбцов: список заказов читает только столбцы своей
+проекции простыми строками.
+"""
+import functools
+import operator
+from typing import Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse
+from starlette.responses import Response
+
+from images import photo_variants
+
+ORDER_BASE_FIELDS = (
+    "id", "order_number", "customer_name", "customer_requirements", "deadline",
+    "furniture_photo", "material_photo", "status", "created_at", "updated_at",
+)
+# Поля заказа, которые видят только admin и logist
+SENSITIVE_ORDER_FIELDS = ("customer_phone", "customer_address", "phone_agreement_notes", "price")
+ORDER_FIELDS = ORDER_BASE_FIELDS + SENSITIVE_ORDER_FIELDS
+PHOTO_FIELDS = ("furniture_photo", "material_photo")
+# Длинные текстовые поля: в списке только по явному fields=, полностью - в карточке заказа
+LIST_DEFERRED_FIELDS = ("customer_address", "phone_agreement_notes", "customer_requirements")
+
+class OrderProjection:
+    def __init__(self, fields: tuple):
+        self.fields = tuple(fields)
+        getter = operator.attrgetter(*self.fields)
+        # attrgetter с одним полем возвращает значение, а не кортеж
+        self._values = getter if len(self.fields) > 1 else (lambda order: (getter(order),))
+        self._photos = [(f"{field}_variants", field) for field in PHOTO_FIELDS if field in self.fields]
+
+    def __call__(self, order) -> dict:
+        data = dict(zip(self.fields, self._values(order)))
+        for key, field in self._photos:
+            data[key] = photo_variants(data[field])
+        return data
+
+ORDER_PROJECTIONS = {
+    "admin": OrderProjection(ORDER_FIELDS),
+    "logist": OrderProjection(ORDER_FIELDS),
+    # work role gets only basic info
+    "work": OrderProjection(ORDER_BASE_FIELDS),
+}
+
+def order_projection(role: str) -> OrderProjection:
+    return ORDER_PROJECTIONS.get(role, ORDER_PROJECTIONS["work"])
+
+@functools.lru_cache(maxsize=256)
+def list_projection(role: str, fields: Optional[tuple] = None) -> OrderProjection:
+    """Проекция для списка: поля роли без LIST_DEFERRED_FIELDS или запрошенные fields
+    (id всегда; поля, скрытые от роли, отбрасываются)."""
+    visible = order_projection(role).fields
+    if fields is None:
+        return OrderProjection(tuple(field for field in visible if field not in LIST_DEFERRED_FIELDS))
+    return OrderProjection(tuple(field for field in visible if field == "id" or field in fields))
+
+def project_order(order, role: str) -> dict:
+    return order_projection(role)(order)
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def forwarded_headers(response: Optional[Response]) -> Optional[dict]:
+    # Готовый Response FastAPI отдает как есть, поэтому заголовки, выставленные
+    # на параметре response (ETag, X-Next-Cursor, ...), переносятся явно
+    if response is None:
+        return None
+    return {key: value for key, value in response.headers.items() if key != "content-length"}
+
+def json_response(content, response: Optional[Response] = None) -> ORJSONResponse:
+    return ORJSONResponse(content, headers=forwarded_headers(response))
+
+def json_body_response(body: bytes, response: Optional[Response] = None) -> Response:
+    """Ответ с уже сериализованным телом (dumps), например когда по телу считается ETag."""
+    return Response(body, media_type="application/json", headers=forwarded_headers(response))
@@ -0,0 +1,162 @@
+"""
+Раздача загруженных файлов (/uploads) с HTTP-кэшированием.
+
+- Файлы, адресуемые по содержимому ({sha256}{ext}), получают ETag из хеша и
+  Cache-Control: immutable - их содержимое по этому URL никогда не меняется.
+- Производные (миниатюры) и файлы со старыми именами кэшируются с проверкой.
+- If-None-Match / If-Modified-Since обрабатываются по RFC 9110 (304).
+- Поддерживается один диапазон Range: bytes=... (206 / 416) и If-Range.
+- Полный ответ отдается через http.response.pathsend, диапазон - через
+  http.response.zerocopysend, если сервер поддерживает эти расширения ASGI.
+"""
+import os
+import re
+import urllib.parse
+from email.utils import parsedate_to_datetime
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from http_cache import etag_matches
+from images import is_variant
+
+CONTENT_ADDRESSED_RE = re.compile(r"^([0-9a-f]{64})\.[a-z]+$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+VARIANT_CACHE_CONTROL = "public, max-age=604800"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+def parse_range(range_header: str, size: int):
+    """Возвращает (start, end) включительно, None если заголовок нужно игнорировать,
+    или ValueError если диапазон невыполним."""
+    match = RANGE_RE.match(range_header.strip())
+    if not match:
+        # Несколько диапазонов или другие единицы - отдаем файл целиком
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+class FileRangeResponse(Response):
+    chunk_size = 64 * 1024
+
+    def __init__(self, path, start: int, end: int, size: int, headers: dict, media_type: str):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = 206
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": count,
+                })
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.start)
+                remaining = count
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+class CustomStaticFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        # Декодируем URL-кодированные пути
+        decoded_path = urllib.parse.unquote(path)
+        return await super().get_response(decoded_path, scope)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        filename = os.path.basename(full_path)
+
+        headers = {"accept-ranges": "bytes"}
+        match = CONTENT_ADDRESSED_RE.match(filename)
+        if match:
+            headers["etag"] = f'"{match.group(1)}"'
+            headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        elif is_variant(filename):
+            headers["cache-control"] = VARIANT_CACHE_CONTROL
+        else:
+            headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if status_code != 200:
+            return response
+
+        if self.is_not_modified(response.headers, request_headers):
+            not_modified = Response(status_code=304)
+            for header in ("cache-control", "etag", "last-modified", "accept-ranges"):
+                if header in response.headers:
+                    not_modified.headers[header] = response.headers[header]
+            return not_modified
+
+        range_header = request_headers.get("range")
+        if range_header and self.if_range_matches(response.headers, request_headers):
+            size = stat_result.st_size
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                return Response(status_code=416, headers={"content-range": f"bytes */{size}", **headers})
+            if byte_range is not None:
+                range_headers = {key: response.headers[key] for key in ("etag", "last-modified") if key in response.headers}
+                range_headers.update(headers)
+                return FileRangeResponse(full_path, *byte_range, size, range_headers, response.media_type)
+
+        return response
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        # If-None-Match имеет приоритет над If-Modified-Since
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            etag = response_headers.get("etag")
+            return etag is not None and etag_matches(if_none_match, etag)
+        if_modified_since = request_headers.get("if-modified-since")
+        last_modified = response_headers.get("last-modified")
+        if if_modified_since and last_modified:
+            try:
+                return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def if_range_matches(self, response_headers: Headers, request_headers: Headers) -> bool:
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            # If-Range требует строгого совпадения ETag
+            return not if_range.startswith("W/") and if_range == response_headers.get("etag")
+        return if_range == response_headers.get("last-modified")
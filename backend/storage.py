@@ -0,0 +1,128 @@
+"""
+Учет ссылок на загруженные файлы (таблица stored_files).
+
+Файлы в UPLOAD_DIR называются по SHA-256 содержимого, поэтому одинаковые фото
+хранятся один раз, а URL файла никогда не меняется. Каждый заказ, ссылающийся
+на файл, увеличивает ref_count. Когда ссылок не остается, запись остается с
+ref_count = 0 и released_at, а сам файл удаляет сборщик мусора не раньше чем
+через STORAGE_GC_GRACE_SECONDS - так файл не пропадет у параллельного запроса,
+который уже нашел его на диске и еще не закоммитил свою ссылку.
+
+Сборщик удаляет файлы, удерживая блокировку записи БД (его транзакция начинается
+с DELETE), а запрос, добавивший ссылку, под той же блокировкой проверяет, что
+файл на месте (ensure_stored). Поэтому ссылка на удаленный файл не сохраняется.
+
+Сборщик запускается периодически из приложения (STORAGE_GC_INTERVAL) или вручную
+из директории backend:
+    python storage.py gc
+"""
+import asyncio
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import settings
+from images import IMAGE_VARIANTS, variant_filename
+from models import StoredFile
+import uploads
+
+logger = logging.getLogger(__name__)
+
+CONTENT_FILENAME_RE = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+
+async def acquire_file(db: AsyncSession, filename: str, size: int):
+    sha256 = filename.split(".", 1)[0]
+    await db.execute(
+        insert(StoredFile)
+        .values(filename=filename, sha256=sha256, size=size, ref_count=1)
+        .on_conflict_do_update(
+            index_elements=[StoredFile.filename],
+            set_={"ref_count": StoredFile.ref_count + 1, "released_at": None},
+        )
+    )
+
+def ensure_stored(filename: str) -> bool:
+    # Вызывается после acquire_file: транзакция уже держит блокировку записи,
+    # и сборщик мусора не может удалить файл до ее коммита
+    return os.path.exists(os.path.join(uploads.UPLOAD_DIR, filename))
+
+async def release_file(db: AsyncSession, filename: Optional[str]):
+    # Файл без ссылок удаляет сборщик мусора после STORAGE_GC_GRACE_SECONDS
+    if not filename:
+        return
+    await db.execute(
+        update(StoredFile)
+        .where(StoredFile.filename == filename)
+        .values(
+            ref_count=StoredFile.ref_count - 1,
+            released_at=case((StoredFile.ref_count <= 1, datetime.now(timezone.utc)), else_=None),
+        )
+    )
+
+def remove_file_with_variants(filename: str):
+    uploads.remove_upload(filename)
+    for variant in IMAGE_VARIANTS:
+        uploads.remove_upload(variant_filename(filename, variant))
+
+async def collect_garbage(db: AsyncSession, grace_seconds: Optional[float] = None) -> list:
+    """Удаляет файлы без ссылок старше grace_seconds и файлы без записей в stored_files."""
+    grace = settings.storage_gc_grace_seconds if grace_seconds is None else grace_seconds
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=grace)
+    # DELETE первым запросом: с этого момента транзакция держит блокировку записи
+    # до коммита, и новые ссылки (acquire_file) ждут окончания сборки
+    expired = list((await db.execute(
+        delete(StoredFile)
+        .where(StoredFile.ref_count <= 0, StoredFile.released_at < cutoff)
+        .returning(StoredFile.filename)
+    )).scalars())
+    referenced = set((await db.execute(select(StoredFile.filename))).scalars())
+    removed = []
+    for filename in expired:
+        remove_file_with_variants(filename)
+        removed.append(filename)
+    # Файлы без записи (прерванный запрос); свежие могут принадлежать идущей загрузке
+    orphan_cutoff = time.time() - grace
+    for entry in os.scandir(uploads.UPLOAD_DIR):
+        if (
+            entry.is_file()
+            and CONTENT_FILENAME_RE.match(entry.name)
+            and entry.name not in referenced
+            and entry.name not in removed
+            and entry.stat().st_mtime < orphan_cutoff
+        ):
+            remove_file_with_variants(entry.name)
+            removed.append(entry.name)
+    await db.commit()
+    return removed
+
+async def run_periodic_gc(session_factory, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as session:
+                await collect_garbage(session)
+        except Exception:
+            logger.exception("Storage GC failed")
+
+async def main(argv):
+    from database import AsyncSessionLocal, engine
+    if argv != ["gc"]:
+        print(__doc__)
+        return
+    try:
+        async with AsyncSessionLocal() as session:
+            removed = await collect_garbage(session)
+        print(f"[storage] Removed {len(removed)} unreferenced files")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -8,6 +8,12 @@ from main import app
 # TestClient автоматически обрабатывает async функции
 client = TestClient(app)
 
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
 def test_health_check():
     """Тест проверки здоровья API"""
     response = client.get("/health")
@@ -69,3 +75,124 @@ def test_get_me_with_token():
     assert "username" in data
     assert "role" in data
 
+
+def test_token_contains_user_claims():
+    """Тест наличия id, роли и версии токена в claims"""
+    from jose import jwt
+    from routers.auth import SECRET_KEY, ALGORITHM
+    response = client.post(
+        "/api/auth/login",
+        data={"username": "work", "password": "work"}
+    )
+    assert response.status_code == 200
+    payload = jwt.decode(response.json()["access_token"], SECRET_KEY, algorithms=[ALGORITHM])
+    assert payload["sub"] == "work"
+    assert payload["uid"] == response.json()["user"]["id"]
+    assert payload["role"] == "work"
+    assert "ver" in payload
+
+def test_revoke_tokens_invalidates_existing_token():
+    """Тест отзыва выданных токенов пользователя"""
+    work_login = client.post(
+        "/api/auth/login",
+        data={"username": "work", "password": "work"}
+    )
+    work_token = work_login.json()["access_token"]
+    work_id = work_login.json()["user"]["id"]
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {work_token}"}).status_code == 200
+
+    admin_token = client.post(
+        "/api/auth/login",
+        data={"username": "admin1", "password": "nimda"}
+    ).json()["access_token"]
+    response = client.post(
+        f"/api/auth/users/{work_id}/revoke-tokens",
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+    assert response.status_code == 200
+
+    # Старый токен больше не принимается, новый - принимается
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {work_token}"}).status_code == 401
+    new_token = client.post(
+        "/api/auth/login",
+        data={"username": "work", "password": "work"}
+    ).json()["access_token"]
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {new_token}"}).status_code == 200
+
+def test_legacy_token_rejected_for_deactivated_user():
+    """Тест: токен старого формата (только sub) не работает после деактивации"""
+    from datetime import timedelta
+    from routers.auth import create_access_token
+    admin_headers = {"Authorization": "Bearer " + client.post(
+        "/api/auth/login",
+        data={"username": "admin1", "password": "nimda"}
+    ).json()["access_token"]}
+    logist = client.post("/api/auth/login", data={"username": "logist", "password": "logist"}).json()["user"]
+    legacy_headers = {"Authorization": f"Bearer {create_access_token({'sub': 'logist'}, timedelta(minutes=5))}"}
+
+    client.post(f"/api/auth/users/{logist['id']}/deactivate", headers=admin_headers)
+    try:
+        assert client.get("/api/auth/me", headers=legacy_headers).status_code == 401
+    finally:
+        client.post(f"/api/auth/users/{logist['id']}/activate", headers=admin_headers)
+
+def test_verify_password_upgrades_legacy_and_outdated_hashes():
+    """Тест проверки пароля: открытый пароль и хеш с другой стоимостью заменяются актуальным хешем"""
+    from passwords import hash_password, hash_rounds, is_hashed, verify_password
+    from database import settings
+
+    valid, new_hash = verify_password("nimda", "nimda")
+    assert valid and is_hashed(new_hash) and hash_rounds(new_hash) == settings.password_bcrypt_rounds
+    assert verify_password("nimda", new_hash) == (True, None)
+    assert verify_password("wrong", new_hash) == (False, None)
+    assert verify_password("wrong", "nimda") == (False, None)
+
+    valid, upgraded = verify_password("nimda", hash_password("nimda", rounds=4))
+    assert valid and hash_rounds(upgraded) == settings.password_bcrypt_rounds
+
+def test_login_stores_hash_for_plaintext_password():
+    """Тест: вход с паролем, хранившимся в открытом виде, сохраняет bcrypt-хеш"""
+    import asyncio
+    from sqlalchemy import update, select
+    from database import AsyncSessionLocal, engine
+    from models import User
+    from passwords import is_hashed
+
+    async def set_stored(value=None):
+        try:
+            async with AsyncSessionLocal() as session:
+                if value is not None:
+                    await session.execute(update(User).where(User.username == "admin2").values(hashed_password=value))
+                    await session.commit()
+                return (await session.execute(select(User.hashed_password).where(User.username == "admin2"))).scalar_one()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(set_stored("nimda"))
+    response = client.post("/api/auth/login", data={"username": "admin2", "password": "nimda"})
+    assert response.status_code == 200
+    stored = asyncio.run(set_stored())
+    assert is_hashed(stored) and stored != "nimda"
+    assert client.post("/api/auth/login", data={"username": "admin2", "password": "nimda"}).status_code == 200
+
+def test_login_attempts_limited_per_username():
+    """Тест ограничения попыток входа: 429 после лимита, другие пользователи не затронуты"""
+    from routers.auth import login_limiter
+    username = "rate-limited-user"
+    try:
+        for _ in range(login_limiter.max_attempts):
+            response = client.post("/api/auth/login", data={"username": username, "password": "wrong"})
+            assert response.status_code == 401
+        response = client.post("/api/auth/login", data={"username": username, "password": "wrong"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert client.post("/api/auth/login", data={"username": "work", "password": "work"}).status_code == 200
+    finally:
+        login_limiter.reset(username)
+
+    # Успешный вход сбрасывает счетчик неудачных попыток
+    for _ in range(login_limiter.max_attempts - 1):
+        client.post("/api/auth/login", data={"username": "work", "password": "wrong"})
+    assert client.post("/api/auth/login", data={"username": "work", "password": "work"}).status_code == 200
+    assert client.post("/api/auth/login", data={"username": "work", "password": "wrong"}).status_code == 401
+    login_limiter.reset("work")
@@ -0,0 +1,30 @@
+"""
+Тесты настройки подключения к базе данных
+"""
+import asyncio
+import pytest
+from sqlalchemy import text
+from database import build_engine, settings
+
+def test_sqlite_pragmas_applied(tmp_path):
+    """Тест применения PRAGMA к новым соединениям SQLite"""
+    async def read_pragmas():
+        engine = build_engine(f"sqlite+aiosqlite:///{tmp_path / 'pragmas.db'}", pool_mode="queue")
+        try:
+            async with engine.connect() as conn:
+                journal_mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+                busy_timeout = (await conn.execute(text("PRAGMA busy_timeout"))).scalar()
+                synchronous = (await conn.execute(text("PRAGMA synchronous"))).scalar()
+        finally:
+            await engine.dispose()
+        return journal_mode, busy_timeout, synchronous
+
+    journal_mode, busy_timeout, synchronous = asyncio.run(read_pragmas())
+    assert journal_mode.lower() == settings.sqlite_journal_mode.lower()
+    assert busy_timeout == settings.sqlite_busy_timeout
+    assert synchronous == 1  # NORMAL
+
+def test_build_engine_unknown_pool_mode():
+    """Тест ошибки при неизвестном режиме пула"""
+    with pytest.raises(ValueError):
+        build_engine("sqlite+aiosqlite:///:memory:", pool_mode="bogus")
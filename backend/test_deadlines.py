@@ -0,0 +1,136 @@
+"""
+Тесты планировщика оповещений о сроках заказов
+"""
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from database import AsyncSessionLocal, engine
+from deadlines import DUE_SOON, OVERDUE, DeadlineScheduler, deadline_scheduler
+from events import order_events
+from models import OrderStatus
+from routers.orders import publish_deadline_alert
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
+def login(username, password):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": username, "password": password}
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_scheduler_fires_in_deadline_order():
+    """Тест срабатывания оповещений по возрастанию момента и пропуска устаревших сроков"""
+    scheduler = DeadlineScheduler(due_soon_seconds=3600)
+    now = datetime(2030, 1, 1, 12, 0)
+    scheduler.track(1, now + timedelta(hours=5), OrderStatus.confirmed)
+    scheduler.track(2, now + timedelta(minutes=30), OrderStatus.in_progress)
+    scheduler.track(3, now + timedelta(minutes=10), OrderStatus.ready)
+    # Срок перенесен: старые записи в куче больше не срабатывают
+    scheduler.track(3, now + timedelta(hours=10), OrderStatus.ready)
+
+    assert scheduler.pop_due(now) == [
+        (DUE_SOON, 2, now + timedelta(minutes=30), OrderStatus.in_progress),
+    ]
+    assert scheduler.seconds_until_next(now) == 30 * 60
+    assert [(alert, order_id) for alert, order_id, _, _ in scheduler.pop_due(now + timedelta(hours=5))] == [
+        (OVERDUE, 2), (DUE_SOON, 1), (OVERDUE, 1),
+    ]
+    # Правка других полей просроченного заказа не повторяет оповещение
+    scheduler.track(2, now + timedelta(minutes=30), OrderStatus.ready)
+    scheduler.forget(3)
+    assert scheduler.pop_due(now + timedelta(days=1)) == []
+
+def test_scheduler_skips_delivered_and_loads_future_deadlines():
+    """Тест начальной загрузки: только незавершенные заказы со сроком в будущем"""
+    headers = login("admin1", "nimda")
+    deadline = datetime.utcnow() + timedelta(days=3)
+    order_id = client.post(
+        "/api/orders/",
+        data={"customer_name": "Deadline Customer", "customer_phone": "+79991234567", "customer_address": "Addr"},
+        headers=headers
+    ).json()["id"]
+    client.put(f"/api/orders/{order_id}", data={"deadline": deadline.isoformat()}, headers=headers)
+
+    async def load():
+        try:
+            scheduler = DeadlineScheduler(due_soon_seconds=3600)
+            await scheduler.load(AsyncSessionLocal)
+            return scheduler
+        finally:
+            await engine.dispose()
+
+    scheduler = asyncio.run(load())
+    fired = scheduler.pop_due(deadline + timedelta(seconds=1))
+    assert (OVERDUE, order_id) in [(alert, fired_id) for alert, fired_id, _, _ in fired]
+
+    scheduler.track(order_id, deadline, OrderStatus.delivered)
+    scheduler.track(order_id, deadline + timedelta(days=1), OrderStatus.delivered)
+    assert scheduler.pop_due(deadline + timedelta(days=2)) == []
+    client.delete(f"/api/orders/{order_id}", headers=headers)
+
+def test_restart_alerts_orders_already_overdue():
+    """Тест перезапуска: незавершенный заказ, просроченный до запуска, получает одно оповещение"""
+    headers = login("admin1", "nimda")
+    deadline = datetime.utcnow() - timedelta(days=2)
+    order_id = client.post(
+        "/api/orders/",
+        data={"customer_name": "Overdue Customer", "customer_phone": "+79991234567", "customer_address": "Addr"},
+        headers=headers
+    ).json()["id"]
+    client.put(f"/api/orders/{order_id}", data={"deadline": deadline.isoformat()}, headers=headers)
+
+    async def restart():
+        published = []
+        scheduler = DeadlineScheduler(due_soon_seconds=3600)
+        task = asyncio.create_task(scheduler.run(AsyncSessionLocal, lambda *alert: published.append(alert)))
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if any(alert[1] == order_id for alert in published):
+                    break
+        finally:
+            task.cancel()
+            await engine.dispose()
+        return scheduler, published
+
+    scheduler, published = asyncio.run(restart())
+    assert [alert for alert, fired_id, _, _ in published if fired_id == order_id] == [OVERDUE]
+    assert [alert["alert"] for alert in scheduler.recent if alert["order_id"] == order_id] == [OVERDUE]
+    assert all(fired_id != order_id for _, fired_id, _, _ in scheduler.pop_due(datetime.utcnow() + timedelta(days=1)))
+    client.delete(f"/api/orders/{order_id}", headers=headers)
+
+def test_deadline_changes_reach_scheduler_and_feed():
+    """Тест: обработчики передают срок планировщику, оповещение уходит ролям, которым виден заказ"""
+    headers = login("admin1", "nimda")
+    order_id = client.post(
+        "/api/orders/",
+        data={"customer_name": "Deadline Customer", "customer_phone": "+79991234567", "customer_address": "Addr"},
+        headers=headers
+    ).json()["id"]
+    deadline = datetime.utcnow() + timedelta(hours=1)
+    client.put(f"/api/orders/{order_id}", data={"deadline": deadline.isoformat()}, headers=headers)
+    assert deadline_scheduler._orders[order_id][0] == deadline
+
+    admin = order_events.subscribe("admin")
+    work = order_events.subscribe("work")
+    try:
+        publish_deadline_alert(OVERDUE, order_id, deadline, OrderStatus.draft)
+        event = admin.queue.get_nowait()
+        assert event["type"] == "deadline" and event["alert"] == OVERDUE and event["order_id"] == order_id
+        assert work.queue.empty()
+    finally:
+        order_events.unsubscribe(admin)
+        order_events.unsubscribe(work)
+
+    client.delete(f"/api/orders/{order_id}", headers=headers)
+    assert order_id not in deadline_scheduler._orders
@@ -0,0 +1,146 @@
+"""
+Тесты ленты изменений заказов
+"""
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from events import OrderEventBroker, order_events, format_sse
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
+def login(username, password):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": username, "password": password}
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def drain(subscription):
+    events = []
+    while not subscription.queue.empty():
+        events.append(subscription.queue.get_nowait())
+    return events
+
+def test_slow_subscriber_gets_resync_instead_of_unbounded_queue():
+    """Тест ограничения очереди медленного клиента"""
+    broker = OrderEventBroker(queue_size=3)
+    slow = broker.subscribe("admin")
+    for i in range(10):
+        broker.publish({"admin": {"type": "order", "order": {"id": i}}})
+    events = drain(slow)
+    assert len(events) <= 3
+    assert any(event["type"] == "resync" for event in events)
+    assert slow.dropped > 0
+
+def test_events_filtered_by_role():
+    """Тест доставки событий только ролям, которым они адресованы"""
+    broker = OrderEventBroker(queue_size=10)
+    admin = broker.subscribe("admin")
+    work = broker.subscribe("work")
+    broker.publish({"admin": {"type": "order", "order": {"id": 1}}})
+    assert len(drain(admin)) == 1
+    assert drain(work) == []
+
+def test_order_lifecycle_events_respect_role_visibility():
+    """Тест событий жизненного цикла заказа с учетом видимости по ролям"""
+    admin_headers = login("admin1", "nimda")
+    admin = order_events.subscribe("admin")
+    logist = order_events.subscribe("logist")
+    work = order_events.subscribe("work")
+    try:
+        order_id = client.post(
+            "/api/orders/",
+            data={"customer_name": "Live Customer", "customer_phone": "+79990000000", "customer_address": "Street 1"},
+            headers=admin_headers
+        ).json()["id"]
+        client.post(f"/api/orders/{order_id}/submit", headers=admin_headers)
+        client.post(f"/api/orders/{order_id}/confirm", headers=admin_headers)
+
+        admin_events = drain(admin)
+        assert [e["action"] for e in admin_events] == ["created", "submitted_for_confirmation", "confirmed"]
+        assert admin_events[-1]["order"]["status"] == "confirmed"
+        assert admin_events[-1]["order"]["customer_phone"] == "+79990000000"
+
+        # Логист видит заказ только после подтверждения, мастерская - пока нет
+        logist_events = drain(logist)
+        assert [e["action"] for e in logist_events] == ["confirmed"]
+        assert drain(work) == []
+
+        client.put(
+            f"/api/orders/{order_id}/details",
+            data={"customer_requirements": "Oak", "deadline": "2030-01-01T00:00:00", "price": "1000"},
+            headers=admin_headers
+        )
+        # Заказ ушел из списка логиста и появился у мастерской без контактов клиента
+        assert [e["type"] for e in drain(logist)] == ["removed"]
+        work_events = drain(work)
+        assert [e["type"] for e in work_events] == ["order"]
+        assert "customer_phone" not in work_events[0]["order"]
+
+        client.delete(f"/api/orders/{order_id}", headers=admin_headers)
+        deleted = drain(work)[-1]
+        assert (deleted["type"], deleted["action"], deleted["order_id"]) == ("removed", "deleted", order_id)
+    finally:
+        for subscription in (admin, logist, work):
+            order_events.unsubscribe(subscription)
+
+def test_format_sse():
+    """Тест формата события Server-Sent Events"""
+    assert format_sse({"type": "resync", "id": 7}) == 'id: 7\nevent: resync\ndata: {"type":"resync","id":7}\n\n'
+
+def test_event_stream_requires_valid_token():
+    """Тест отказа в подписке без корректного токена"""
+    assert client.get("/api/orders/events", params={"token": "invalid"}).status_code == 401
+    assert client.get("/api/orders/events").status_code == 422
+
+def test_event_stream_accepts_only_stream_tokens():
+    """Тест разделения основного JWT и короткоживущего токена подписки"""
+    headers = login("admin1", "nimda")
+    access_token = headers["Authorization"].split()[1]
+    assert client.get("/api/orders/events", params={"token": access_token}).status_code == 401
+
+    response = client.post("/api/orders/events/token", headers=headers)
+    assert response.status_code == 200
+    stream_token = response.json()["token"]
+    assert response.json()["expires_in"] <= 60
+    assert client.get("/api/auth/me", headers={"Authorization": f"Bearer {stream_token}"}).status_code == 401
+
+def test_event_stream_closed_after_token_revocation(monkeypatch):
+    """Тест закрытия открытой ленты после отзыва токенов пользователя"""
+    import asyncio
+    from database import AsyncSessionLocal, engine, settings
+    from models import User
+    from routers.auth import revoke_user_tokens
+    from routers.orders import order_events_stream
+
+    monkeypatch.setattr(settings, "event_heartbeat_interval", 0.05)
+    work_headers = login("work", "work")
+    work_id = client.get("/api/auth/me", headers=work_headers).json()["id"]
+    stream_token = client.post("/api/orders/events/token", headers=work_headers).json()["token"]
+
+    class ConnectedRequest:
+        async def is_disconnected(self):
+            return False
+
+    async def scenario():
+        # TestClient не отдает тело потока до его завершения, поэтому генератор читается напрямую
+        try:
+            async with AsyncSessionLocal() as db:
+                response = await order_events_stream(ConnectedRequest(), stream_token, db)
+                body = response.body_iterator
+                assert await body.__anext__() == "retry: 3000\n\n"
+                assert await body.__anext__() == ": ping\n\n"
+                await revoke_user_tokens(db, await db.get(User, work_id))
+                # Поток должен завершиться сам на ближайшем heartbeat
+                return [chunk async for chunk in body]
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 5)) == []
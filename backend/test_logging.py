@@ -0,0 +1,94 @@
+"""
+Тесты структурированного журналирования
+"""
+import asyncio
+import io
+import json
+import logging
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from logging_config import JsonFormatter, PreparedQueueHandler, RequestLogMiddleware, SampleFilter, parse_levels
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
+def test_login_does_not_log_password(caplog):
+    """Тест: вход пишет структурированную запись без пароля"""
+    with caplog.at_level(logging.INFO):
+        client.post("/api/auth/login", data={"username": "admin1", "password": "nimda"})
+        client.post("/api/auth/login", data={"username": "admin1", "password": "wrong-secret"})
+    auth_records = [record for record in caplog.records if record.name == "routers.auth"]
+    assert [record.getMessage() for record in auth_records] == ["Login succeeded", "Login failed: invalid password"]
+    assert auth_records[0].username == "admin1"
+    for record in caplog.records:
+        text = record.getMessage() + json.dumps({k: str(v) for k, v in vars(record).items()})
+        assert "nimda" not in text and "wrong-secret" not in text
+
+def test_json_record_through_queue_handler():
+    """Тест формата записи: одна строка JSON с полями из extra и текстом исключения"""
+    records = []
+
+    class ListQueue:
+        def put_nowait(self, record):
+            records.append(record)
+
+    logger = logging.getLogger("test_logging.json")
+    logger.propagate = False
+    handler = PreparedQueueHandler(ListQueue())
+    logger.addHandler(handler)
+    try:
+        values = ["a"]
+        logger.warning("value %s", values, extra={"order_id": 7})
+        values.append("b")  # Сообщение уже собрано в вызывающем потоке
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("failed")
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+
+    first, second = (json.loads(JsonFormatter().format(record)) for record in records)
+    assert first["msg"] == "value ['a']" and first["order_id"] == 7 and first["level"] == "WARNING"
+    assert first["logger"] == "test_logging.json" and first["ts"].endswith("+00:00")
+    assert second["msg"] == "failed" and "ValueError: boom" in second["exc"]
+
+def test_request_log_sampling_keeps_errors():
+    """Тест выборки журнала запросов: INFO отбрасываются, ошибки сервера пишутся всегда"""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    request_logger = logging.getLogger("requests")
+    request_logger.addHandler(handler)
+    sample = SampleFilter(0.0)
+    request_logger.addFilter(sample)
+
+    async def ok_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def failing_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 503, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop_send(message):
+        pass
+
+    async def drive():
+        for inner in (ok_app, ok_app, failing_app):
+            await RequestLogMiddleware(inner)({"type": "http", "method": "GET", "path": "/x"}, None, noop_send)
+
+    try:
+        asyncio.run(drive())
+    finally:
+        request_logger.removeFilter(sample)
+        request_logger.removeHandler(handler)
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line["level"], line["status"]) for line in lines] == [("ERROR", 503)]
+    assert parse_levels("requests=warning, routers.auth=DEBUG") == {"requests": "WARNING", "routers.auth": "DEBUG"}
@@ -0,0 +1,60 @@
+"""
+Тесты метрик в формате Prometheus
+"""
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from database import settings
+from metrics import Histogram, route_label
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
+def metric_value(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+def test_metrics_count_requests_by_route_template():
+    """Тест: запросы учитываются по шаблону маршрута, запросы к БД - по типу"""
+    token = client.post("/api/auth/login", data={"username": "admin1", "password": "nimda"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    sample = 'http_request_duration_seconds_count{method="GET",route="/api/orders/{order_id}",status="404"}'
+    before = client.get("/metrics").text
+    client.get("/api/orders/999999999", headers=headers)
+    client.get("/api/orders/999999998", headers=headers)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert metric_value(response.text, sample) == metric_value(before, sample) + 2
+    assert metric_value(response.text, 'db_query_duration_seconds_count{kind="select"}') > metric_value(before, 'db_query_duration_seconds_count{kind="select"}')
+    assert "/999999999" not in response.text
+    assert 'db_pool_connections{state="checked_out"}' in response.text
+
+def test_metrics_token(monkeypatch):
+    """Тест защиты /metrics токеном, если он задан"""
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+
+def test_histogram_buckets_are_cumulative():
+    """Тест формата гистограммы: накопительные корзины, +Inf, экранирование меток"""
+    histogram = Histogram("t_seconds", "Test.", ("route",), (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(('a"b',), value)
+    lines = [f"{name}{labels} {value}" for name, labels, value in histogram.samples()]
+    assert lines == [
+        't_seconds_bucket{route="a\\"b",le="0.1"} 2',
+        't_seconds_bucket{route="a\\"b",le="1.0"} 3',
+        't_seconds_bucket{route="a\\"b",le="+Inf"} 4',
+        't_seconds_sum{route="a\\"b"} 3.65',
+        't_seconds_count{route="a\\"b"} 4',
+    ]
+    assert route_label({"root_path": "/uploads"}) == "/uploads/{path}"
+    assert route_label({"root_path": ""}) == "unmatched"
@@ -0,0 +1,173 @@
+"""
+Тесты миграций схемы и использования индексов (EXPLAIN QUERY PLAN)
+"""
+import asyncio
+from sqlalchemy import select, func, text
+from database import build_engine
+from migrations import MIGRATIONS, migrate
+from models import Order, OrderEditHistory, OrderStatus
+from routers.orders import keyset_condition, keyset_order_by, keyset_page_query, keyset_segments
+
+BASELINE_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, hashed_password VARCHAR,
+        role VARCHAR(6) NOT NULL, is_active BOOLEAN, created_at DATETIME)""",
+    """CREATE TABLE orders (
+        id INTEGER NOT NULL PRIMARY KEY, order_number INTEGER UNIQUE, customer_name VARCHAR NOT NULL,
+        customer_phone VARCHAR NOT NULL, customer_address TEXT NOT NULL, phone_agreement_notes TEXT,
+        customer_requirements TEXT, deadline DATETIME, price INTEGER, material_photo VARCHAR,
+        furniture_photo VARCHAR, status VARCHAR(20), created_by INTEGER, updated_by INTEGER,
+        created_at DATETIME, updated_at DATETIME)""",
+    """CREATE TABLE order_edit_history (
+        id INTEGER NOT NULL PRIMARY KEY, order_id INTEGER, user_id INTEGER, action VARCHAR NOT NULL,
+        field_changes TEXT, timestamp DATETIME)""",
+]
+
+def run(coro):
+    return asyncio.run(coro)
+
+def query_plan(db_path, statement) -> str:
+    async def explain():
+        engine = build_engine(f"sqlite+aiosqlite:///{db_path}", pool_mode="null")
+        try:
+            await migrate(engine)
+            async with engine.connect() as conn:
+                sql = str(statement.compile(engine.sync_engine, compile_kwargs={"literal_binds": True}))
+                rows = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")).all()
+        finally:
+            await engine.dispose()
+        return "\n".join(row[-1] for row in rows)
+    return run(explain())
+
+def test_migrations_on_empty_database(tmp_path):
+    """Тест применения всех миграций к пустой БД и повторного запуска"""
+    async def apply_twice():
+        engine = build_engine(f"sqlite+aiosqlite:///{tmp_path / 'empty.db'}", pool_mode="null")
+        try:
+            return await migrate(engine), await migrate(engine)
+        finally:
+            await engine.dispose()
+
+    first, second = run(apply_twice())
+    assert first == [version for version, _, _ in MIGRATIONS]
+    assert second == []
+
+def test_migrations_upgrade_baseline_database(tmp_path):
+    """Тест обновления БД, созданной до появления миграций"""
+    async def upgrade():
+        engine = build_engine(f"sqlite+aiosqlite:///{tmp_path / 'baseline.db'}", pool_mode="null")
+        try:
+            async with engine.begin() as conn:
+                for ddl in BASELINE_SCHEMA:
+                    await conn.exec_driver_sql(ddl)
+                await conn.exec_driver_sql("INSERT INTO users (username, role) VALUES ('old', 'admin')")
+            await migrate(engine)
+            async with engine.connect() as conn:
+                token_version = (await conn.execute(text("SELECT token_version FROM users"))).scalar()
+                indexes = set((await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))).scalars())
+        finally:
+            await engine.dispose()
+        return token_version, indexes
+
+    token_version, indexes = run(upgrade())
+    assert token_version == 0
+    assert {
+        "ix_orders_status_created_at",
+        "ix_orders_status_deadline",
+        "ix_order_edit_history_order_id_timestamp",
+        "ix_orders_phone_key",
+    } <= indexes
+
+def test_order_list_by_status_uses_index(tmp_path):
+    """Тест использования индекса (status, created_at) списком заказов"""
+    statement = (
+        select(Order)
+        .where(Order.status == OrderStatus.confirmed)
+        .order_by(*keyset_order_by(Order.created_at, Order.id, descending=True))
+        .limit(51)
+    )
+    plan = query_plan(tmp_path / "plan.db", statement)
+    assert "ix_orders_status_created_at" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_order_list_by_deadline_uses_index(tmp_path):
+    """Тест использования индекса (status, deadline) при фильтре по сроку"""
+    statement = (
+        select(Order)
+        .where(Order.status.in_([OrderStatus.in_progress, OrderStatus.ready]))
+        .where(Order.deadline < "2030-01-01 00:00:00")
+    )
+    plan = query_plan(tmp_path / "plan.db", statement)
+    assert "ix_orders_status_deadline" in plan
+
+def test_order_list_keyset_page_uses_index(tmp_path):
+    """Тест поиска следующей страницы по индексу без полного сканирования"""
+    from datetime import datetime
+    statement = (
+        select(Order)
+        .where(keyset_condition(Order.created_at, Order.id, True, datetime(2030, 1, 1), 100))
+        .order_by(*keyset_order_by(Order.created_at, Order.id, descending=True))
+        .limit(51)
+    )
+    plan = query_plan(tmp_path / "plan.db", statement)
+    assert "ix_orders_created_at" in plan
+    assert "SCAN orders\n" not in plan + "\n"
+
+def test_order_history_uses_index(tmp_path):
+    """Тест использования индекса (order_id, timestamp) историей заказа"""
+    statement = (
+        select(OrderEditHistory)
+        .where(OrderEditHistory.order_id == 1)
+        .order_by(OrderEditHistory.timestamp.desc())
+    )
+    plan = query_plan(tmp_path / "plan.db", statement)
+    assert "ix_order_edit_history_order_id_timestamp" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_customer_phone_prefix_uses_index(tmp_path):
+    """Тест поиска клиентов по началу телефона диапазоном по индексу phone_key"""
+    from phones import phone_key_range
+    key_from, key_to = phone_key_range("+7999")
+    statement = (
+        select(Order.phone_key)
+        .where(Order.phone_key >= key_from, Order.phone_key < key_to)
+        .group_by(Order.phone_key)
+        .limit(10)
+    )
+    plan = query_plan(tmp_path / "plan.db", statement)
+    assert "COVERING INDEX ix_orders_phone_key" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_max_order_number_uses_index(tmp_path):
+    """Тест поиска MAX(order_number) по уникальному индексу"""
+    plan = query_plan(tmp_path / "plan.db", select(func.max(Order.order_number)))
+    assert "INDEX" in plan
+
+def test_order_list_role_statuses_read_index_per_status(tmp_path):
+    """Тест: список для роли с несколькими статусами читает индекс по каждому статусу без сортировки всех строк"""
+    from datetime import datetime
+    where, columns = keyset_segments(
+        Order.created_at, Order.id, True, False, (datetime(2030, 1, 1), 100)
+    )[0]
+    statement = keyset_page_query([Order], [], [OrderStatus.confirmed, OrderStatus.ready], where, columns, True, 51)
+    plan = query_plan(tmp_path / "plan.db", statement)
+    assert plan.count("ix_orders_status_created_at") == 2
+    assert "SCAN orders" not in plan
+    # Сортируются только уже ограниченные LIMIT ветки (не более 51 строки каждая), не таблица
+    lines = plan.splitlines()
+    assert all(lines[i - 1].startswith("SCAN anon") for i, line in enumerate(lines) if "TEMP B-TREE" in line)
+
+def test_order_list_by_deadline_pages_nulls_separately(tmp_path):
+    """Тест: сортировка по сроку идет по индексу (deadline, id), пустые сроки - отдельным запросом"""
+    from datetime import datetime
+    segments = keyset_segments(Order.deadline, Order.id, False, True, (datetime(2030, 1, 1), 100))
+    assert len(segments) == 2
+    for where, columns in segments:
+        plan = query_plan(tmp_path / "plan.db", keyset_page_query([Order], [], None, where, columns, False, 51))
+        assert "ix_orders_deadline" in plan
+        assert "TEMP B-TREE" not in plan
+
+    where, columns = keyset_segments(Order.deadline, Order.id, False, True)[0]
+    statement = keyset_page_query([Order], [], [OrderStatus.in_progress, OrderStatus.ready], where, columns, False, 51)
+    plan = query_plan(tmp_path / "plan.db", statement)
+    assert plan.count("ix_orders_status_deadline") == 2
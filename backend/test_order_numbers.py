@@ -0,0 +1,166 @@
+"""
+Тесты выдачи номеров заказов
+"""
+import asyncio
+import httpx
+import pytest
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import order_numbers
+from database import build_engine, engine as app_engine
+from main import app
+from migrations import migrate
+from models import FreeOrderNumber, Order, OrderNumberCounter
+from order_numbers import (
+    OrderNumberAllocator, OrderNumbersExhausted, claim_number, free_number, order_number_allocator,
+    reclaim_lost_numbers, seed_counter, take_numbers,
+)
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def open_database(db_path):
+    engine = build_engine(f"sqlite+aiosqlite:///{db_path}", pool_mode="null")
+    await migrate(engine)
+    return engine, sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+def add_order(session, number):
+    session.add(Order(customer_name="N", customer_phone="1", customer_address="A", order_number=number))
+
+def test_seed_counter_continues_after_existing_numbers(tmp_path):
+    """Тест начального заполнения: продолжение нумерации и пропуски как свободные номера"""
+    async def scenario():
+        engine, session_factory = await open_database(tmp_path / "seed.db")
+        try:
+            async with session_factory() as session:
+                await session.execute(delete(OrderNumberCounter))
+                for number in (1, 2, 5):
+                    add_order(session, number)
+                await session.commit()
+            async with engine.begin() as conn:
+                await conn.run_sync(seed_counter)
+            async with session_factory() as session:
+                next_value = await session.scalar(select(OrderNumberCounter.next_value))
+                free = list((await session.execute(select(FreeOrderNumber.number).order_by(FreeOrderNumber.number))).scalars())
+                return next_value, free
+        finally:
+            await engine.dispose()
+
+    assert run(scenario()) == (6, [3, 4])
+
+def test_take_numbers_skips_taken_reuses_freed_and_reports_exhaustion(tmp_path, monkeypatch):
+    """Тест выдачи: пропуск занятых вручную номеров, переход к освобожденным, исчерпание"""
+    monkeypatch.setattr(order_numbers, "ORDER_NUMBER_MAX", 5)
+
+    async def scenario():
+        engine, session_factory = await open_database(tmp_path / "numbers.db")
+        try:
+            async with session_factory() as session:
+                add_order(session, 3)  # назначен вручную
+                await claim_number(session, 3)
+                issued = await take_numbers(session, 4)
+                await session.commit()
+
+                await free_number(session, 2)
+                await free_number(session, 9)  # вне выданного диапазона - игнорируется
+                await session.commit()
+                wrapped = await take_numbers(session, 1)
+                await session.commit()
+                status = await OrderNumberAllocator(1, session_factory).status(session)
+                try:
+                    await take_numbers(session, 1)
+                    exhausted = False
+                except OrderNumbersExhausted:
+                    exhausted = True
+                return issued, wrapped, status, exhausted
+        finally:
+            await engine.dispose()
+
+    issued, wrapped, status, exhausted = run(scenario())
+    assert issued == [1, 2, 4, 5]
+    assert wrapped == [2]
+    assert status["wrapped"] and status["exhausted"] and status["remaining"] == 0
+    assert exhausted
+
+def test_block_allocator_returns_unused_numbers(tmp_path):
+    """Тест резервирования блоками и возврата невыданных номеров"""
+    async def scenario():
+        engine, session_factory = await open_database(tmp_path / "blocks.db")
+        allocator = OrderNumberAllocator(5, session_factory)
+        try:
+            async with session_factory() as session:
+                first = [await allocator.allocate(session) for _ in range(2)]
+                reserved = allocator.reserved_count
+            await allocator.release_unused()
+            async with session_factory() as session:
+                free = list((await session.execute(select(FreeOrderNumber.number).order_by(FreeOrderNumber.number))).scalars())
+                next_value = await session.scalar(select(OrderNumberCounter.next_value))
+            return first, reserved, free, next_value
+        finally:
+            await engine.dispose()
+
+    assert run(scenario()) == ([1, 2], 3, [3, 4, 5], 6)
+
+def test_reclaim_numbers_lost_with_reserved_block(tmp_path):
+    """Тест возврата номеров из блока, потерянного при аварийной остановке"""
+    async def scenario():
+        engine, session_factory = await open_database(tmp_path / "crash.db")
+        try:
+            crashed = OrderNumberAllocator(5, session_factory)
+            async with session_factory() as session:
+                issued = await crashed.allocate(session)
+                add_order(session, issued)
+                await session.commit()
+            # Процесс упал: release_unused не вызван, номера 2-5 нигде не учтены
+            async with session_factory() as session:
+                lost = await reclaim_lost_numbers(session)
+                await session.commit()
+                again = await take_numbers(session, 5)
+            return issued, lost, again
+        finally:
+            await engine.dispose()
+
+    issued, lost, again = run(scenario())
+    assert issued == 1
+    assert lost == [2, 3, 4, 5]
+    assert again == [6, 7, 8, 9, 10]
+
+@pytest.mark.parametrize("block_size", [1, 4])
+def test_concurrent_confirm_gets_unique_numbers(monkeypatch, block_size):
+    """Стресс-тест: параллельное подтверждение заказов без повторов номеров"""
+    monkeypatch.setattr(order_number_allocator, "block_size", block_size)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/auth/login", data={"username": "admin1", "password": "nimda"})
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            order_ids = []
+            for i in range(20):
+                created = await client.post(
+                    "/api/orders/",
+                    data={"customer_name": f"Stress {i}", "customer_phone": "+79990000000", "customer_address": "A"},
+                    headers=headers
+                )
+                order_id = created.json()["id"]
+                await client.post(f"/api/orders/{order_id}/submit", headers=headers)
+                order_ids.append(order_id)
+
+            responses = await asyncio.gather(*(
+                client.post(f"/api/orders/{order_id}/confirm", headers=headers) for order_id in order_ids
+            ))
+            orders = [(await client.get(f"/api/orders/{order_id}", headers=headers)).json() for order_id in order_ids]
+            for order_id in order_ids:
+                await client.delete(f"/api/orders/{order_id}", headers=headers)
+            await order_number_allocator.release_unused()
+        # Пул соединений привязан к event loop, а каждый тест запускает свой
+        await app_engine.dispose()
+        return responses, orders
+
+    responses, orders = run(scenario())
+    assert [r.status_code for r in responses] == [200] * len(responses)
+    numbers = [order["order_number"] for order in orders]
+    assert None not in numbers
+    assert len(set(numbers)) == len(numbers)
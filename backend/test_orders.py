@@ -7,6 +7,12 @@ from main import app
 
 client = TestClient(app)
 
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
 def get_admin_token():
     """Получить токен администратора"""
     response = client.post(
@@ -87,3 +93,651 @@ def test_get_order_not_found():
     )
     assert response.status_code == 404
 
+
+def test_get_orders_keyset_pagination():
+    """Тест постраничной выдачи заказов по курсору"""
+    token = get_admin_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(3):
+        client.post(
+            "/api/orders/",
+            data={
+                "customer_name": f"Paged Customer {i}",
+                "customer_phone": "+79991234567",
+                "customer_address": "Test Address 123"
+            },
+            headers=headers
+        )
+
+    response = client.get(
+        "/api/orders/",
+        params={"limit": 2, "include_total": True},
+        headers=headers
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page) == 2
+    assert int(response.headers["X-Total-Count"]) >= 3
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(
+        "/api/orders/",
+        params={"limit": 2, "cursor": cursor},
+        headers=headers
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert second_page
+    first_ids = {order["id"] for order in first_page}
+    assert not first_ids & {order["id"] for order in second_page}
+    # По умолчанию сортировка по created_at, id по убыванию
+    assert max(order["id"] for order in second_page) < min(first_ids)
+
+def test_get_orders_paged_by_default():
+    """Тест: без limit отдается первая страница, весь список - только по limit=0"""
+    from routers.orders import DEFAULT_PAGE_SIZE
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    total = int(client.get("/api/orders/", params={"include_total": True}, headers=headers).headers["X-Total-Count"])
+    for i in range(max(DEFAULT_PAGE_SIZE + 1 - total, 0)):
+        client.post(
+            "/api/orders/",
+            data={"customer_name": f"Default Page {i}", "customer_phone": "+79991234567", "customer_address": "Addr"},
+            headers=headers
+        )
+
+    response = client.get("/api/orders/", headers=headers)
+    assert len(response.json()) == DEFAULT_PAGE_SIZE
+    assert "X-Next-Cursor" in response.headers
+
+    response = client.get("/api/orders/", params={"limit": 0}, headers=headers)
+    assert len(response.json()) > DEFAULT_PAGE_SIZE
+    assert "X-Next-Cursor" not in response.headers
+
+def test_get_orders_deadline_pages_match_full_list():
+    """Тест: страницы по сроку (с пустыми сроками и несколькими статусами) совпадают с полным списком"""
+    from datetime import datetime, timedelta
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    created_from = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    for i, deadline in enumerate(["2031-05-01T10:00:00", None, "2031-05-01T10:00:00", None, "2030-01-01T10:00:00"]):
+        order_id = client.post(
+            "/api/orders/",
+            data={"customer_name": f"Deadline Customer {i}", "customer_phone": "+79991234567", "customer_address": "Addr"},
+            headers=headers
+        ).json()["id"]
+        if deadline:
+            client.put(f"/api/orders/{order_id}", data={"deadline": deadline}, headers=headers)
+        if i % 2:
+            client.post(f"/api/orders/{order_id}/submit", headers=headers)
+            client.post(f"/api/orders/{order_id}/confirm", headers=headers)
+
+    for direction in ("asc", "desc"):
+        params = {"status_filter": "draft,confirmed", "sort": "deadline", "order": direction, "created_from": created_from}
+        full = [order["id"] for order in client.get("/api/orders/", params={**params, "limit": 0}, headers=headers).json()]
+        assert len(full) >= 5
+        paged, cursor = [], None
+        while True:
+            response = client.get("/api/orders/", params={**params, "limit": 2, "cursor": cursor}, headers=headers)
+            assert response.status_code == 200
+            paged += [order["id"] for order in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert paged == full
+
+def test_get_orders_status_filter_multiple():
+    """Тест фильтрации списка заказов по нескольким статусам"""
+    token = get_admin_token()
+    response = client.get(
+        "/api/orders/",
+        params={"status_filter": ["draft", "confirmed"], "sort": "deadline", "order": "asc"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert all(order["status"] in ("draft", "confirmed") for order in response.json())
+
+def test_get_orders_invalid_cursor():
+    """Тест получения списка заказов с некорректным курсором"""
+    token = get_admin_token()
+    response = client.get(
+        "/api/orders/",
+        params={"limit": 2, "cursor": "not-a-cursor"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 400
+
+def make_png(size=(640, 480)):
+    import io
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (120, 80, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+PNG_BYTES = make_png()
+
+def create_order_for_details(token):
+    response = client.post(
+        "/api/orders/",
+        data={
+            "customer_name": "Upload Customer",
+            "customer_phone": "+79991234567",
+            "customer_address": "Test Address 123"
+        },
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    return response.json()["id"]
+
+def put_details(token, order_id, filename, content):
+    return client.put(
+        f"/api/orders/{order_id}/details",
+        data={"customer_requirements": "Oak", "deadline": "2030-01-01T00:00:00", "price": "1000"},
+        files={"material_photo": (filename, content, "application/octet-stream")},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+def test_upload_photo_streamed_to_upload_dir(tmp_path, monkeypatch):
+    """Тест сохранения фото заказа под именем по хешу содержимого"""
+    import hashlib
+    import uploads
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    token = get_admin_token()
+    order_id = create_order_for_details(token)
+    response = put_details(token, order_id, "photo 1.png", PNG_BYTES)
+    assert response.status_code == 200
+    filename = f"{hashlib.sha256(PNG_BYTES).hexdigest()}.png"
+    assert (tmp_path / filename).read_bytes() == PNG_BYTES
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([
+        filename,
+        f"{filename}.preview.webp",
+        f"{filename}.thumb.webp",
+    ])
+
+    order = client.get(
+        f"/api/orders/{order_id}",
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()
+    assert order["material_photo"] == filename
+    assert order["material_photo_variants"]["thumb"] == f"{filename}.thumb.webp"
+    assert order["furniture_photo_variants"] is None
+
+def test_upload_identical_photos_deduplicated(tmp_path, monkeypatch):
+    """Тест хранения одинаковых фото одним файлом со счетчиком ссылок"""
+    import uploads
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    token = get_admin_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    photo = make_png((300, 200))
+    first_id = create_order_for_details(token)
+    second_id = create_order_for_details(token)
+    assert put_details(token, first_id, "a.png", photo).status_code == 200
+    assert put_details(token, second_id, "b.png", photo).status_code == 200
+    filename = client.get(f"/api/orders/{first_id}", headers=headers).json()["material_photo"]
+    assert client.get(f"/api/orders/{second_id}", headers=headers).json()["material_photo"] == filename
+    assert len([p for p in tmp_path.iterdir() if p.suffix == ".png"]) == 1
+
+    # Замена фото у одного заказа не удаляет файл, пока на него ссылается второй
+    assert put_details(token, first_id, "c.png", make_png((200, 300))).status_code == 200
+    assert (tmp_path / filename).exists()
+
+    # После удаления последнего заказа файл удаляет сборщик мусора по истечении grace-периода
+    assert client.delete(f"/api/orders/{second_id}", headers=headers).status_code == 200
+    assert (tmp_path / filename).exists()
+    assert filename not in run_gc(grace_seconds=3600)
+    assert filename in run_gc(grace_seconds=0)
+    assert not (tmp_path / filename).exists()
+    assert not (tmp_path / f"{filename}.thumb.webp").exists()
+
+def run_gc(grace_seconds):
+    import asyncio
+    from database import AsyncSessionLocal, engine
+    from storage import collect_garbage
+
+    async def collect():
+        try:
+            async with AsyncSessionLocal() as session:
+                return await collect_garbage(session, grace_seconds)
+        finally:
+            await engine.dispose()
+    return asyncio.run(collect())
+
+def test_upload_rejected_if_file_collected_before_reference(tmp_path, monkeypatch):
+    """Тест: ссылка на файл, удаленный сборщиком мусора во время загрузки, не сохраняется"""
+    import uploads
+    import storage
+    from routers import orders as orders_router
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    token = get_admin_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    photo = make_png((250, 250))
+    first_id = create_order_for_details(token)
+    assert put_details(token, first_id, "a.png", photo).status_code == 200
+    filename = client.get(f"/api/orders/{first_id}", headers=headers).json()["material_photo"]
+
+    # Второй запрос нашел файл на диске, но до его ссылки файл успели удалить
+    async def acquire_after_gc(db, name, size):
+        storage.remove_file_with_variants(name)
+        await storage.acquire_file(db, name, size)
+    monkeypatch.setattr(orders_router, "acquire_file", acquire_after_gc)
+    second_id = create_order_for_details(token)
+    assert put_details(token, second_id, "b.png", photo).status_code == 409
+    assert client.get(f"/api/orders/{second_id}", headers=headers).json()["material_photo"] is None
+
+def test_upload_thumbnail_resized_without_exif(tmp_path, monkeypatch):
+    """Тест уменьшения миниатюры и удаления EXIF"""
+    import io
+    from PIL import Image
+    import uploads
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    exif = Image.Exif()
+    exif[0x010F] = "TestCamera"  # Make
+    buffer = io.BytesIO()
+    Image.new("RGB", (2000, 1000), (10, 20, 30)).save(buffer, format="JPEG", exif=exif)
+    token = get_admin_token()
+    order_id = create_order_for_details(token)
+    response = put_details(token, order_id, "photo.jpg", buffer.getvalue())
+    assert response.status_code == 200
+    filename = client.get(
+        f"/api/orders/{order_id}",
+        headers={"Authorization": f"Bearer {token}"}
+    ).json()["material_photo"]
+    with Image.open(tmp_path / f"{filename}.thumb.webp") as thumb:
+        assert max(thumb.size) == 320
+        assert not thumb.getexif()
+
+def test_upload_rejects_undecodable_image(tmp_path, monkeypatch):
+    """Тест отклонения файла с верной сигнатурой, но поврежденным содержимым"""
+    import uploads
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    token = get_admin_token()
+    order_id = create_order_for_details(token)
+    response = put_details(token, order_id, "photo.png", b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
+    assert response.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+def test_upload_rejects_decompression_bomb(tmp_path, monkeypatch):
+    """Тест отклонения изображения с огромными размерами (decompression bomb)"""
+    import struct
+    import zlib
+    import uploads
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # Заголовок 30000x30000 (900 Мпикс), сами данные не нужны - размер проверяется при открытии
+    bomb = (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 30000, 30000, 1, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(b"\x00" * 1024))
+        + chunk(b"IEND", b"")
+    )
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    token = get_admin_token()
+    order_id = create_order_for_details(token)
+    response = put_details(token, order_id, "bomb.png", bomb)
+    assert response.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+def test_render_variants_separates_decode_and_write_errors(tmp_path):
+    """Тест: поврежденный файл - ValueError (400), ошибка записи вариантов - OSError (500)"""
+    from images import render_variants
+    truncated = tmp_path / "truncated.png"
+    truncated.write_bytes(PNG_BYTES[:len(PNG_BYTES) // 2])
+    with pytest.raises(ValueError):
+        render_variants(str(truncated), str(tmp_path), "truncated.png")
+
+    source = tmp_path / "photo.png"
+    source.write_bytes(PNG_BYTES)
+    with pytest.raises(OSError) as error:
+        render_variants(str(source), str(tmp_path / "missing-dir"), "photo.png")
+    assert not isinstance(error.value, ValueError)
+
+def test_upload_rejects_mismatched_magic_bytes(tmp_path, monkeypatch):
+    """Тест отклонения файла, содержимое которого не соответствует расширению"""
+    import uploads
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    token = get_admin_token()
+    order_id = create_order_for_details(token)
+    response = put_details(token, order_id, "photo.jpg", PNG_BYTES)
+    assert response.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+def test_upload_rejects_oversized_file(tmp_path, monkeypatch):
+    """Тест отклонения слишком большого файла без сохранения на диск"""
+    import uploads
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(uploads, "MAX_FILE_SIZE", len(PNG_BYTES) - 1)
+    token = get_admin_token()
+    order_id = create_order_for_details(token)
+    response = put_details(token, order_id, "photo.png", PNG_BYTES)
+    assert response.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+def test_get_orders_conditional_get():
+    """Тест ответа 304 для списка заказов, пока он не изменился"""
+    token = get_admin_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    first = client.get("/api/orders/", headers=headers)
+    etag = first.headers["etag"]
+
+    repeat = client.get("/api/orders/", headers={**headers, "If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+
+    create_order_for_details(token)
+    changed = client.get("/api/orders/", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+def test_get_orders_conditional_get_for_cursor_page():
+    """Тест 304 для дальней страницы: ETag зависит от строк страницы, а не от всего списка"""
+    token = get_admin_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    create_order_for_details(token)
+    create_order_for_details(token)
+    cursor = client.get("/api/orders/", params={"limit": 1}, headers=headers).headers["x-next-cursor"]
+    page = client.get("/api/orders/", params={"limit": 1, "cursor": cursor}, headers=headers)
+    etag = page.headers["etag"]
+
+    # Новый заказ меняет первую страницу, но не страницу после курсора
+    create_order_for_details(token)
+    repeat = client.get("/api/orders/", params={"limit": 1, "cursor": cursor}, headers={**headers, "If-None-Match": etag})
+    assert repeat.status_code == 304
+
+    client.put(f"/api/orders/{page.json()[0]['id']}", data={"price": "999"}, headers=headers)
+    changed = client.get("/api/orders/", params={"limit": 1, "cursor": cursor}, headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()[0]["price"] == 999
+
+def test_get_order_and_history_conditional_get():
+    """Тест ответа 304 для заказа и его истории до изменения заказа"""
+    token = get_admin_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    order_id = create_order_for_details(token)
+
+    order_etag = client.get(f"/api/orders/{order_id}", headers=headers).headers["etag"]
+    history_etag = client.get(f"/api/orders/{order_id}/history", headers=headers).headers["etag"]
+    assert client.get(f"/api/orders/{order_id}", headers={**headers, "If-None-Match": order_etag}).status_code == 304
+    assert client.get(f"/api/orders/{order_id}/history", headers={**headers, "If-None-Match": history_etag}).status_code == 304
+
+    client.put(f"/api/orders/{order_id}", data={"price": "500"}, headers=headers)
+    assert client.get(f"/api/orders/{order_id}", headers={**headers, "If-None-Match": order_etag}).status_code == 200
+    assert client.get(f"/api/orders/{order_id}/history", headers={**headers, "If-None-Match": history_etag}).status_code == 200
+
+def sync_all(headers, since=None):
+    """Прочитать все изменения после курсора; вернуть (заказы по id, удаленные id, курсор)"""
+    orders, deleted = {}, set()
+    while True:
+        params = {"limit": 50}
+        if since:
+            params["since"] = since
+        data = client.get("/api/orders/changes", params=params, headers=headers).json()
+        for order in data["orders"]:
+            orders[order["id"]] = order
+            deleted.discard(order["id"])
+        for order_id in data["deleted"]:
+            orders.pop(order_id, None)
+            deleted.add(order_id)
+        since = data["next_cursor"]
+        if not data["has_more"]:
+            return orders, deleted, since
+
+def test_get_order_changes_since_cursor(monkeypatch):
+    """Тест дельта-синхронизации: изменения после курсора и следы удаления"""
+    monkeypatch.setattr("routers.orders.settings.sync_settle_seconds", 0)
+    monkeypatch.setattr("routers.orders.settings.sqlite_busy_timeout", 0)
+    token = get_admin_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    order_id = create_order_for_details(token)
+    orders, _, cursor = sync_all(headers)
+    assert order_id in orders
+
+    unchanged = client.get("/api/orders/changes", params={"since": cursor}, headers=headers).json()
+    assert unchanged == {"orders": [], "deleted": [], "next_cursor": cursor, "has_more": False}
+
+    client.put(f"/api/orders/{order_id}", data={"price": "750"}, headers=headers)
+    orders, deleted, cursor = sync_all(headers, cursor)
+    assert list(orders) == [order_id]
+    assert orders[order_id]["price"] == 750
+    assert not deleted
+
+    client.delete(f"/api/orders/{order_id}", headers=headers)
+    orders, deleted, _ = sync_all(headers, cursor)
+    assert order_id not in orders
+    assert order_id in deleted
+
+def test_get_order_changes_holds_back_changes_within_busy_timeout(monkeypatch):
+    """Тест: изменение, чья транзакция еще может ждать блокировку записи, не отдается"""
+    from routers.orders import sync_settle_seconds
+    monkeypatch.setattr("routers.orders.settings.sync_settle_seconds", 0)
+    monkeypatch.setattr("routers.orders.settings.sqlite_busy_timeout", 60000)
+    assert sync_settle_seconds() == 60
+    token = get_admin_token()
+    headers = {"Authorization": f"Bearer {token}"}
+    order_id = create_order_for_details(token)
+    orders, _, _ = sync_all(headers)
+    assert order_id not in orders
+    client.delete(f"/api/orders/{order_id}", headers=headers)
+
+def test_get_order_changes_respects_role_visibility(monkeypatch):
+    """Тест дельта-синхронизации для логиста: скрытые заказы приходят как удаленные"""
+    monkeypatch.setattr("routers.orders.settings.sync_settle_seconds", 0)
+    monkeypatch.setattr("routers.orders.settings.sqlite_busy_timeout", 0)
+    logist_headers = {"Authorization": f"Bearer {get_logist_token()}"}
+    _, _, cursor = sync_all(logist_headers)
+
+    order_id = create_order_for_details(get_admin_token())
+    orders, deleted, _ = sync_all(logist_headers, cursor)
+    assert order_id not in orders
+    assert order_id in deleted
+
+def test_get_order_changes_invalid_cursor():
+    """Тест ошибки при поврежденном курсоре синхронизации"""
+    token = get_admin_token()
+    response = client.get(
+        "/api/orders/changes",
+        params={"since": "not-a-cursor"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 400
+
+def test_bulk_transition_orders():
+    """Тест пакетного перехода статусов с результатом по каждому заказу"""
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    order_ids = [
+        client.post(
+            "/api/orders/",
+            data={"customer_name": f"Bulk Customer {i}", "customer_phone": "+79991234567", "customer_address": "Addr"},
+            headers=headers
+        ).json()["id"]
+        for i in range(3)
+    ]
+    client.post(f"/api/orders/{order_ids[0]}/submit", headers=headers)
+
+    response = client.post(
+        "/api/orders/bulk",
+        data={"action": "submit", "order_ids": order_ids + [999999]},
+        headers=headers
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["succeeded"] == 2 and body["failed"] == 2
+    results = {entry["id"]: entry for entry in body["results"]}
+    assert results[order_ids[0]] == {"id": order_ids[0], "success": False, "detail": "Order already submitted"}
+    assert results[999999]["detail"] == "Order not found"
+    assert results[order_ids[1]]["status"] == "pending_confirmation"
+
+    response = client.post("/api/orders/bulk", data={"action": "confirm", "order_ids": order_ids}, headers=headers)
+    assert response.json()["succeeded"] == 3
+    numbers = [entry["order_number"] for entry in response.json()["results"]]
+    assert len(set(numbers)) == 3
+    for order_id, number in zip(order_ids, numbers):
+        order = client.get(f"/api/orders/{order_id}", headers=headers).json()
+        assert order["status"] == "confirmed" and order["order_number"] == number
+        actions = [entry["action"] for entry in client.get(f"/api/orders/{order_id}/history", headers=headers).json()]
+        assert actions.count("confirmed") == 1
+
+def test_bulk_transition_checks_role_and_action():
+    """Тест проверки действия и роли в пакетном переходе"""
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    assert client.post("/api/orders/bulk", data={"action": "explode", "order_ids": [1]}, headers=headers).status_code == 400
+    work_token = client.post("/api/auth/login", data={"username": "work", "password": "work"}).json()["access_token"]
+    response = client.post(
+        "/api/orders/bulk",
+        data={"action": "confirm", "order_ids": [1]},
+        headers={"Authorization": f"Bearer {work_token}"}
+    )
+    assert response.status_code == 403
+
+def test_export_orders_csv_matches_list():
+    """Тест потоковой выгрузки заказов в CSV"""
+    import csv
+    import io
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    response = client.get("/api/orders/export", params={"format": "csv", "status_filter": "draft"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    listed = client.get("/api/orders/", params={"status_filter": "draft", "limit": 0}, headers=headers).json()
+    assert sorted(int(row["id"]) for row in rows) == sorted(order["id"] for order in listed)
+    assert "price" in rows[0] and all(row["status"] == "draft" for row in rows)
+
+def test_export_masks_columns_for_work_role():
+    """Тест маскирования столбцов и статусов в выгрузке для роли work"""
+    import json
+    work_token = client.post("/api/auth/login", data={"username": "work", "password": "work"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {work_token}"}
+    response = client.get("/api/orders/export", params={"format": "ndjson"}, headers=headers)
+    assert response.status_code == 200
+    for line in response.text.splitlines():
+        order = json.loads(line)
+        assert "customer_phone" not in order and "price" not in order
+        assert order["status"] in ("in_progress", "ready")
+
+    response = client.get("/api/orders/export/history", params={"format": "ndjson"}, headers=headers)
+    assert response.status_code == 200
+    for line in response.text.splitlines():
+        changes = json.loads(line)["field_changes"] or {}
+        assert "price" not in changes and "customer_phone" not in changes
+
+def test_export_order_history_ndjson():
+    """Тест выгрузки истории изменений с фильтром по дате"""
+    import json
+    from datetime import datetime, timedelta
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    since = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    order_id = client.post(
+        "/api/orders/",
+        data={"customer_name": "Export Customer", "customer_phone": "+79991234567", "customer_address": "Addr"},
+        headers=headers
+    ).json()["id"]
+    client.put(f"/api/orders/{order_id}", data={"price": "1500"}, headers=headers)
+
+    response = client.get("/api/orders/export/history", params={"format": "ndjson", "date_from": since}, headers=headers)
+    assert response.status_code == 200
+    entries = [json.loads(line) for line in response.text.splitlines()]
+    actions = [entry["action"] for entry in entries if entry["order_id"] == order_id]
+    assert actions[:1] == ["created"] and len(actions) == 2
+    assert all(entry["timestamp"] >= since for entry in entries)
+    assert client.get("/api/orders/export", params={"format": "xml"}, headers=headers).status_code == 400
+
+def test_get_orders_defers_long_text_fields():
+    """Тест: длинные тексты в списке только по fields=, скрытые от роли поля не отдаются"""
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    order_id = client.post(
+        "/api/orders/",
+        data={"customer_name": "Fields Customer", "customer_phone": "+79991234567", "customer_address": "Long address"},
+        headers=headers
+    ).json()["id"]
+
+    listed = client.get("/api/orders/", params={"limit": 1}, headers=headers).json()[0]
+    assert listed["id"] == order_id
+    assert "customer_address" not in listed and "customer_requirements" not in listed
+    assert listed["customer_phone"] == "+79991234567"
+    assert client.get(f"/api/orders/{order_id}", headers=headers).json()["customer_address"] == "Long address"
+
+    response = client.get("/api/orders/", params={"limit": 1, "fields": "customer_address,status"}, headers=headers)
+    assert response.json()[0] == {"id": order_id, "customer_address": "Long address", "status": "draft"}
+    response = client.get("/api/orders/", params={"limit": 2, "fields": "id"}, headers=headers)
+    assert all(set(order) == {"id"} for order in response.json())
+    assert "X-Next-Cursor" in response.headers
+    assert client.get("/api/orders/", params={"fields": "password"}, headers=headers).status_code == 400
+
+    work_token = client.post("/api/auth/login", data={"username": "work", "password": "work"}).json()["access_token"]
+    response = client.get("/api/orders/", params={"fields": "price,customer_name"}, headers={"Authorization": f"Bearer {work_token}"})
+    assert response.status_code == 200
+    assert all("price" not in order for order in response.json())
+
+def test_find_customers_by_phone_prefix():
+    """Тест поиска клиента по началу телефона в разных форматах записи"""
+    import uuid
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    digits = str(uuid.uuid4().int)[:7]
+    name = f"Repeat Customer {digits}"
+    first = client.post(
+        "/api/orders/",
+        data={"customer_name": name, "customer_phone": f"8 (954) {digits[:3]}-{digits[3:5]}-{digits[5:]}", "customer_address": "Old"},
+        headers=headers
+    ).json()["id"]
+    second = client.post(
+        "/api/orders/",
+        data={"customer_name": name, "customer_phone": f"+7954{digits}", "customer_address": "New"},
+        headers=headers
+    ).json()["id"]
+
+    for phone in (f"8954{digits[:4]}", f"+7 954 {digits[:3]}", f"954{digits}"):
+        response = client.get("/api/orders/customers", params={"phone": phone}, headers=headers)
+        assert response.status_code == 200
+        customer = next(c for c in response.json() if c["phone_key"] == f"+7954{digits}")
+        assert customer["order_count"] == 2
+        assert customer["customer_address"] == "New"
+        assert [order["id"] for order in customer["orders"]] == [second, first]
+
+    assert client.get("/api/orders/customers", params={"phone": "+7"}, headers=headers).status_code == 400
+    work_token = client.post("/api/auth/login", data={"username": "work", "password": "work"}).json()["access_token"]
+    response = client.get("/api/orders/customers", params={"phone": "8954"}, headers={"Authorization": f"Bearer {work_token}"})
+    assert response.status_code == 403
+    for order_id in (first, second):
+        client.delete(f"/api/orders/{order_id}", headers=headers)
+
+def test_find_customers_hides_statuses_from_logist():
+    """Тест: логист видит в подсказке клиентов только заказы в доступных ему статусах"""
+    import uuid
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    digits = str(uuid.uuid4().int)[:7]
+    phone = f"+7953{digits}"
+    order_ids = [
+        client.post(
+            "/api/orders/",
+            data={"customer_name": f"Hidden Customer {digits}", "customer_phone": phone, "customer_address": "Addr"},
+            headers=headers
+        ).json()["id"]
+        for _ in range(2)
+    ]
+    # Первый заказ подтвержден, второй остается черновиком
+    client.post(f"/api/orders/{order_ids[0]}/submit", headers=headers)
+    client.post(f"/api/orders/{order_ids[0]}/confirm", headers=headers)
+
+    logist_token = client.post("/api/auth/login", data={"username": "logist", "password": "logist"}).json()["access_token"]
+    logist_headers = {"Authorization": f"Bearer {logist_token}"}
+    response = client.get("/api/orders/customers", params={"phone": phone}, headers=logist_headers)
+    assert response.status_code == 200
+    customer = next(c for c in response.json() if c["phone_key"] == phone)
+    assert customer["order_count"] == 1
+    assert [order["id"] for order in customer["orders"]] == [order_ids[0]]
+
+    # Клиент только с черновиками логисту не виден вовсе
+    client.delete(f"/api/orders/{order_ids[0]}", headers=headers)
+    response = client.get("/api/orders/customers", params={"phone": phone}, headers=logist_headers)
+    assert all(c["phone_key"] != phone for c in response.json())
+    admin_view = client.get("/api/orders/customers", params={"phone": phone}, headers=headers).json()
+    assert next(c for c in admin_view if c["phone_key"] == phone)["order_count"] == 1
+    client.delete(f"/api/orders/{order_ids[1]}", headers=headers)
+
+def test_normalize_phone():
+    """Тест приведения телефона к ключу +<код страны><номер>"""
+    from phones import normalize_phone, phone_key_prefix
+    assert normalize_phone("8 (999) 123-45-67") == "+79991234567"
+    assert normalize_phone("999 123 45 67") == "+79991234567"
+    assert normalize_phone("+49 30 1234567") == "+49301234567"
+    assert normalize_phone("нет") is None
+    assert phone_key_prefix("8999") == "+7999"
+    assert phone_key_prefix("+49") == "+49"
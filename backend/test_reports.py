@@ -0,0 +1,116 @@
+"""
+Тесты отчетов по сводным таблицам
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+import pytest
+from sqlalchemy import select
+from fastapi.testclient import TestClient
+from main import app
+from analytics import rebuild_summaries, replay_transitions
+from database import engine
+from models import OrderDeadlineBucket, OrderRevenue, OrderStatusCount
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
+def login(username, password):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": username, "password": password}
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def month_revenue(headers):
+    month_start = date.today().replace(day=1).isoformat()
+    rows = client.get("/api/reports/revenue", params={"period": "month"}, headers=headers).json()
+    return next((row for row in rows if row["period_start"] == month_start), {"revenue": 0, "orders": 0})
+
+def transitions(headers):
+    return {
+        (row["from_status"], row["to_status"]): row["transitions"]
+        for row in client.get("/api/reports/status-durations", headers=headers).json()
+    }
+
+def test_reports_follow_order_changes():
+    """Тест инкрементального обновления отчетов обработчиками заказов"""
+    headers = login("admin1", "nimda")
+    statuses_before = client.get("/api/reports/orders-by-status", headers=headers).json()
+    revenue_before = month_revenue(headers)
+    transitions_before = transitions(headers)
+    overdue_before = client.get("/api/reports/overdue", headers=headers).json()["overdue"]
+
+    order_id = client.post(
+        "/api/orders/",
+        data={"customer_name": "Report Customer", "customer_phone": "+79991234567", "customer_address": "Addr"},
+        headers=headers
+    ).json()["id"]
+    yesterday = (datetime.utcnow() - timedelta(days=1)).isoformat()
+    client.put(f"/api/orders/{order_id}", data={"price": "2500", "deadline": yesterday}, headers=headers)
+    client.post(f"/api/orders/{order_id}/submit", headers=headers)
+
+    statuses = client.get("/api/reports/orders-by-status", headers=headers).json()
+    assert statuses["pending_confirmation"] == statuses_before["pending_confirmation"] + 1
+    assert statuses["draft"] == statuses_before["draft"]
+    revenue = month_revenue(headers)
+    assert revenue["revenue"] == revenue_before["revenue"] + 2500
+    assert revenue["orders"] == revenue_before["orders"] + 1
+    key = ("draft", "pending_confirmation")
+    assert transitions(headers)[key] == transitions_before.get(key, 0) + 1
+    assert client.get("/api/reports/overdue", headers=headers).json()["overdue"] == overdue_before + 1
+
+    client.delete(f"/api/orders/{order_id}", headers=headers)
+    assert client.get("/api/reports/orders-by-status", headers=headers).json() == statuses_before
+    assert month_revenue(headers) == revenue_before
+    assert client.get("/api/reports/overdue", headers=headers).json()["overdue"] == overdue_before
+
+def test_incremental_summaries_match_rebuild():
+    """Тест: агрегаты, обновляемые обработчиками, совпадают с полным пересчетом"""
+    async def snapshot(conn):
+        return (
+            {row.status: row.count for row in await conn.execute(select(OrderStatusCount)) if row.count},
+            {(row.period, row.period_start): (row.revenue, row.orders) for row in await conn.execute(select(OrderRevenue)) if row.orders},
+            {row.day: row.open_count for row in await conn.execute(select(OrderDeadlineBucket)) if row.open_count},
+        )
+
+    async def compare():
+        try:
+            async with engine.begin() as conn:
+                incremental = await snapshot(conn)
+                await conn.run_sync(rebuild_summaries)
+                rebuilt = await snapshot(conn)
+            return incremental, rebuilt
+        finally:
+            await engine.dispose()
+
+    incremental, rebuilt = asyncio.run(compare())
+    assert incremental == rebuilt
+
+def test_replay_transitions_restarts_on_reused_order_id():
+    """Тест восстановления переходов по журналу, в том числе после повторного использования id"""
+    start = datetime(2024, 1, 1)
+    rows = [
+        (1, "created", None, start),
+        (1, "submitted_for_confirmation", None, start + timedelta(hours=2)),
+        (1, "updated", '{"price": {"old": null, "new": 10}}', start + timedelta(hours=3)),
+        (1, "updated", '{"status": {"old": "pending_confirmation", "new": "draft"}}', start + timedelta(hours=4)),
+        (1, "deleted", None, start + timedelta(hours=5)),
+        (1, "created", None, start + timedelta(hours=6)),
+        (1, "submitted_for_confirmation", None, start + timedelta(hours=10)),
+    ]
+    assert replay_transitions(rows) == {
+        ("draft", "pending_confirmation"): [2, 6 * 3600.0],
+        ("pending_confirmation", "draft"): [1, 2 * 3600.0],
+    }
+
+def test_reports_require_admin():
+    """Тест доступа к отчетам только для администратора"""
+    headers = login("work", "work")
+    assert client.get("/api/reports/orders-by-status", headers=headers).status_code == 403
+    assert client.get("/api/reports/revenue", params={"period": "year"}, headers=login("admin1", "nimda")).status_code == 400
@@ -0,0 +1,104 @@
+"""
+Тесты полнотекстового поиска заказов
+"""
+import asyncio
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from database import engine
+from search import match_expression, rebuild_search_index
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
+def login(username, password):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": username, "password": password}
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def create_order(headers, customer_requirements=None, **fields):
+    data = {"customer_name": "Search Customer", "customer_phone": "+79991234567", "customer_address": "Addr"}
+    data.update(fields)
+    response = client.post("/api/orders/", data=data, headers=headers)
+    assert response.status_code == 200
+    order_id = response.json()["id"]
+    if customer_requirements:
+        # Требования задаются только редактированием
+        client.put(f"/api/orders/{order_id}", data={"customer_requirements": customer_requirements}, headers=headers)
+    return order_id
+
+def search(headers, q, **params):
+    response = client.get("/api/orders/search", params={"q": q, **params}, headers=headers)
+    assert response.status_code == 200
+    return [order["id"] for order in response.json()]
+
+def test_search_by_prefix_and_rank():
+    """Тест поиска по префиксу слова и ранжирования: совпадение в имени выше, чем в требованиях"""
+    headers = login("admin1", "nimda")
+    word = f"шкаф{uuid.uuid4().hex[:8]}"
+    in_requirements = create_order(headers, customer_requirements=f"Нужен {word}купе")
+    in_name = create_order(headers, customer_name=f"Иван {word}")
+
+    assert search(headers, word[:10]) == [in_name, in_requirements]
+    assert search(headers, f"{word} Иван") == [in_name]
+    # Синтаксис FTS5 во вводе не ломает запрос
+    assert search(headers, f'"{word[:10]}*) (') == [in_name, in_requirements]
+    assert client.get("/api/orders/search", params={"q": "!!!"}, headers=headers).status_code == 400
+    for order_id in (in_name, in_requirements):
+        client.delete(f"/api/orders/{order_id}", headers=headers)
+
+def test_search_index_follows_updates_and_deletes():
+    """Тест синхронизации индекса с изменением и удалением заказа"""
+    headers = login("admin1", "nimda")
+    old_word, new_word = f"old{uuid.uuid4().hex[:8]}", f"new{uuid.uuid4().hex[:8]}"
+    order_id = create_order(headers, customer_address=f"ул. {old_word}")
+    assert search(headers, old_word) == [order_id]
+
+    client.put(f"/api/orders/{order_id}", data={"customer_address": f"ул. {new_word}"}, headers=headers)
+    assert search(headers, old_word) == []
+    assert search(headers, new_word) == [order_id]
+
+    async def rebuild():
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(rebuild_search_index)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(rebuild())
+    assert search(headers, new_word) == [order_id]
+
+    client.delete(f"/api/orders/{order_id}", headers=headers)
+    assert search(headers, new_word) == []
+
+def test_search_masks_fields_for_work_role():
+    """Тест: роль work не ищет по адресу и примечаниям и не видит их в результатах"""
+    admin = login("admin1", "nimda")
+    work = login("work", "work")
+    word = f"secret{uuid.uuid4().hex[:8]}"
+    order_id = create_order(admin, customer_address=f"ул. {word}", customer_requirements=f"Стол {word}")
+    assert search(work, word) == []
+
+    client.put(f"/api/orders/{order_id}", data={"status": "in_progress"}, headers=admin)
+    response = client.get("/api/orders/search", params={"q": word}, headers=work)
+    assert [order["id"] for order in response.json()] == [order_id]
+    assert "customer_address" not in response.json()[0] and "price" not in response.json()[0]
+
+    client.put(f"/api/orders/{order_id}", data={"customer_requirements": "Стол"}, headers=admin)
+    assert search(work, word) == []
+    assert search(admin, word) == [order_id]
+    client.delete(f"/api/orders/{order_id}", headers=admin)
+
+def test_match_expression_quotes_terms():
+    """Тест построения выражения MATCH из ввода пользователя"""
+    assert match_expression('шкаф "купе', ["customer_name"]) == '{customer_name} : ("шкаф"* "купе"*)'
+    assert match_expression("  -*()  ", ["customer_name"]) == ""
@@ -0,0 +1,100 @@
+"""
+Тесты HTTP-кэширования загруженных файлов (/uploads)
+"""
+import hashlib
+import os
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+import uploads
+
+client = TestClient(app)
+
+@pytest.fixture(scope="module", autouse=True)
+def started_app():
+    """Запуск приложения на время тестов модуля: миграции, пользователи по умолчанию, фоновые задачи"""
+    with client:
+        yield
+
+CONTENT = bytes(range(256)) * 64  # 16 KiB
+
+@pytest.fixture
+def stored_file():
+    filename = f"{hashlib.sha256(CONTENT).hexdigest()}.png"
+    path = os.path.join(uploads.UPLOAD_DIR, filename)
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+    yield filename
+    os.unlink(path)
+
+@pytest.fixture
+def legacy_file():
+    filename = "1_material_legacy.png"
+    path = os.path.join(uploads.UPLOAD_DIR, filename)
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+    yield filename
+    os.unlink(path)
+
+def test_content_addressed_file_is_immutable(stored_file):
+    """Тест строгого ETag и Cache-Control: immutable для файла по хешу"""
+    response = client.get(f"/uploads/{stored_file}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == f'"{stored_file.split(".")[0]}"'
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["accept-ranges"] == "bytes"
+
+def test_repeat_load_with_etag_transfers_no_body(stored_file):
+    """Тест повторной загрузки: 304 без тела вместо полного файла"""
+    first = client.get(f"/uploads/{stored_file}")
+    repeat = client.get(f"/uploads/{stored_file}", headers={"If-None-Match": first.headers["etag"]})
+    assert len(first.content) == len(CONTENT)
+    assert repeat.status_code == 304
+    assert len(repeat.content) == 0
+    assert repeat.headers["etag"] == first.headers["etag"]
+    assert "immutable" in repeat.headers["cache-control"]
+
+def test_repeat_load_with_if_modified_since(legacy_file):
+    """Тест 304 по If-Modified-Since и обязательной проверки для старых имен"""
+    first = client.get(f"/uploads/{legacy_file}")
+    assert first.headers["cache-control"] == "public, no-cache"
+    repeat = client.get(f"/uploads/{legacy_file}", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert repeat.status_code == 304
+    assert len(repeat.content) == 0
+
+def test_if_none_match_mismatch_returns_full_file(stored_file):
+    """Тест полного ответа при несовпадении ETag (If-Modified-Since игнорируется)"""
+    first = client.get(f"/uploads/{stored_file}")
+    response = client.get(
+        f"/uploads/{stored_file}",
+        headers={"If-None-Match": '"other"', "If-Modified-Since": first.headers["last-modified"]}
+    )
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+def test_range_request_transfers_only_requested_bytes(stored_file):
+    """Тест частичной загрузки (Range)"""
+    response = client.get(f"/uploads/{stored_file}", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+    suffix = client.get(f"/uploads/{stored_file}", headers={"Range": "bytes=-10"})
+    assert suffix.status_code == 206
+    assert suffix.content == CONTENT[-10:]
+
+def test_range_not_satisfiable(stored_file):
+    """Тест ответа 416 для диапазона за пределами файла"""
+    response = client.get(f"/uploads/{stored_file}", headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+def test_if_range_mismatch_returns_full_file(stored_file):
+    """Тест полного ответа, если If-Range не совпадает с текущим ETag"""
+    response = client.get(
+        f"/uploads/{stored_file}",
+        headers={"Range": "bytes=0-9", "If-Range": '"stale"'}
+    )
+    assert response.status_code == 200
+    assert response.content == CONTENT
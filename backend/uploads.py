@@ -0,0 +1,101 @@
+from fastapi import HTTPException, UploadFile
+from pathlib import Path
+import hashlib
+import os
+import uuid
+import aiofiles
+
+from metrics import upload_size
+
+# Используем persistent disk для uploads, если он доступен
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+# Если есть путь к диску, используем его, иначе локальный путь
+if os.path.exists("/app/data"):
+    UPLOAD_DIR = "/app/data/uploads"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+CHUNK_SIZE = 64 * 1024
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+# Сигнатуры (magic bytes) допустимых форматов
+MAGIC_SIGNATURES = {
+    '.jpg': [b'\xff\xd8\xff'],
+    '.jpeg': [b'\xff\xd8\xff'],
+    '.png': [b'\x89PNG\r\n\x1a\n'],
+    '.gif': [b'GIF87a', b'GIF89a'],
+}
+MAGIC_HEADER_SIZE = 12
+
+# Одинаковое содержимое должно получать одинаковое имя независимо от написания расширения
+CANONICAL_EXTENSIONS = {'.jpeg': '.jpg'}
+
+def matches_magic(file_ext: str, header: bytes) -> bool:
+    if file_ext == '.webp':
+        return header[:4] == b'RIFF' and header[8:12] == b'WEBP'
+    return any(header.startswith(signature) for signature in MAGIC_SIGNATURES[file_ext])
+
+def check_extension(filename: str) -> str:
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File extension {file_ext} not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+    return file_ext
+
+def content_filename(sha256: str, file_ext: str) -> str:
+    return f"{sha256}{CANONICAL_EXTENSIONS.get(file_ext, file_ext)}"
+
+async def stream_upload(file: UploadFile):
+    """Сохраняет загрузку в UPLOAD_DIR под именем по SHA-256 содержимого.
+
+    Файл читается кусками по CHUNK_SIZE во временный файл, проверяются размер и
+    сигнатура, после чего временный файл атомарно переименовывается. Если файл с
+    таким содержимым уже есть, повторно он не записывается.
+    Возвращает (имя файла, размер, True если файл записан впервые).
+    """
+    file_ext = check_extension(file.filename)
+    temp_path = os.path.join(UPLOAD_DIR, f".upload-{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            header = b""
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File size exceeds maximum allowed size of {MAX_FILE_SIZE / 1024 / 1024}MB"
+                    )
+                if len(header) < MAGIC_HEADER_SIZE:
+                    header += chunk[:MAGIC_HEADER_SIZE - len(header)]
+                    if len(header) >= MAGIC_HEADER_SIZE and not matches_magic(file_ext, header):
+                        raise HTTPException(status_code=400, detail=f"File content does not match extension {file_ext}")
+                digest.update(chunk)
+                await out.write(chunk)
+            if not matches_magic(file_ext, header):
+                raise HTTPException(status_code=400, detail=f"File content does not match extension {file_ext}")
+
+        upload_size.observe((), size)
+        filename = content_filename(digest.hexdigest(), file_ext)
+        filepath = os.path.join(UPLOAD_DIR, filename)
+        if os.path.exists(filepath):
+            os.unlink(temp_path)
+            return filename, size, False
+        os.replace(temp_path, filepath)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    return filename, size, True
+
+def remove_upload(filename: str):
+    path = os.path.join(UPLOAD_DIR, filename)
+    if os.path.exists(path):
+        os.unlink(path)
@@ -1,6 +1,6 @@
 'use client';
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '@/contexts/AuthContext';
 import ProtectedRoute from '@/components/ProtectedRoute';
 import { Button } from '@/components/ui/button';
@@ -11,7 +11,18 @@ import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
-import { ordersAPI, Order, OrderHistory, getUploadUrl } from '@/lib/api';
+import { ordersAPI, CustomerMatch, Order, OrderEvent, OrderHistory, OrderListParams, getUploadUrl, subscribeOrderEvents } from '@/lib/api';
+
+// Подсказка клиента по телефону: с какого числа цифр и через сколько мс после ввода
+const CUSTOMER_LOOKUP_MIN_DIGITS = 4;
+const CUSTOMER_LOOKUP_DELAY_MS = 250;
+// Размер страницы списка: следующие страницы подгружаются по курсору из X-Next-Cursor
+const ORDERS_PAGE_SIZE = 100;
+// Поля для карточек списка; полный заказ загружается при открытии диалога
+const ORDER_LIST_FIELDS = [
+  'id', 'order_number', 'customer_name', 'customer_phone', 'customer_address',
+  'deadline', 'price', 'status', 'created_at', 'updated_at',
+];
 
 const statusLabels = {
   draft: 'Черновик',
@@ -41,11 +52,23 @@ export default function DashboardPage() {
   const [showDetailsDialog, setShowDetailsDialog] = useState(false);
   const [showFiltersDialog, setShowFiltersDialog] = useState(false);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [customerMatches, setCustomerMatches] = useState<CustomerMatch[]>([]);
+  // Последнее оповещение о сроке по заказу; показывается, пока срок заказа не изменился
+  const [deadlineAlerts, setDeadlineAlerts] = useState<Record<number, { alert: 'due_soon' | 'overdue'; deadline: string }>>({});
+  // Есть ли соединение с живой лентой; без него список перечитывается после действий
+  const liveRef = useRef(false);
   
   // Filter and sort states
   const [statusFilter, setStatusFilter] = useState<string>('all');
-  const [sortBy, setSortBy] = useState<'created_at' | 'deadline' | 'order_number' | 'customer_name' | 'price'>('created_at');
+  // Фильтр и сортировка выполняются на сервере, список грузится страницами
+  const [sortBy, setSortBy] = useState<'created_at' | 'deadline'>('created_at');
   const [sortOrder, setSortOrder] = useState<'asc' | 'desc'>('desc');
+  // Текущие параметры для обработчиков, созданных при первом рендере (лента событий)
+  const listQueryRef = useRef({ statusFilter, sortBy, sortOrder });
+  listQueryRef.current = { statusFilter, sortBy, sortOrder };
+  // Номер последней загрузки списка: ответы на устаревшие параметры отбрасываются
+  const listRequestRef = useRef(0);
 
   // Form states
   const [formData, setFormData] = useState({
@@ -62,10 +85,25 @@ export default function DashboardPage() {
     furniture_photo: null as File | null,
   });
 
+  const listParams = (cursor?: string): OrderListParams => {
+    const { statusFilter, sortBy, sortOrder } = listQueryRef.current;
+    return {
+      limit: ORDERS_PAGE_SIZE,
+      fields: ORDER_LIST_FIELDS,
+      status_filter: statusFilter !== 'all' ? [statusFilter] : undefined,
+      sort: sortBy,
+      order: sortOrder,
+      cursor,
+    };
+  };
+
   const loadOrders = async () => {
+    const request = ++listRequestRef.current;
     try {
-      const response = await ordersAPI.getOrders();
+      const response = await ordersAPI.getOrdersPage(listParams());
+      if (request !== listRequestRef.current) return;
       setOrders(response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error: any) {
       console.error('Error loading orders:', error);
       // Check if it's a 401 or 403 error and redirect to login if needed
@@ -80,48 +118,43 @@ export default function DashboardPage() {
     }
   };
 
-  // Filter and sort orders
+  const loadMoreOrders = async () => {
+    if (!nextCursor) return;
+    const request = listRequestRef.current;
+    try {
+      const response = await ordersAPI.getOrdersPage(listParams(nextCursor));
+      // Пока страница грузилась, фильтр или сортировка изменились
+      if (request !== listRequestRef.current) return;
+      // Заказ мог уже прийти из живой ленты - не дублируем
+      setOrders((current) => [
+        ...current,
+        ...response.data.filter((order: Order) => !current.some((o) => o.id === order.id)),
+      ]);
+      setNextCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error loading more orders:', error);
+    }
+  };
+
+  // Загруженные страницы уже отфильтрованы и упорядочены сервером; здесь на свое место
+  // встают заказы из живой ленты (тот же порядок: пустой срок в конце, при равенстве - по id)
   const getFilteredAndSortedOrders = () => {
     let filtered = [...orders];
 
-    // Apply status filter
     if (statusFilter !== 'all') {
       filtered = filtered.filter(order => order.status === statusFilter);
     }
 
-    // Apply sorting
+    const direction = sortOrder === 'asc' ? 1 : -1;
     filtered.sort((a, b) => {
-      let aValue: any;
-      let bValue: any;
-
-      switch (sortBy) {
-        case 'created_at':
-          aValue = new Date(a.created_at).getTime();
-          bValue = new Date(b.created_at).getTime();
-          break;
-        case 'deadline':
-          aValue = a.deadline ? new Date(a.deadline).getTime() : 0;
-          bValue = b.deadline ? new Date(b.deadline).getTime() : 0;
-          break;
-        case 'order_number':
-          aValue = a.order_number || 0;
-          bValue = b.order_number || 0;
-          break;
-        case 'customer_name':
-          aValue = a.customer_name.toLowerCase();
-          bValue = b.customer_name.toLowerCase();
-          break;
-        case 'price':
-          aValue = a.price || 0;
-          bValue = b.price || 0;
-          break;
-        default:
-          return 0;
+      const aValue = a[sortBy] ? new Date(a[sortBy] as string).getTime() : null;
+      const bValue = b[sortBy] ? new Date(b[sortBy] as string).getTime() : null;
+      if (aValue === null || bValue === null) {
+        if (aValue !== bValue) return aValue === null ? 1 : -1;
+      } else if (aValue !== bValue) {
+        return (aValue - bValue) * direction;
       }
-
-      if (aValue < bValue) return sortOrder === 'asc' ? -1 : 1;
-      if (aValue > bValue) return sortOrder === 'asc' ? 1 : -1;
-      return 0;
+      return (a.id - b.id) * direction;
     });
 
     return filtered;
@@ -129,10 +162,91 @@ export default function DashboardPage() {
 
   const filteredAndSortedOrders = getFilteredAndSortedOrders();
 
+  // Применяем изменения из живой ленты вместо повторной загрузки всего списка
+  const applyOrderEvent = (event: OrderEvent) => {
+    if (event.type === 'resync') {
+      loadOrders();
+    } else if (event.type === 'order') {
+      setOrders((current) => {
+        const index = current.findIndex((o) => o.id === event.order.id);
+        if (index === -1) return [...current, event.order];
+        const next = [...current];
+        next[index] = event.order;
+        return next;
+      });
+    } else if (event.type === 'removed') {
+      setOrders((current) => current.filter((o) => o.id !== event.order_id));
+    } else if (event.type === 'deadline') {
+      setDeadlineAlerts((current) => ({ ...current, [event.order_id]: { alert: event.alert, deadline: event.deadline } }));
+    }
+  };
+
+  const loadDeadlineAlerts = async () => {
+    try {
+      const response = await ordersAPI.getDeadlineAlerts();
+      // Ответ - от новых к старым: более новое оповещение по заказу побеждает
+      const alerts: Record<number, { alert: 'due_soon' | 'overdue'; deadline: string }> = {};
+      for (const alert of [...response.data].reverse()) {
+        alerts[alert.order_id] = { alert: alert.alert, deadline: alert.deadline };
+      }
+      setDeadlineAlerts(alerts);
+    } catch (error) {
+      console.error('Error loading deadline alerts:', error);
+    }
+  };
+
+  const refreshIfOffline = () => {
+    if (!liveRef.current) {
+      loadOrders();
+    }
+  };
+
+  // Смена фильтра или сортировки - список заново с первой страницы
   useEffect(() => {
     loadOrders();
+  }, [statusFilter, sortBy, sortOrder]);
+
+  useEffect(() => {
+    loadDeadlineAlerts();
+    return subscribeOrderEvents(applyOrderEvent, (connected) => {
+      // После переподключения могли пропустить события - перечитываем список
+      if (connected && !liveRef.current) loadOrders();
+      liveRef.current = connected;
+    });
   }, []);
 
+  // Подсказка вернувшихся клиентов, пока оператор набирает телефон в форме создания
+  useEffect(() => {
+    const phone = formData.customer_phone;
+    if (!showCreateDialog || phone.replace(/\D/g, '').length < CUSTOMER_LOOKUP_MIN_DIGITS) {
+      setCustomerMatches([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await ordersAPI.findCustomers(phone, 5);
+        if (!cancelled) setCustomerMatches(response.data);
+      } catch (error) {
+        console.error('Error looking up customers:', error);
+      }
+    }, CUSTOMER_LOOKUP_DELAY_MS);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [formData.customer_phone, showCreateDialog]);
+
+  const applyCustomerMatch = (customer: CustomerMatch) => {
+    setFormData({
+      ...formData,
+      customer_name: customer.customer_name,
+      customer_phone: customer.customer_phone,
+      customer_address: customer.customer_address,
+    });
+    setCustomerMatches([]);
+  };
+
   const handleCreateOrder = async (e: React.FormEvent) => {
     e.preventDefault();
     
@@ -162,7 +276,7 @@ export default function DashboardPage() {
       await ordersAPI.createOrder(data);
       setShowCreateDialog(false);
       resetForm();
-      loadOrders();
+      refreshIfOffline();
     } catch (error: any) {
       console.error('Error creating order:', error);
       const errorMessage = error.response?.data?.detail || 'Ошибка при создании заказа';
@@ -229,7 +343,7 @@ export default function DashboardPage() {
       await ordersAPI.updateOrder(selectedOrder.id, data);
       setShowEditDialog(false);
       resetForm();
-      loadOrders();
+      refreshIfOffline();
     } catch (error: any) {
       console.error('Error updating order:', error);
       const errorMessage = error.response?.data?.detail || 'Ошибка при обновлении заказа';
@@ -278,7 +392,7 @@ export default function DashboardPage() {
       await ordersAPI.addOrderDetails(selectedOrder.id, data);
       setShowDetailsDialog(false);
       resetForm();
-      loadOrders();
+      refreshIfOffline();
     } catch (error: any) {
       console.error('Error adding details:', error);
       const errorMessage = error.response?.data?.detail || 'Ошибка при добавлении деталей заказа';
@@ -304,11 +418,11 @@ export default function DashboardPage() {
         case 'delete':
           if (confirm('Вы уверены, что хотите удалить этот заказ?')) {
             await ordersAPI.deleteOrder(orderId);
-            loadOrders();
+            refreshIfOffline();
           }
           return;
       }
-      loadOrders();
+      refreshIfOffline();
     } catch (error: any) {
       console.error(`Error ${action} order:`, error);
       const errorMessage = error.response?.data?.detail || `Ошибка при выполнении действия: ${action}`;
@@ -316,7 +430,18 @@ export default function DashboardPage() {
     }
   };
 
-  const handleViewOrder = async (order: Order) => {
+  // В списке нет длинных текстовых полей - для диалогов берем заказ целиком
+  const loadFullOrder = async (order: Order): Promise<Order> => {
+    try {
+      return (await ordersAPI.getOrder(order.id)).data;
+    } catch (error) {
+      console.error('Error loading order:', error);
+      return order;
+    }
+  };
+
+  const handleViewOrder = async (listOrder: Order) => {
+    const order = await loadFullOrder(listOrder);
     setSelectedOrder(order);
     try {
       const response = await ordersAPI.getOrderHistory(order.id);
@@ -342,7 +467,8 @@ export default function DashboardPage() {
     });
   };
 
-  const openEditDialog = (order: Order) => {
+  const openEditDialog = async (listOrder: Order) => {
+    const order = await loadFullOrder(listOrder);
     setSelectedOrder(order);
     // Format deadline for date input (YYYY-MM-DD)
     let deadlineFormatted = '';
@@ -372,7 +498,8 @@ export default function DashboardPage() {
     setShowEditDialog(true);
   };
 
-  const openDetailsDialog = (order: Order) => {
+  const openDetailsDialog = async (listOrder: Order) => {
+    const order = await loadFullOrder(listOrder);
     setSelectedOrder(order);
     // Format deadline for date input (YYYY-MM-DD)
     let deadlineFormatted = '';
@@ -486,6 +613,23 @@ export default function DashboardPage() {
                             onChange={(e) => setFormData({...formData, customer_phone: e.target.value})}
                             required
                           />
+                          {customerMatches.length > 0 && (
+                            <div className="mt-1 border rounded-md divide-y">
+                              {customerMatches.map((customer) => (
+                                <button
+                                  key={customer.phone_key}
+                                  type="button"
+                                  className="w-full text-left px-3 py-2 text-sm hover:bg-gray-50"
+                                  onClick={() => applyCustomerMatch(customer)}
+                                >
+                                  <div className="font-medium">{customer.customer_name} · {customer.customer_phone}</div>
+                                  <div className="text-gray-500">
+                                    Заказов: {customer.order_count}, последний {new Date(customer.last_order_at).toLocaleDateString('ru-RU')}
+                                  </div>
+                                </button>
+                              ))}
+                            </div>
+                          )}
                         </div>
                         <div>
                           <Label htmlFor="customer_address">Адрес</Label>
@@ -553,18 +697,13 @@ export default function DashboardPage() {
                       {/* Sort By */}
                       <div>
                         <Label htmlFor="sort-by" className="text-sm font-medium mb-1 block">Сортировать по</Label>
-                        <Select value={sortBy} onValueChange={(value: any) => setSortBy(value)}>
+                        <Select value={sortBy} onValueChange={(value: 'created_at' | 'deadline') => setSortBy(value)}>
                           <SelectTrigger id="sort-by">
                             <SelectValue placeholder="Выберите поле" />
                           </SelectTrigger>
                           <SelectContent>
                             <SelectItem value="created_at">Дата создания</SelectItem>
                             <SelectItem value="deadline">Срок выполнения</SelectItem>
-                            <SelectItem value="order_number">Номер заказа</SelectItem>
-                            <SelectItem value="customer_name">Имя заказчика</SelectItem>
-                            {user?.role === 'admin' && (
-                              <SelectItem value="price">Цена</SelectItem>
-                            )}
                           </SelectContent>
                         </Select>
                       </div>
@@ -610,6 +749,15 @@ export default function DashboardPage() {
                         <span className={`px-2 py-1 rounded-full text-xs ${statusColors[order.status]}`}>
                           {statusLabels[order.status]}
                         </span>
+                        {order.status !== 'delivered' && deadlineAlerts[order.id]?.deadline === order.deadline && (
+                          <span
+                            className={`px-2 py-1 rounded-full text-xs mt-1 ${
+                              deadlineAlerts[order.id].alert === 'overdue' ? 'bg-red-100 text-red-800' : 'bg-amber-100 text-amber-800'
+                            }`}
+                          >
+                            {deadlineAlerts[order.id].alert === 'overdue' ? 'Просрочен' : 'Скоро срок'}
+                          </span>
+                        )}
                         {user?.role === 'admin' && order.price && (
                           <div className="text-lg font-semibold text-green-600 mt-1">
                             {order.price} руб.
@@ -678,6 +826,11 @@ export default function DashboardPage() {
                     </div>
                   </Card>
                 ))}
+                {nextCursor && (
+                  <div className="flex justify-center">
+                    <Button variant="outline" onClick={loadMoreOrders}>Показать еще</Button>
+                  </div>
+                )}
               </div>
             </CardContent>
           </Card>
@@ -726,7 +879,7 @@ export default function DashboardPage() {
                           <div>
                             <p className="text-sm font-medium">Материал</p>
                             <img
-                              src={getUploadUrl(selectedOrder.material_photo)}
+                              src={getUploadUrl(selectedOrder.material_photo_variants?.thumb || selectedOrder.material_photo)}
                               alt="Материал"
                               className="w-full h-32 object-cover rounded"
                               onError={(e) => {
@@ -734,7 +887,11 @@ export default function DashboardPage() {
                                 const target = e.target as HTMLImageElement;
                                 const baseUrl = process.env.NEXT_PUBLIC_API_SERVER_URL || 'http://localhost:8000';
                                 const fallbackUrl = `${baseUrl}/uploads/${selectedOrder.material_photo}`;
-                                if (target.src !== fallbackUrl) {
+                                const originalUrl = getUploadUrl(selectedOrder.material_photo!);
+                                // Для старых фото миниатюры может не быть - пробуем оригинал
+                                if (target.src !== originalUrl && target.src !== fallbackUrl) {
+                                  target.src = originalUrl;
+                                } else if (target.src !== fallbackUrl) {
                                   target.src = fallbackUrl;
                                 }
                               }}
@@ -745,7 +902,7 @@ export default function DashboardPage() {
                           <div>
                             <p className="text-sm font-medium">Мебель</p>
                             <img
-                              src={getUploadUrl(selectedOrder.furniture_photo)}
+                              src={getUploadUrl(selectedOrder.furniture_photo_variants?.thumb || selectedOrder.furniture_photo)}
                               alt="Мебель"
                               className="w-full h-32 object-cover rounded"
                               onError={(e) => {
@@ -753,7 +910,11 @@ export default function DashboardPage() {
                                 const target = e.target as HTMLImageElement;
                                 const baseUrl = process.env.NEXT_PUBLIC_API_SERVER_URL || 'http://localhost:8000';
                                 const fallbackUrl = `${baseUrl}/uploads/${selectedOrder.furniture_photo}`;
-                                if (target.src !== fallbackUrl) {
+                                const originalUrl = getUploadUrl(selectedOrder.furniture_photo!);
+                                // Для старых фото миниатюры может не быть - пробуем оригинал
+                                if (target.src !== originalUrl && target.src !== fallbackUrl) {
+                                  target.src = originalUrl;
+                                } else if (target.src !== fallbackUrl) {
                                   target.src = fallbackUrl;
                                 }
                               }}
@@ -68,6 +68,12 @@ export interface User {
   role: 'admin' | 'logist' | 'work';
 }
 
+// Уменьшенные копии фото (WebP без EXIF), генерируются на сервере после загрузки
+export interface PhotoVariants {
+  thumb: string;
+  preview: string;
+}
+
 export interface Order {
   id: number;
   order_number?: number;
@@ -80,6 +86,8 @@ export interface Order {
   price?: number;
   material_photo?: string;
   furniture_photo?: string;
+  material_photo_variants?: PhotoVariants | null;
+  furniture_photo_variants?: PhotoVariants | null;
   status: 'draft' | 'pending_confirmation' | 'confirmed' | 'in_progress' | 'ready' | 'delivered';
   created_at: string;
   updated_at: string;
@@ -92,6 +100,40 @@ export interface OrderHistory {
   field_changes?: Record<string, any>;
 }
 
+// Событие живой ленты: заказ (в проекции текущей роли), удаление из списка или запрос перечитать список
+export type OrderEvent =
+  | { type: 'order'; action: string; order: Order; id: number }
+  | { type: 'removed'; action: string; order_id: number; id: number }
+  | { type: 'resync'; id?: number }
+  // Оповещение планировщика сроков: срок скоро или уже прошел
+  | { type: 'deadline'; alert: 'due_soon' | 'overdue'; order_id: number; deadline: string; status: Order['status']; id: number };
+
+// Клиент с прошлыми заказами (поиск по телефону при создании заказа)
+export interface CustomerMatch {
+  phone_key: string;
+  customer_phone: string;
+  customer_name: string;
+  customer_address: string;
+  order_count: number;
+  last_order_at: string;
+  orders: Pick<Order, 'id' | 'order_number' | 'status' | 'price' | 'deadline' | 'created_at'>[];
+}
+
+export interface OrderListParams {
+  status_filter?: string[];
+  sort?: 'created_at' | 'deadline';
+  order?: 'asc' | 'desc';
+  created_from?: string;
+  created_to?: string;
+  deadline_from?: string;
+  deadline_to?: string;
+  limit?: number;
+  cursor?: string;
+  include_total?: boolean;
+  // Поля ответа; без него длинные тексты (адрес, примечания, требования) не отдаются
+  fields?: string[];
+}
+
 // Auth API
 export const authAPI = {
   login: (username: string, password: string) => {
@@ -109,7 +151,18 @@ export const authAPI = {
 
 // Orders API
 export const ordersAPI = {
-  getOrders: (status?: string) => api.get('/orders/', { params: { status_filter: status } }),
+  // Без limit сервер отдает первую страницу; limit: 0 - весь список одним ответом
+  getOrders: (status?: string, limit?: number) => api.get('/orders/', { params: { status_filter: status, limit } }),
+  // Следующая страница приходит в заголовке X-Next-Cursor, общее количество - в X-Total-Count
+  getOrdersPage: (params: OrderListParams) => api.get('/orders/', { params, paramsSerializer: { indexes: null } }),
+  // Дельта-синхронизация: { orders, deleted, next_cursor, has_more }
+  getOrderChanges: (since?: string, limit?: number) => api.get('/orders/changes', { params: { since, limit } }),
+  // Полнотекстовый поиск: каждое слово - префикс, лучшие совпадения первыми
+  searchOrders: (q: string, limit?: number) => api.get('/orders/search', { params: { q, limit } }),
+  // Клиенты, чей телефон начинается с phone (в любом формате записи)
+  findCustomers: (phone: string, limit?: number) => api.get<CustomerMatch[]>('/orders/customers', { params: { phone, limit } }),
+  // Последние оповещения о сроках (пропущенные, пока не было соединения с лентой)
+  getDeadlineAlerts: () => api.get('/orders/deadline-alerts'),
   getOrder: (id: number) => api.get(`/orders/${id}`),
   createOrder: (data: FormData) => api.post('/orders/', data),
   updateOrder: (id: number, data: FormData) => api.put(`/orders/${id}`, data),
@@ -120,4 +173,59 @@ export const ordersAPI = {
   completeOrder: (id: number) => api.post(`/orders/${id}/complete`),
   markDelivered: (id: number) => api.post(`/orders/${id}/ready`),
   getOrderHistory: (id: number) => api.get(`/orders/${id}/history`),
-};
\ No newline at end of file
+  // Выгрузка в CSV/NDJSON (файл формируется потоком на сервере)
+  exportOrders: (format: 'csv' | 'ndjson', params?: Omit<OrderListParams, 'sort' | 'order' | 'limit' | 'cursor' | 'include_total'>) =>
+    api.get('/orders/export', { params: { ...params, format }, responseType: 'blob', paramsSerializer: { indexes: null } }),
+  exportOrderHistory: (format: 'csv' | 'ndjson', params?: { status_filter?: string[]; date_from?: string; date_to?: string }) =>
+    api.get('/orders/export/history', { params: { ...params, format }, responseType: 'blob', paramsSerializer: { indexes: null } }),
+  // Пакетный переход статусов: { action, succeeded, failed, results: [{ id, success, detail? }] }
+  bulkTransition: (action: 'submit' | 'confirm' | 'complete' | 'deliver', orderIds: number[]) => {
+    const data = new FormData();
+    data.append('action', action);
+    orderIds.forEach((id) => data.append('order_ids', String(id)));
+    return api.post('/orders/bulk', data);
+  },
+};
+
+// Live order feed (Server-Sent Events). EventSource не передает заголовки, поэтому токен идет в query.
+export const subscribeOrderEvents = (
+  onEvent: (event: OrderEvent) => void,
+  onStatusChange?: (connected: boolean) => void,
+): (() => void) => {
+  // Поток открывается по короткоживущему токену подписки, а не по основному JWT:
+  // токен попадает в URL. Просроченный токен не переиспользуется - при обрыве
+  // соединения запрашиваем новый и переподключаемся.
+  let source: EventSource | null = null;
+  let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+  let closed = false;
+  const handle = (e: MessageEvent) => onEvent(JSON.parse(e.data));
+
+  const connect = async () => {
+    try {
+      const { data } = await api.post('/orders/events/token');
+      if (closed) return;
+      source = new EventSource(`${API_BASE_URL}/orders/events?token=${encodeURIComponent(data.token)}`);
+    } catch {
+      onStatusChange?.(false);
+      if (!closed) reconnectTimer = setTimeout(connect, 5000);
+      return;
+    }
+    source.addEventListener('order', handle as EventListener);
+    source.addEventListener('removed', handle as EventListener);
+    source.addEventListener('resync', handle as EventListener);
+    source.addEventListener('deadline', handle as EventListener);
+    source.onopen = () => onStatusChange?.(true);
+    source.onerror = () => {
+      onStatusChange?.(false);
+      source?.close();
+      if (!closed) reconnectTimer = setTimeout(connect, 3000);
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    if (reconnectTimer) clearTimeout(reconnectTimer);
+    source?.close();
+  };
+};